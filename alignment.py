@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from scipy.fft import rfft, irfft, next_fast_len
+
+
+def parabolic_peak(y, index):
+    """Refines peak positions to sub-sample precision by fitting a parabola to the peak sample and its neighbours.
+
+    Args:
+        y: Numpy array with samples on the last axis
+        index: Integer peak indices, shape of `y` without the last axis
+
+    Returns:
+        Peak positions as floats, peaks at the first or the last sample are not refined
+    """
+    index = np.asarray(index)
+    n = y.shape[-1]
+    i = np.clip(index, 1, max(n - 2, 1))[..., np.newaxis]
+    a, b, c = [np.take_along_axis(y, np.clip(i + k, 0, n - 1), axis=-1)[..., 0] for k in [-1, 0, 1]]
+    denominator = a - 2 * b + c
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = np.where(denominator != 0, 0.5 * (a - c) / denominator, 0.0)
+    offset = np.where((index >= 1) & (index <= n - 2), np.clip(offset, -0.5, 0.5), 0.0)
+    return index + offset
+
+
+def cross_correlation_lags(x, y, weighting=None, interpolate=True):
+    """Lags between signals by cross-correlation, all rows are correlated with one batched FFT.
+
+    Lags follow the convention of `scipy.signal.correlate(x, y, mode='full')`, positive lag means that x is delayed
+    relative to y.
+
+    Args:
+        x: Numpy array with signals on the last axis
+        y: Numpy array with the same shape as x
+        weighting: None for plain cross-correlation or "phat" for generalized cross-correlation with phase transform
+                   (GCC-PHAT) which whitens the spectra and gives a sharper peak for reverberant signals
+        interpolate: Refine lags to sub-sample precision with parabolic interpolation?
+
+    Returns:
+        Lags in samples as a Numpy array with the shape of x without the last axis
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    if x.shape != y.shape:
+        raise ValueError('Signals must have the same shape.')
+    n = x.shape[-1]
+    n_fft = next_fast_len(2 * n - 1, real=True)
+    spectra = rfft(np.stack([x, y]), n_fft, axis=-1)
+    cross = spectra[0] * np.conj(spectra[1])
+    if weighting == 'phat':
+        magnitude = np.abs(cross)
+        cross /= np.where(magnitude > 0, magnitude, 1.0)
+    elif weighting is not None:
+        raise ValueError(f'Unknown cross-correlation weighting "{weighting}".')
+    corr = irfft(cross, n_fft, axis=-1)
+    # Negative lags are at the end of the circular correlation, order lags from -(n - 1) to n - 1
+    corr = np.concatenate([corr[..., n_fft - n + 1:], corr[..., :n]], axis=-1)
+    index = np.argmax(corr, axis=-1)
+    position = parabolic_peak(corr, index) if interpolate else index
+    return position - (n - 1)
+
+
+class LagTable:
+    """Time offsets between the impulse responses of a HRIR for the alignment methods.
+
+    Cross-correlation lags of all the requested speaker-side pairs are computed at once from the beginning segments of
+    the impulse responses. Peak positions of the requested speaker-sides are refined to sub-sample precision. Table is
+    a snapshot, it must be created again after the impulse responses have been shifted.
+    """
+
+    def __init__(self, hrir, pairs=None, channels=None, segment_ms=30, weighting=None, interpolate=True):
+        """
+        Args:
+            hrir: HRIR instance
+            pairs: List of ((speaker, side), (speaker, side)) pairs for cross-correlation lags
+            channels: List of (speaker, side) tuples for peak positions
+            segment_ms: Length of the beginning segment used for cross-correlation in milliseconds
+            weighting: Cross-correlation weighting, see `cross_correlation_lags()`
+            interpolate: Refine lags and peaks to sub-sample precision?
+        """
+        self.lags = dict()
+        self.peaks = dict()
+
+        pairs = list(pairs or [])
+        if pairs:
+            seg_len = int(hrir.fs * segment_ms / 1000)
+            x = np.vstack([hrir.irs[speaker][side].data[:seg_len] for (speaker, side), _ in pairs])
+            y = np.vstack([hrir.irs[speaker][side].data[:seg_len] for _, (speaker, side) in pairs])
+            for pair, lag in zip(pairs, cross_correlation_lags(x, y, weighting=weighting, interpolate=interpolate)):
+                self.lags[pair] = float(lag)
+
+        channels = list(channels or [])
+        peak_indices = hrir.peak_indices() if channels else dict()
+        for speaker, side in channels:
+            ir = hrir.irs[speaker][side]
+            index = peak_indices[(speaker, side)]
+            if interpolate and len(ir.data):
+                # Fit the parabola to the peak with positive polarity
+                self.peaks[(speaker, side)] = float(parabolic_peak(ir.data * np.sign(ir.data[index] or 1.0), index))
+            else:
+                self.peaks[(speaker, side)] = float(index)
+
+    def lag(self, a, b):
+        """Delay of speaker-side a relative to speaker-side b in samples from cross-correlation."""
+        if (a, b) in self.lags:
+            return self.lags[(a, b)]
+        return -self.lags[(b, a)]
+
+    def peak(self, speaker, side):
+        """Peak position of speaker-side in samples."""
+        return self.peaks[(speaker, side)]
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import warnings
+from contextlib import contextmanager
+
+MANIFEST_FILE_NAME = '.artifacts.json'
+MANIFEST_VERSION = 1
+
+# Permissions of written files follow the process umask like regular open() would, temporary files don't
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# Manifests which are currently open, output files under their directories are tracked by them
+_active_manifests = []
+
+# Lists collecting the paths of output files while recording, see `record_artifacts()`
+_recorders = []
+
+
+class ArtifactManifest:
+    """Manifest of content hashes of the output files written to a measurement directory.
+
+    Manifest is stored as JSON in the directory. Files are written atomically through a temporary file which is renamed
+    over the target. Writing is skipped when the content hash matches the manifest and the file on disk still has the
+    size and modification time which were recorded when it was written.
+    """
+
+    def __init__(self, dir_path):
+        """
+        Args:
+            dir_path: Path to the directory, all tracked files must be inside it
+        """
+        self.dir_path = os.path.abspath(dir_path)
+        self.file_path = os.path.join(self.dir_path, MANIFEST_FILE_NAME)
+        self.entries = dict()
+        self.n_written = 0
+        self.n_skipped = 0
+        self._lock = threading.Lock()
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == MANIFEST_VERSION:
+                self.entries = manifest['files']
+        except (OSError, ValueError, KeyError):
+            # Missing or broken manifest, every file will be written
+            pass
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        """Starts tracking writes done with `write_artifact()` to files in the directory."""
+        # Manifest of a previous run which didn't finish is replaced
+        for manifest in [m for m in _active_manifests if m.dir_path == self.dir_path]:
+            _active_manifests.remove(manifest)
+        _active_manifests.append(self)
+        return self
+
+    def close(self):
+        """Stops tracking and saves the manifest."""
+        if self in _active_manifests:
+            _active_manifests.remove(self)
+        self.save()
+
+    def covers(self, file_path):
+        """Checks if the file is inside the manifest's directory."""
+        try:
+            return os.path.commonpath([self.dir_path, os.path.abspath(file_path)]) == self.dir_path
+        except ValueError:
+            # Different drives
+            return False
+
+    def write(self, file_path, data):
+        """Writes file unless it already has the same content.
+
+        Args:
+            file_path: Path to the file
+            data: File content as bytes
+
+        Returns:
+            True if the file was written, False if it was skipped
+        """
+        name = os.path.relpath(os.path.abspath(file_path), self.dir_path).replace(os.sep, '/')
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            entry = self.entries.get(name)
+        if entry is not None and entry['sha256'] == digest:
+            try:
+                stat = os.stat(file_path)
+                if stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime_ns']:
+                    with self._lock:
+                        self.n_skipped += 1
+                    return False
+            except OSError:
+                pass
+        atomic_write(file_path, data)
+        stat = os.stat(file_path)
+        with self._lock:
+            self.entries[name] = {'sha256': digest, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+            self.n_written += 1
+        return True
+
+    def save(self):
+        """Writes the manifest file atomically."""
+        with self._lock:
+            manifest = {'version': MANIFEST_VERSION, 'files': dict(sorted(self.entries.items()))}
+        try:
+            atomic_write(self.file_path, json.dumps(manifest, indent=2).encode('utf-8'))
+        except OSError as err:
+            warnings.warn(f'Could not write artifact manifest "{self.file_path}": {err}')
+
+
+def atomic_write(file_path, data):
+    """Writes bytes to a file through a temporary file in the same directory which is then renamed over the target.
+
+    Args:
+        file_path: Path to the file
+        data: File content as bytes
+
+    Returns:
+        None
+    """
+    dir_path = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(file_path)}-', suffix='.tmp', dir=dir_path)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_artifact(file_path, data):
+    """Writes an output file atomically, through the innermost open manifest which covers the file if any.
+
+    Args:
+        file_path: Path to the file
+        data: File content as bytes
+
+    Returns:
+        True if the file was written, False if it was skipped because the content hasn't changed
+    """
+    for paths in _recorders:
+        paths.append(os.path.abspath(file_path))
+    for manifest in reversed(_active_manifests):
+        if manifest.covers(file_path):
+            return manifest.write(file_path, data)
+    atomic_write(file_path, data)
+    return True
+
+
+@contextmanager
+def record_artifacts():
+    """Records the output files written with `write_artifact()` while the context is active.
+
+    Files which were skipped because their content hasn't changed are recorded too.
+
+    Yields:
+        List of absolute file paths which is filled in as the files are written
+    """
+    paths = []
+    _recorders.append(paths)
+    try:
+        yield paths
+    finally:
+        _recorders.remove(paths)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import glob
+import time
+import traceback
+import multiprocessing
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor
+from tabulate import tabulate
+from artifacts import write_artifact
+from estimator_cache import EstimatorCache
+from impulse_response_estimator import ImpulseResponseEstimator
+
+# Environment variables which limit the thread pools of the BLAS and FFT libraries numpy and scipy can be linked with
+THREAD_ENV_VARS = [
+    'OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS'
+]
+
+LOG_FILE_NAME = 'impulcifer.log'
+
+
+def find_directories(patterns):
+    """Expands directory paths and glob patterns.
+
+    Args:
+        patterns: List of directory paths or glob patterns
+
+    Returns:
+        List of absolute directory paths without duplicates. Paths which don't match anything are kept as is so that
+        they show up as failed in the summary.
+    """
+    dir_paths = []
+    for pattern in patterns:
+        matches = sorted(path for path in glob.glob(pattern) if os.path.isdir(path))
+        for dir_path in matches or [pattern]:
+            dir_path = os.path.abspath(dir_path)
+            if dir_path not in dir_paths:
+                dir_paths.append(dir_path)
+    return dir_paths
+
+
+def test_signal_path(dir_path, test_signal=None):
+    """Finds the test signal file used for a measurement directory, see `open_impulse_response_estimator()`."""
+    if test_signal is not None:
+        return test_signal
+    for file_name in ['test.pkl', 'test.wav']:
+        if os.path.isfile(os.path.join(dir_path, file_name)):
+            return os.path.join(dir_path, file_name)
+    return None
+
+
+def prepare_estimators(dir_paths, test_signal=None, estimator_cache_dir=None):
+    """Creates the estimator cache entries once for every distinct test signal before the directories are processed.
+
+    Directories which use test signals with the same signature share the cache entry so the test signal and inverse
+    filter are generated only once instead of by every worker.
+
+    Args:
+        dir_paths: List of measurement directory paths
+        test_signal: Test signal file path used for all directories or None to use the one in each directory
+        estimator_cache_dir: Path to the estimator cache directory or None for the default
+
+    Returns:
+        Number of distinct test signals
+    """
+    cache = EstimatorCache(estimator_cache_dir)
+    prepared = set()
+    for dir_path in dir_paths:
+        file_path = test_signal_path(dir_path, test_signal)
+        if file_path is None or not file_path.lower().endswith('.wav'):
+            # Pickled estimators are not cached
+            continue
+        try:
+            signature = ImpulseResponseEstimator.read_signature(file_path)
+            key = json.dumps(signature, sort_keys=True) if signature is not None else os.path.abspath(file_path)
+            if key in prepared:
+                continue
+            ImpulseResponseEstimator.from_wav(file_path, cache=cache)
+            prepared.add(key)
+        except Exception:
+            # Failure is reported when the directory is processed
+            continue
+    return len(prepared)
+
+
+def process_directory(dir_path, **kwargs):
+    """Processes one measurement directory in a worker process.
+
+    Output of the processing is written to a log file in the directory. Exceptions are caught so that a failing
+    directory doesn't stop the batch.
+
+    Args:
+        dir_path: Path to measurement directory
+        **kwargs: Keyword arguments for `impulcifer.main()`
+
+    Returns:
+        Dict with "dir_path", "status", "time" in seconds and "error" message
+    """
+    # Imported here to avoid circular import when impulcifer.py is run as a script
+    from impulcifer import main
+
+    t = time.perf_counter()
+    result = {'dir_path': dir_path, 'status': 'ok', 'error': ''}
+    log = open(os.path.join(dir_path, LOG_FILE_NAME), 'w', encoding='utf-8') if os.path.isdir(dir_path) else None
+    try:
+        with redirect_stdout(log or sys.stdout), redirect_stderr(log or sys.stderr):
+            try:
+                main(dir_path=dir_path, **kwargs)
+            except Exception as err:
+                traceback.print_exc()
+                result['status'] = 'failed'
+                result['error'] = f'{type(err).__name__}: {err}'
+    finally:
+        if log is not None:
+            log.close()
+    result['time'] = time.perf_counter() - t
+    return result
+
+
+def run_batch(patterns, workers=1, summary_path=None, **kwargs):
+    """Processes many measurement directories in a process pool.
+
+    Every worker process is limited to a single BLAS and FFT thread and reads and writes files sequentially so that the
+    workers scale across cores without oversubscribing them.
+
+    Args:
+        patterns: List of measurement directory paths or glob patterns
+        workers: Number of directories processed in parallel
+        summary_path: Path to Markdown file for the summary table, table is only printed when None
+        **kwargs: Keyword arguments for `impulcifer.main()`, same for all directories
+
+    Returns:
+        List of result dicts in the order of the directories, see `process_directory()`
+    """
+    if workers is None or workers < 1:
+        raise ValueError('Number of workers must be a positive integer.')
+    dir_paths = find_directories(patterns)
+    if not dir_paths:
+        raise ValueError('No measurement directories given.')
+    kwargs['workers'] = 1
+
+    print(f'Preparing estimators for {len(dir_paths)} directories...')
+    prepare_estimators(dir_paths, test_signal=kwargs.get('test_signal'),
+                       estimator_cache_dir=kwargs.get('estimator_cache_dir'))
+
+    print(f'Processing {len(dir_paths)} directories with {workers} workers...')
+    # Spawned workers import numpy fresh and pick up the thread limits from the environment
+    environ = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+    os.environ.update({name: '1' for name in THREAD_ENV_VARS})
+    results = []
+    try:
+        with ProcessPoolExecutor(
+                max_workers=min(workers, len(dir_paths)), mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [executor.submit(process_directory, dir_path, **kwargs) for dir_path in dir_paths]
+            for dir_path, future in zip(dir_paths, futures):
+                try:
+                    result = future.result()
+                except Exception as err:
+                    # Worker process died
+                    result = {'dir_path': dir_path, 'status': 'failed', 'time': None,
+                              'error': f'{type(err).__name__}: {err}'}
+                print(f'{result["status"]}: {dir_path}')
+                results.append(result)
+    finally:
+        for name, value in environ.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    summary = batch_summary(results)
+    print(summary)
+    if summary_path is not None:
+        write_artifact(summary_path, (summary + '\n').encode('utf-8'))
+    return results
+
+
+def batch_summary(results):
+    """Formats batch results as a Markdown table.
+
+    Args:
+        results: List of result dicts, see `process_directory()`
+
+    Returns:
+        Summary string
+    """
+    table = [[
+        result['dir_path'],
+        result['status'],
+        f'{result["time"]:.1f} s' if result['time'] is not None else '-',
+        result['error']
+    ] for result in results]
+    n_failed = sum(result['status'] != 'ok' for result in results)
+    total = sum(result['time'] for result in results if result['time'] is not None)
+    return '\n\n'.join([
+        tabulate(table, headers=['Directory', 'Status', 'Time', 'Error'], tablefmt='github'),
+        f'{len(results) - n_failed} succeeded, {n_failed} failed, {total:.1f} s of processing time.'
+    ])
@@ -7,8 +7,22 @@ SPEAKER_NAMES = ['FL', 'FR', 'FC', 'BL', 'BR', 'SL', 'SR', 'WL', 'WR', 'TFL', 'T
 SPEAKER_PATTERN = f'({"|".join(SPEAKER_NAMES + ["X"])})'
 SPEAKER_LIST_PATTERN = r'{speaker_pattern}+(,{speaker_pattern})*'.format(speaker_pattern=SPEAKER_PATTERN)
 
+# Speaker order of the tracks in sweep sequence files for each supported track configuration, follows the WAV channel
+# order
+SEQUENCE_TRACK_LAYOUTS = {
+    'mono': ['FL'],
+    'stereo': ['FL', 'FR'],
+    '5.1': ['FL', 'FR', 'FC', 'LFE', 'BL', 'BR'],
+    '7.1': ['FL', 'FR', 'FC', 'LFE', 'BL', 'BR', 'SL', 'SR'],
+    '7.1.4': ['FL', 'FR', 'FC', 'LFE', 'BL', 'BR', 'SL', 'SR', 'TFL', 'TFR', 'TBL', 'TBR'],
+    '9.1.6': ['FL', 'FR', 'FC', 'LFE', 'BL', 'BR', 'SL', 'SR', 'WL', 'WR', 'TFL', 'TFR', 'TSL', 'TSR', 'TBL', 'TBR'],
+}
+
 SPEAKER_DELAYS = { _speaker: 0 for _speaker in SPEAKER_NAMES }
 
+# Ear sides in the order of the second axis of consolidated HRIR arrays
+SIDES = ['left', 'right']
+
 # Each channel, left and right
 IR_ORDER = []
 # SPL change relative to middle of the head - disable
@@ -36,3 +50,5 @@ HEXADECAGONAL_TRACK_ORDER = ['FL-left', 'FL-right', 'FR-left', 'FR-right', 'FC-l
                              'SR-left', 'SR-right', 'WL-left', 'WL-right', 'WR-left', 'WR-right', 'TFL-left', 'TFL-right',
                              'TFR-left', 'TFR-right', 'TSL-left', 'TSL-right', 'TSR-left', 'TSR-right',
                              'TBL-left', 'TBL-right', 'TBR-left', 'TBR-right']
+
+JAMESDSP_TRACK_ORDER = ['FL-left', 'FL-right', 'FR-left', 'FR-right']
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+EPSILON = 1e-20
+
+
+def decay_params(data, fs, peak_indices, lengths=None):
+    """Determines decay parameters of many impulse responses at once with Lundeby method
+
+    https://www.ingentaconnect.com/content/dav/aaua/1995/00000081/00000004/art00009
+    http://users.spa.aalto.fi/mak/PUB/AES_Modal9992.pdf
+
+    All channels are processed together. Time window averages of all channels are summed with a single `reduceat()`
+    call and the decay slopes are fitted with closed form least squares so that the only per channel work is the
+    bookkeeping of which channels are still iterating.
+
+    Args:
+        data: Impulse responses as Numpy array with shape (n_channels, n_samples)
+        fs: Sampling rate
+        peak_indices: Peak index of each channel, see `ImpulseResponse.peak_index()`
+        lengths: Number of valid samples in each channel when the channels have been zero padded to a common length,
+                 all samples are valid when None
+
+    Returns:
+        - peak_inds: Fundamental starting indices
+        - knee_point_inds: Indices where decay reaches noise floor
+        - noise_floors: Noise floors in dBFS, also peak to noise ratios
+        - window_sizes: Averaging window sizes as determined by Lundeby method
+    """
+    data = np.atleast_2d(data)
+    n_channels, n_samples = data.shape
+    lengths = np.full(n_channels, n_samples, dtype=int) if lengths is None else np.asarray(lengths, dtype=int)
+    if np.any(lengths > n_samples):
+        raise ValueError('Channel lengths cannot exceed the number of samples.')
+
+    peak_inds = np.zeros(n_channels, dtype=int)
+    knee_point_inds = lengths.copy()
+    noise_floors = np.full(n_channels, -200.0)
+    window_sizes = np.maximum(lengths, 1)
+
+    # Too short for meaningful analysis, these keep the fallback values
+    active = lengths >= 10
+    if not np.any(active):
+        return peak_inds, knee_point_inds, noise_floors, window_sizes
+
+    peaks = np.clip(np.asarray(peak_indices, dtype=int), 0, np.maximum(lengths - 1, 0))
+    peak_inds[active] = peaks[active]
+
+    # 1. The squared impulse response is averaged into local time intervals in the range of 10–50 ms
+    # From peak to 2 seconds after the peak
+    m = np.where(active, np.minimum(peaks + int(2 * fs), lengths) - peaks, 1)
+    # Regression needs double precision regardless of the data type of the impulse response
+    # Extra zero sample at the end of each channel lets the summed ranges end at the last sample
+    squared = np.zeros((n_channels, n_samples + 1))
+    np.square(data, out=squared[:, :-1], dtype=np.float64)
+    # Squared impulse responses are normalized to the maximum of the segment after the peak
+    max_squared = _Segments(squared, peaks, np.ones(n_channels)).reduce(
+        np.maximum, np.stack([np.zeros(n_channels, dtype=int), m], axis=1))[:, 0]
+    scale = np.where(max_squared < EPSILON ** 2, 1.0, 1 / np.maximum(max_squared, EPSILON ** 2))
+    segments = _Segments(squared, peaks, scale)
+    # Time stamps starting from peak are `np.linspace(0, t_end, m)`
+    t_end = np.where(m > 1, m / fs, 0.0)
+
+    wd = 0.03  # Window duration, let's start with 30 ms
+    n = (m / fs / wd).astype(int)  # Number of time windows
+
+    # Signal is too short for even one time window, noise floor is the average of the whole segment
+    short = active & (n == 0)
+    noise_floors[short] = _db(_segment_average(segments, 0, m))[short]
+    knee_point_inds[short] = peaks[short] + m[short]
+    window_sizes[short] = m[short]
+    active &= ~short
+
+    w = np.maximum((m / np.maximum(n, 1)).astype(int), 1)  # Width of a single time window
+    windows, valid = _window_averages(segments, n * active, w)
+    t_windows = np.arange(windows.shape[1]) * wd + wd / 2  # Timestamps for the window centers
+
+    # 2. A first estimate for the background noise level is determined from the last 10 %
+    tail_start = (m * 0.9).astype(int)
+    noise_floor = _db(_segment_average(segments, tail_start, m))
+
+    # 3. The decay slope is estimated from the windows above noise floor + 10 dB
+    found, first = _first(valid & (windows <= (noise_floor + 10.0)[:, np.newaxis]))
+    regression_end = np.where(found & (first > 0), first, n)
+    regression_end = np.where(regression_end < 2, n, regression_end)
+    slope, intercept = _linear_regression(
+        t_windows, windows, valid & (np.arange(windows.shape[1]) < regression_end[:, np.newaxis]))
+
+    # Not enough windows for regression or the slope is unusable, decay reaches noise floor at the end of the segment
+    unusable = active & ((regression_end < 2) | np.isnan(slope) | (np.abs(slope) < EPSILON))
+    knee_point_inds[unusable] = peaks[unusable] + m[unusable]
+    noise_floors[unusable] = noise_floor[unusable]
+    window_sizes[unusable] = w[unusable]
+    active &= ~unusable
+    if not np.any(active):
+        return peak_inds, knee_point_inds, noise_floors, window_sizes
+    slope = np.where(active, slope, -1.0)
+    intercept = np.where(active, intercept, 0.0)
+
+    # 4. A preliminary knee point is determined
+    knee_point_time = np.clip((noise_floor - intercept) / slope, 0.0, t_end)
+
+    # 5. A new time interval length is calculated, 3 windows per 10 dB of decay
+    wd = np.where(active, 10 / (np.abs(slope) * 3), 1.0)
+    # More windows than samples would leave windows without samples
+    n = np.maximum(np.minimum(m / fs / wd, m).astype(int), 1)
+    w = np.maximum((m / n).astype(int), 1)
+    n = np.minimum(n, m // w)
+
+    # 6. The squared impulse is averaged into the new local time intervals
+    windows, valid = _window_averages(segments, n * active, w)
+    t_windows = np.arange(windows.shape[1]) * wd[:, np.newaxis] + wd[:, np.newaxis] / 2
+    last = np.maximum(n - 1, 0)
+    t_last = np.take_along_axis(t_windows, last[:, np.newaxis], axis=1)[:, 0]
+
+    found, knee_idx = _first(valid & (t_windows >= knee_point_time[:, np.newaxis]))
+    # Knee point time is beyond the new windows, use the last window
+    knee_point_time = np.where(found, knee_point_time, t_last)
+    knee_idx = np.where(found, knee_idx, last)
+    knee_val = np.take_along_axis(windows, knee_idx[:, np.newaxis], axis=1)[:, 0]
+
+    # Steps 7–9 are iterated
+    noise_floor_iter = noise_floor.copy()
+    iterating = active.copy()
+    for _ in range(5):
+        # 7. Background noise level is re-estimated from where decay is 5 dB below current knee point value
+        found, noise_start_idx = _first(valid & (windows <= (knee_val - 5)[:, np.newaxis]))
+        noise_start_time = np.maximum(
+            np.take_along_axis(t_windows, noise_start_idx[:, np.newaxis], axis=1)[:, 0], 0.1 * t_end)
+        iterating &= found & (noise_start_time <= t_last)
+        # Noise floor estimation ends one full decay time after its start, or at the end of signal
+        noise_end_time = np.minimum(noise_start_time + knee_point_time, t_end)
+        noise_start = _nearest_sample(noise_start_time, m, fs)
+        noise_end = _nearest_sample(noise_end_time, m, fs)
+        iterating &= noise_start < noise_end
+        noise_floor_iter = np.where(
+            iterating, _db(_segment_average(segments, noise_start, noise_end)), noise_floor_iter)
+
+        # 8. Late decay slope is estimated from 8 dB above the noise floor for 20 dB dynamic range
+        found_end, late_end = _first(valid & (windows <= (noise_floor_iter + 8.0)[:, np.newaxis]))
+        found_start, late_start = _first(valid & (windows <= (noise_floor_iter + 28.0)[:, np.newaxis]))
+        late_end -= 1
+        late_start = np.maximum(late_start - 1, 0)
+        iterating &= found_end & found_start & (late_end > late_start + 1)
+        indices = np.arange(windows.shape[1])
+        late_slope, late_intercept = _linear_regression(
+            t_windows, windows, (indices >= late_start[:, np.newaxis]) & (indices < late_end[:, np.newaxis]))
+        iterating &= ~np.isnan(late_slope) & (np.abs(late_slope) >= EPSILON)
+        if not np.any(iterating):
+            break
+
+        # 9. New knee point is found
+        with np.errstate(divide='ignore', invalid='ignore'):
+            new_knee_time = np.clip((noise_floor_iter - late_intercept) / late_slope, t_windows[:, 0], t_last)
+        found, new_knee_idx = _first(valid & (t_windows >= new_knee_time[:, np.newaxis]))
+        new_knee_idx = np.where(found, new_knee_idx, last)
+        converged = iterating & (new_knee_idx == knee_idx)
+        knee_idx = np.where(iterating, new_knee_idx, knee_idx)
+        knee_point_time = np.where(
+            iterating, np.take_along_axis(t_windows, knee_idx[:, np.newaxis], axis=1)[:, 0], knee_point_time)
+        knee_val = np.where(
+            iterating, np.take_along_axis(windows, knee_idx[:, np.newaxis], axis=1)[:, 0], knee_val)
+        iterating &= ~converged
+        if not np.any(iterating):
+            break
+
+    knee_point_inds[active] = (peaks + _nearest_sample(knee_point_time, m, fs))[active]
+    noise_floors[active] = noise_floor_iter[active]
+    window_sizes[active] = w[active]
+    return peak_inds, knee_point_inds, noise_floors, window_sizes
+
+
+def _db(x):
+    """Power to decibels with a floor to avoid -inf."""
+    return 10 * np.log10(np.maximum(x, EPSILON))
+
+
+class _Segments:
+    """Squared impulse responses with reductions over sample ranges starting from the peak of each channel."""
+
+    def __init__(self, squared, peaks, scale):
+        """
+        Args:
+            squared: Squared impulse responses with shape (n_channels, n_samples + 1), last sample must be zero
+            peaks: Peak index of each channel, ranges are relative to these
+            scale: Scale of the sums for each channel
+        """
+        self.squared = squared
+        self.peaks = peaks
+        self.scale = scale
+
+    def reduce(self, ufunc, boundaries):
+        """Reduces the ranges between consecutive boundaries of each channel with a single `reduceat()` call.
+
+        Args:
+            ufunc: Numpy ufunc, e.g. `np.add` or `np.maximum`
+            boundaries: Range boundaries relative to the peaks with shape (n_channels, k + 1), non-decreasing on rows
+
+        Returns:
+            Reductions with shape (n_channels, k), zero for empty ranges
+        """
+        n_channels, width = self.squared.shape
+        indices = np.minimum(boundaries + self.peaks[:, np.newaxis], width - 1)
+        indices += np.arange(n_channels)[:, np.newaxis] * width
+        # Reduction from the last boundary of each row runs into the next row and is dropped
+        reduced = ufunc.reduceat(self.squared.ravel(), indices.ravel()).reshape(boundaries.shape)[:, :-1]
+        return np.where(np.diff(indices, axis=1) > 0, reduced, 0.0)
+
+    def sum(self, boundaries):
+        """Scaled sums over the ranges between consecutive boundaries, see `reduce()`."""
+        return self.reduce(np.add, boundaries) * self.scale[:, np.newaxis]
+
+
+def _segment_average(segments, start, end):
+    """Averages of the squared samples from start to end (exclusive) for every channel."""
+    n = len(segments.peaks)
+    boundaries = np.stack([np.broadcast_to(start, (n,)), np.broadcast_to(end, (n,))], axis=1)
+    return segments.sum(boundaries)[:, 0] / np.maximum(boundaries[:, 1] - boundaries[:, 0], 1)
+
+
+def _window_averages(segments, n, w):
+    """Splits squared impulse responses into consecutive time windows and averages each window.
+
+    Args:
+        segments: Cumulative sums of the squared impulse responses
+        n: Number of windows for each channel
+        w: Width of the windows in samples for each channel
+
+    Returns:
+        - Window averages in dB with shape (n_channels, max(n))
+        - Boolean mask of the windows which exist
+    """
+    indices = np.arange(max(int(np.max(n)), 1))
+    valid = indices < n[:, np.newaxis]
+    # Boundaries of the windows which don't exist are clamped to the last valid window
+    boundaries = np.minimum(np.arange(len(indices) + 1), n[:, np.newaxis]) * w[:, np.newaxis]
+    return _db(segments.sum(boundaries) / w[:, np.newaxis]), valid
+
+
+def _first(mask):
+    """Index of the first True value on each row and whether the row has any True values."""
+    return np.any(mask, axis=1), np.argmax(mask, axis=1)
+
+
+def _linear_regression(x, y, mask):
+    """Closed form least squares line fit over the masked values of each row.
+
+    Args:
+        x: Independent variable, broadcasts against y
+        y: Dependent variable with shape (n_channels, n)
+        mask: Boolean mask of the values included in the fit
+
+    Returns:
+        - Slopes, NaN for rows with less than two distinct x values
+        - Intercepts
+    """
+    x = np.broadcast_to(x, y.shape)
+    count = np.sum(mask, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_mean = np.sum(x * mask, axis=1) / count
+        y_mean = np.sum(y * mask, axis=1) / count
+        dx = np.where(mask, x - x_mean[:, np.newaxis], 0.0)
+        dy = np.where(mask, y - y_mean[:, np.newaxis], 0.0)
+        sxx = np.sum(dx ** 2, axis=1)
+        slope = np.where(sxx > 0, np.sum(dx * dy, axis=1) / sxx, np.nan)
+    return slope, y_mean - slope * x_mean
+
+
+def _nearest_sample(t, m, fs):
+    """Index of the sample closest to time t in `np.linspace(0, m / fs, m)` for every channel without the time stamps.
+
+    Args:
+        t: Times in seconds
+        m: Number of samples in each channel
+        fs: Sampling rate
+
+    Returns:
+        Sample indices, ties resolve to the earlier sample like `np.argmin()`
+    """
+    step = m / fs / np.maximum(m - 1, 1)
+
+    def time(k):
+        # Linspace sets the last time stamp to the end point exactly
+        return np.where(k == m - 1, m / fs, k * step)
+
+    base = np.floor(t / step).astype(int)
+    best = np.clip(base - 1, 0, np.maximum(m - 1, 0))
+    for k in [base, base + 1]:
+        k = np.clip(k, 0, np.maximum(m - 1, 0))
+        best = np.where(np.abs(time(k) - t) < np.abs(time(best) - t), k, best)
+    return np.where(m > 1, best, 0)
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import warnings
+import numpy as np
+
+# Bump this when test signal or inverse filter generation or the entry contents change so that old entries are not
+# used anymore
+CACHE_VERSION = 2
+
+
+def default_cache_dir():
+    """Default directory for the estimator cache, can be overridden with IMPULCIFER_CACHE_DIR environment variable."""
+    if os.environ.get('IMPULCIFER_CACHE_DIR'):
+        return os.path.join(os.environ['IMPULCIFER_CACHE_DIR'], 'estimators')
+    return os.path.join(os.path.expanduser('~'), '.cache', 'impulcifer', 'estimators')
+
+
+class EstimatorCache:
+    """Content addressed on-disk cache for test signals, inverse filters and streaming inverse filter spectra.
+
+    Each entry is a directory named by the hash of the generation parameters. Arrays are stored as plain .npy files
+    and loaded as read-only memory maps so that only the parts which are actually used get read from the disk.
+    Least recently used entries are evicted when the total size of the cache exceeds the size limit.
+    """
+
+    def __init__(self, dir_path=None, max_size=512 * 2**20):
+        """
+        Args:
+            dir_path: Path to cache directory. Default directory is used if not given.
+            max_size: Maximum total size of the cache in bytes
+        """
+        self.dir_path = dir_path if dir_path is not None else default_cache_dir()
+        self.max_size = max_size
+
+    @staticmethod
+    def key(**params):
+        """Creates cache key from the generation parameters.
+
+        Args:
+            **params: JSON serializable parameters which fully define the cached arrays
+
+        Returns:
+            Key as hex string
+        """
+        params = dict(params, version=CACHE_VERSION)
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.dir_path, key)
+
+    def load(self, key):
+        """Loads cache entry.
+
+        Args:
+            key: Cache key as returned by `key()`
+
+        Returns:
+            Dict with the entry metadata in "meta" and memory mapped arrays with their names as keys or None when the
+            entry doesn't exist
+        """
+        entry_path = self._entry_path(key)
+        meta_path = os.path.join(entry_path, 'meta.json')
+        if not os.path.isfile(meta_path):
+            return None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            entry = {'meta': meta}
+            for name in meta['arrays']:
+                entry[name] = np.load(os.path.join(entry_path, f'{name}.npy'), mmap_mode='r')
+            # Mark as recently used
+            os.utime(entry_path)
+        except (OSError, ValueError, KeyError):
+            # Broken entry, treat as missing
+            return None
+        return entry
+
+    def store(self, key, meta=None, **arrays):
+        """Stores arrays as a new cache entry.
+
+        Entry is written to a temporary directory first and then renamed so that concurrent readers never see
+        partially written entries.
+
+        Args:
+            key: Cache key as returned by `key()`
+            meta: JSON serializable metadata to store with the arrays
+            **arrays: Numpy arrays to store with their names as keys
+
+        Returns:
+            None
+        """
+        entry_path = self._entry_path(key)
+        if os.path.isdir(entry_path):
+            return
+        try:
+            os.makedirs(self.dir_path, exist_ok=True)
+            tmp_path = tempfile.mkdtemp(prefix=f'.{key}-', dir=self.dir_path)
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_path, f'{name}.npy'), array)
+            with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump(dict(meta or dict(), arrays=list(arrays.keys()), created=time.time()), f)
+            try:
+                os.rename(tmp_path, entry_path)
+            except OSError:
+                # Another process stored the same entry first
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        except OSError as err:
+            warnings.warn(f'Could not write estimator cache entry to "{self.dir_path}": {err}')
+            return
+        self.evict()
+
+    def load_array(self, key, name):
+        """Loads a single array stored with `store_array()`, None if it doesn't exist."""
+        file_path = os.path.join(self._entry_path(key), f'{name}.npy')
+        if not os.path.isfile(file_path):
+            return None
+        try:
+            return np.load(file_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+
+    def store_array(self, key, name, array):
+        """Adds an array to an existing cache entry. Does nothing if the entry doesn't exist."""
+        entry_path = self._entry_path(key)
+        if not os.path.isdir(entry_path):
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix=f'.{name}-', suffix='.npy', dir=entry_path)
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, os.path.join(entry_path, f'{name}.npy'))
+        except OSError as err:
+            warnings.warn(f'Could not write estimator cache entry to "{self.dir_path}": {err}')
+            return
+        self.evict()
+
+    def size(self):
+        """Total size of the cache in bytes."""
+        return sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        """Lists cache entries as (path, last use time, size) tuples."""
+        if not os.path.isdir(self.dir_path):
+            return []
+        entries = []
+        for name in os.listdir(self.dir_path):
+            entry_path = os.path.join(self.dir_path, name)
+            if name.startswith('.') or not os.path.isdir(entry_path):
+                continue
+            try:
+                size = sum(
+                    os.path.getsize(os.path.join(entry_path, file_name)) for file_name in os.listdir(entry_path))
+                entries.append((entry_path, os.path.getmtime(entry_path), size))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in the size limit."""
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        # Never evict the most recently used entry, it's the one which is being used right now
+        for entry_path, _, size in entries[:-1]:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry_path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """Removes all cache entries."""
+        for entry_path, _, _ in self._entries():
+            shutil.rmtree(entry_path, ignore_errors=True)
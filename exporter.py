@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from scipy.signal import butter, sosfilt
+from utils import write_wav
+from constants import SIDES
+
+
+class BRIRExporter:
+    """Writes the impulse responses of a HRIR into WAV files with different track layouts.
+
+    All speaker-side impulse responses are stacked into one channel matrix with a silent track as the last row. Every
+    output file is a permutation of the matrix rows so nothing needs to be copied per layout before writing. Files are
+    added with `add()` and `add_lfe()` and written in a thread pool by `write()`.
+    """
+
+    def __init__(self, hrir, bit_depth=32):
+        """
+        Args:
+            hrir: HRIR instance
+            bit_depth: Number of bits per sample in the output files. 16, 24 or 32
+        """
+        data = hrir.consolidate()
+        self.fs = hrir.fs
+        self.bit_depth = bit_depth
+        self.matrix = np.concatenate([
+            data.reshape(-1, data.shape[-1]),
+            np.zeros((1, data.shape[-1]), dtype=data.dtype)
+        ])
+        # Row of each speaker-side track, missing tracks point to the silent last row
+        self.rows = {
+            f'{speaker}-{side}': i * len(SIDES) + j for speaker, i in hrir.index.items() for j, side in enumerate(SIDES)
+        }
+        self._files = []
+
+    def tracks(self, track_order):
+        """Selects tracks from the channel matrix.
+
+        Args:
+            track_order: List of speaker-side names, tracks which don't exist are silent
+
+        Returns:
+            2-D Numpy array with tracks on rows
+        """
+        return self.matrix[[self.rows.get(ch, -1) for ch in track_order]]
+
+    def add(self, file_path, track_order, gain=0.0):
+        """Adds a file to be written.
+
+        Args:
+            file_path: Path to output WAV file
+            track_order: List of speaker-side names for the order of tracks in the file
+            gain: Gain in dB applied to the tracks of this file only
+
+        Returns:
+            None
+        """
+        self._files.append((file_path, list(track_order), gain, None))
+
+    def add_lfe(self, file_path, speaker, fc=120, gain=10.0, order=4):
+        """Adds a low-pass filtered copy of a speaker as a file to be written.
+
+        Args:
+            file_path: Path to output WAV file
+            speaker: Speaker name, left and right side impulse responses become the tracks of the file
+            fc: Low-pass cutoff frequency in Hz
+            gain: Gain in dB
+            order: Butterworth filter order
+
+        Returns:
+            None
+        """
+        sos = butter(order, fc / (self.fs / 2), btype='low', output='sos')
+        self._files.append((file_path, [f'{speaker}-{side}' for side in SIDES], gain, sos))
+
+    def write(self, workers=1):
+        """Writes all added files.
+
+        Args:
+            workers: Number of files written at the same time
+
+        Returns:
+            List of written file paths in the order they were added
+        """
+        files, self._files = self._files, []
+        if workers is None or workers < 1:
+            raise ValueError('Number of workers must be a positive integer.')
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self._write, *file) for file in files]
+            return [future.result() for future in futures]
+
+    def _write(self, file_path, track_order, gain, sos):
+        """Selects, filters and writes tracks of a single file."""
+        data = self.tracks(track_order)
+        if sos is not None:
+            data = sosfilt(sos, data, axis=-1).astype(self.matrix.dtype, copy=False)
+        if gain:
+            data *= 10 ** (gain / 20)
+        if sos is not None:
+            # Boosted low-pass can exceed full scale
+            np.clip(data, -1.0, 1.0, out=data)
+        write_wav(file_path, self.fs, data, bit_depth=self.bit_depth)
+        return file_path
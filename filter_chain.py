@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from scipy.fft import rfft, irfft, next_fast_len
+
+
+class FilterChain:
+    """Chain of linear filters applied to a stack of impulse responses with a single FFT convolution.
+
+    Filters are combined by multiplying their spectra so that filtering with any number of filters takes one forward
+    and one inverse real FFT per channel. Filters are FIR arrays which broadcast against the data they are applied to,
+    a 1-D filter is used for every channel, a filter with shape (2, n) has a separate filter for left and right sides
+    and a filter with shape (n_speakers, 2, n) has individual filters for every speaker-side.
+    """
+
+    def __init__(self, firs=None):
+        """
+        Args:
+            firs: List of FIR filters to start the chain with
+        """
+        self.firs = []
+        for fir in firs or []:
+            self.add(fir)
+
+    def __len__(self):
+        """Length of the combined filter, the data grows by this minus one when filtered without a length limit."""
+        return 1 + sum(fir.shape[-1] - 1 for fir in self.firs)
+
+    def add(self, fir):
+        """Adds a filter to the chain.
+
+        Args:
+            fir: FIR filter as an array like
+
+        Returns:
+            None
+        """
+        fir = np.asarray(fir)
+        if fir.shape[-1] == 0:
+            raise ValueError('FIR filter cannot be empty.')
+        self.firs.append(fir)
+
+    def spectrum(self, n_fft, dtype='float64'):
+        """Combined spectrum of all the filters.
+
+        Args:
+            n_fft: FFT length
+            dtype: Data type of the filtered data, single precision data is filtered in single precision
+
+        Returns:
+            Complex spectrum, shape broadcasts against the spectra of the data
+        """
+        spectrum = None
+        for fir in self.firs:
+            # FIR filters are designed in double precision, filtering happens in the data type of the impulse responses
+            fir_spectrum = rfft(fir.astype(dtype, copy=False), n_fft, axis=-1)
+            spectrum = fir_spectrum if spectrum is None else spectrum * fir_spectrum
+        return spectrum
+
+    def apply(self, data, max_length=None):
+        """Filters data with all the filters in the chain.
+
+        Args:
+            data: Impulse responses as Numpy array with samples on the last axis
+            max_length: Maximum number of samples in the output, full convolution length when None
+
+        Returns:
+            Filtered data
+        """
+        if not self.firs:
+            return data[..., :max_length] if max_length is not None else data
+        n = data.shape[-1] + len(self) - 1
+        if max_length is not None:
+            n = min(n, max_length)
+        # FFT covers the full convolution so that the filter tails don't wrap around into the beginning
+        n_fft = next_fast_len(data.shape[-1] + len(self) - 1, real=True)
+        spectrum = rfft(data, n_fft, axis=-1) * self.spectrum(n_fft, dtype=data.dtype)
+        return irfft(spectrum, n_fft, axis=-1)[..., :n].astype(data.dtype, copy=False)
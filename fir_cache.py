@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import pickle
+import hashlib
+import warnings
+from collections import OrderedDict
+import numpy as np
+from artifacts import atomic_write
+
+# Bump this when FIR filter design changes so that filters designed by the old implementation are not used anymore
+FIR_CACHE_VERSION = 1
+
+
+class FIRCache:
+    """Least recently used cache of FIR filters designed from frequency response curves.
+
+    Filters are keyed by a hash of the curves they are designed from and the design parameters so that identical
+    curves, like the same headphone compensation for every speaker on one side, are designed only once. The cache can
+    be persisted to a file next to the stage cache so that filters are reused between runs.
+    """
+
+    def __init__(self, file_path=None, max_entries=64):
+        """
+        Args:
+            file_path: Path to the file where the cache is persisted, cache is kept in memory only when None
+            max_entries: Maximum number of filters kept, least recently used filters are evicted first
+        """
+        self.file_path = file_path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.n_hits = 0
+        self.n_misses = 0
+        self._modified = False
+        if file_path is not None:
+            self.load()
+
+    @staticmethod
+    def key(*arrays, **params):
+        """Creates filter key.
+
+        Args:
+            *arrays: Numpy arrays the filter is designed from, e.g. frequencies and error curve
+            **params: JSON serializable design parameters
+
+        Returns:
+            Key as hex string
+        """
+        sha = hashlib.sha256(json.dumps(
+            {'version': FIR_CACHE_VERSION, 'params': params}, sort_keys=True, default=str).encode('utf-8'))
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            sha.update(f'{array.dtype.str}{array.shape}'.encode('utf-8'))
+            sha.update(array.tobytes())
+        return sha.hexdigest()
+
+    def design(self, fn, *arrays, **params):
+        """Returns cached filter or designs it.
+
+        Args:
+            fn: Function which designs the filter, called without arguments. May return a Numpy array or a list of them.
+            *arrays: Numpy arrays the filter is designed from
+            **params: JSON serializable design parameters
+
+        Returns:
+            Filter as returned by `fn`, must not be modified by the caller
+        """
+        key = self.key(*arrays, **params)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.n_hits += 1
+            return self.entries[key]
+        self.n_misses += 1
+        fir = self._read_only(fn())
+        self.entries[key] = fir
+        self._modified = True
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return fir
+
+    @staticmethod
+    def _read_only(fir):
+        """Marks filter arrays read-only since cached filters are shared by all users."""
+        for array in fir if isinstance(fir, list) else [fir]:
+            array.setflags(write=False)
+        return fir
+
+    def load(self):
+        """Loads persisted filters, missing or broken file is ignored."""
+        try:
+            with open(self.file_path, 'rb') as f:
+                cache = pickle.load(f)
+            if cache['version'] != FIR_CACHE_VERSION:
+                return
+            for key, fir in cache['entries'][-self.max_entries:]:
+                self.entries[key] = self._read_only(fir)
+        except (OSError, EOFError, ValueError, KeyError, TypeError, pickle.UnpicklingError):
+            return
+
+    def save(self):
+        """Persists filters if the cache has a file and new filters were designed."""
+        if self.file_path is None or not self._modified:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.file_path)), exist_ok=True)
+            atomic_write(self.file_path, pickle.dumps(
+                {'version': FIR_CACHE_VERSION, 'entries': list(self.entries.items())},
+                protocol=pickle.HIGHEST_PROTOCOL))
+            self._modified = False
+        except OSError as err:
+            warnings.warn(f'Could not write FIR cache to "{self.file_path}": {err}')
@@ -1,18 +1,26 @@
 # -*- coding: utf-8 -*-
 
 import os
+import copy
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import soundfile as sf
+import nnresample
 import matplotlib.pyplot as plt
 from scipy import signal, fftpack
-from scipy.signal import correlate
 from numpy.fft import fft, ifft
 from scipy.signal import windows
-from PIL import Image
 from autoeq.frequency_response import FrequencyResponse
 from impulse_response import ImpulseResponse
-from utils import read_wav, write_wav, magnitude_response, sync_axes
-from constants import SPEAKER_NAMES, SPEAKER_DELAYS, HEXADECAGONAL_TRACK_ORDER
+from filter_chain import FilterChain
+from alignment import LagTable
+import shift
+import decay
+import peaks
+from utils import read_wav, read_wav_ranges, write_wav, magnitude_response, sync_axes, save_fig_as_png, align_takes, \
+    average_takes
+from constants import SPEAKER_NAMES, SPEAKER_DELAYS, HEXADECAGONAL_TRACK_ORDER, SIDES
 
 
 class HRIR:
@@ -20,6 +28,11 @@ class HRIR:
         self.estimator = estimator
         self.fs = self.estimator.fs
         self.irs = dict()
+        # Contiguous (n_speakers, 2, n_samples) array of all impulse responses, see consolidate()
+        self.data = None
+        # Row of each speaker in the contiguous array
+        self.index = dict()
+        self._views = dict()
 
     def copy(self):
         hrir = HRIR(self.estimator)
@@ -29,77 +42,499 @@ class HRIR:
                 'left': pair['left'].copy(),
                 'right': pair['right'].copy()
             }
+        if self.is_consolidated():
+            hrir._bind(self.data.copy(), lengths=self._lengths())
         return hrir
 
-    def open_recording(self, file_path, speakers, side=None, silence_length=2.0):
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_views'] = dict()
+        if self.is_consolidated():
+            # Views would be pickled as separate copies of the array, they are recreated from the array when unpickling
+            state['_lengths'] = self._lengths()
+            irs = dict()
+            for speaker, pair in self.irs.items():
+                irs[speaker] = dict()
+                for side, ir in pair.items():
+                    irs[speaker][side] = copy.copy(ir)
+                    irs[speaker][side].data = None
+            state['irs'] = irs
+        else:
+            state['data'] = None
+            state['index'] = dict()
+        return state
+
+    def __setstate__(self, state):
+        lengths = state.pop('_lengths', None)
+        self.__dict__.update(state)
+        if self.data is not None:
+            self._bind(self.data, lengths=lengths)
+
+    def consolidate(self, length=None):
+        """Moves all impulse responses into a single contiguous array.
+
+        Impulse responses are stored in `self.data` with shape (n_speakers, 2, n_samples), speakers in the order of
+        `self.irs` and sides in the order of `SIDES`. `self.index` maps speaker names to rows. Data of each
+        ImpulseResponse becomes a view into the array so that operations on the whole set can be done with single Numpy
+        calls. Assigning new data to an individual impulse response detaches it from the array and the array is
+        rebuilt on the next call. Impulse responses shifted with `shift()` keep their lengths, their views end before
+        the zero padding.
+
+        Args:
+            length: Length of the impulse responses in samples. Shorter impulse responses are zero padded and longer
+                    ones are truncated. Defaults to the length of the longest impulse response.
+
+        Returns:
+            Impulse responses as 3-D Numpy array
+        """
+        if self.is_consolidated() and (length is None or length == self.data.shape[-1]):
+            return self.data
+        if len(self.irs) == 0:
+            raise ValueError('HRIR has no impulse responses to consolidate.')
+        irs = [ir for pair in self.irs.values() for ir in pair.values()]
+        if length is None:
+            length = max(len(ir) for ir in irs)
+        data = np.zeros((len(self.irs), len(SIDES), length), dtype=np.result_type(*[ir.data for ir in irs]))
+        for i, pair in enumerate(self.irs.values()):
+            for side, ir in pair.items():
+                n = min(len(ir), length)
+                data[i, SIDES.index(side), :n] = ir.data[:n]
+        self._bind(data)
+        return self.data
+
+    def is_consolidated(self):
+        """Checks if all impulse responses are views into the contiguous array created by `consolidate()`."""
+        if self.data is None or list(self.index) != list(self.irs):
+            return False
+        # Deep copies keep the identities but turn the views into independent arrays
+        return all(
+            ir.data is self._views.get((speaker, side)) and np.may_share_memory(ir.data, self.data)
+            for speaker, pair in self.irs.items() for side, ir in pair.items()
+        )
+
+    def _bind(self, data, lengths=None):
+        """Sets the contiguous impulse response array and replaces impulse response data with views into it.
+
+        Views are whole rows of the array unless lengths are given as a dict with (speaker, side) tuples as keys, the
+        array must be zero after the lengths.
+        """
+        self.data = np.ascontiguousarray(data)
+        self.index = dict()
+        self._views = dict()
+        lengths = lengths or dict()
+        for i, (speaker, pair) in enumerate(self.irs.items()):
+            self.index[speaker] = i
+            for side, ir in pair.items():
+                view = self.data[i, SIDES.index(side), :lengths.get((speaker, side))]
+                ir.data = self._views[(speaker, side)] = view
+
+    def _lengths(self):
+        """Lengths of the impulse responses as a dict with (speaker, side) tuples as keys."""
+        return {(speaker, side): len(ir) for speaker, pair in self.irs.items() for side, ir in pair.items()}
+
+    def touch(self):
+        """Marks data of all impulse responses changed, see `ImpulseResponse.touch()`.
+
+        Must be called after modifying `self.data` in place.
+        """
+        for pair in self.irs.values():
+            for ir in pair.values():
+                ir.touch()
+
+    def open_recording(self, file_path, speakers, side=None, silence_length=None, sweep_offset=None, repeats=1,
+                       n_harmonics=4, stream=False, block_size=2**16, mmap=False):
         """Open combined recording and splits it into separate speaker-ear pairs.
 
+        When the sweeps are separated by silence only the sweep windows are read from the file, the silence before
+        the first sweep and after the last window is never read.
+
         Args:
             file_path: Path to recording file.
             speakers: Sequence of recorded speakers.
             side: Which side (ear) tracks are contained in the file if only one. "left" or "right" or None for both.
-            silence_length: Length of silence used during recording in seconds.
+            silence_length: Length of silence used during recording in seconds. Estimator's silence length by default.
+            sweep_offset: Time in seconds between starts of consecutive overlapping sweeps. None when sweeps are
+                          separated by silence.
+            repeats: Number of consecutive sweeps (takes) for each speaker. Takes are aligned and averaged with
+                     outlier rejection, see `_average_takes()`.
+            n_harmonics: Number of harmonic distortion impulse responses to keep in the impulse responses for
+                         distortion analysis, starting from the second harmonic. 0 disables.
+            stream: Read and deconvolve the recording in blocks instead of reading the whole file into memory. See
+                    `stream_recording()`.
+            block_size: Number of samples to read at a time when streaming.
+            mmap: Read sweep windows through a memory mapped view of the file when it's plain PCM or float WAV.
 
         Returns:
             None
         """
+        if stream:
+            for speaker, _side, ir in self.stream_recording(
+                    file_path, speakers, side=side, silence_length=silence_length, sweep_offset=sweep_offset,
+                    repeats=repeats, n_harmonics=n_harmonics, block_size=block_size):
+                if speaker not in self.irs:
+                    self.irs[speaker] = dict()
+                self.irs[speaker][_side] = ir
+            return
+
         if self.fs != self.estimator.fs:
             raise ValueError('Refusing to open recording because HRIR\'s sampling rate doesn\'t match impulse response '
                              'estimator\'s sampling rate.')
 
-        fs, recording = read_wav(file_path, expand=True)
-        if fs != self.fs:
+        if not os.path.isfile(file_path):
+            raise FileNotFoundError(f'File in path "{os.path.abspath(file_path)}" does not exist.')
+        info = sf.info(file_path)
+        if info.samplerate != self.fs:
             raise ValueError('Sampling rate of recording must match sampling rate of test signal.')
 
-        if silence_length * self.fs != int(silence_length * self.fs):
+        n_tracks = info.channels
+        tracks_k, n_columns, windows = self._recording_layout(
+            n_tracks, speakers, side, silence_length, sweep_offset=sweep_offset, repeats=repeats)
+
+        if sweep_offset is None:
+            # Only the sweep windows are read, windows at the end can be cut short
+            _, parts = read_wav_ranges(
+                file_path, [(start, end) for start, end, _, _ in windows], dtype=self.estimator.dtype, mmap=mmap)
+            lengths = [part.shape[1] for part in parts]
+            # Takes are separated by silence so they can be averaged before deconvolution and only one sweep per
+            # speaker needs to be deconvolved. Short columns are zero padded, padding doesn't affect the beginning of
+            # the estimated impulse response and gets cropped away.
+            column_size = windows[0][1] - windows[0][0]
+            columns = np.zeros((len(windows), n_tracks, column_size), dtype=self.estimator.dtype)
+            for j, part in enumerate(parts):
+                columns[j, :, :lengths[j]] = part
+            del parts
+            columns = columns.reshape(n_columns, repeats, n_tracks, column_size)
+            if repeats > 1:
+                columns = self._average_takes(columns)
+            else:
+                columns = columns[:, 0]
+            # Deconvolve all tracks of all columns in one pass
+            estimates = self.estimator.estimate_batch(columns.reshape(-1, column_size), n_harmonics=n_harmonics)
+            if n_harmonics:
+                estimates, harmonics = estimates
+                harmonics = harmonics.reshape(columns.shape[:2] + harmonics.shape[1:])
+            estimates = estimates.reshape(columns.shape)
+        else:
+            # Overlapping sweeps can't be split before deconvolution, read and deconvolve whole tracks and split
+            # afterwards
+            _, recording = read_wav(file_path, expand=True, dtype=self.estimator.dtype)
+            track_estimates = self.estimator.estimate_batch(recording)
+            columns = np.zeros((len(windows), n_tracks, len(self.estimator)), dtype=recording.dtype)
+            estimates = np.zeros((len(windows), n_tracks, windows[0][3] - windows[0][2]), dtype=recording.dtype)
+            for j, (start, end, est_start, est_end) in enumerate(windows):
+                column = recording[:, start:end]
+                columns[j, :, :column.shape[1]] = column
+                estimate = track_estimates[:, est_start:est_end]
+                estimates[j, :, :estimate.shape[1]] = estimate
+            if n_harmonics:
+                # Harmonics precede the linear impulse response and fall in the window of the previous sweep, windows
+                # are anchored on the linear impulse response peaks found in the sweep windows
+                peak_indices = peaks.first_peaks(estimates.reshape(-1, estimates.shape[-1]))
+                peak_indices = peak_indices.reshape(estimates.shape[:2])
+                harmonics = np.stack([
+                    self.estimator.harmonic_windows(
+                        track_estimates, n_harmonics, peak_indices=est_start + peak_indices[j])
+                    for j, (_, _, est_start, _) in enumerate(windows)
+                ])
+                harmonics = np.mean(harmonics.reshape((n_columns, repeats) + harmonics.shape[1:]), axis=1)
+            columns = columns.reshape((n_columns, repeats) + columns.shape[1:])
+            estimates = estimates.reshape((n_columns, repeats) + estimates.shape[1:])
+            # Raw windows contain the overlapping neighbour sweeps which don't average out, first take is kept for
+            # the recording
+            columns = columns[:, 0]
+            estimates = self._average_takes(estimates) if repeats > 1 else estimates[:, 0]
+            # Lengths of overlapping sweep windows are the impulse response window lengths
+            lengths = [
+                max(min(est_end, recording.shape[1]) - est_start, 0) for _, _, est_start, est_end in windows]
+
+        # Split each track by columns
+        irs = []
+        for j in range(n_columns):
+            # Longest take of the column, it's shorter than the window only when recording has been cut short
+            length = max(lengths[j * repeats:(j + 1) * repeats])
+            if length == 0:
+                continue
+            column = columns[j][:, :length] if sweep_offset is None else columns[j]
+            irs += self._column_irs(
+                j, n_columns, column, estimates[j][:, :length], speakers, side, tracks_k,
+                harmonics=harmonics[j] if n_harmonics else None)
+        # Add in the order of speakers
+        for _, speaker, _side, ir in sorted(irs, key=lambda x: x[0]):
+            if speaker not in self.irs:
+                self.irs[speaker] = dict()
+            self.irs[speaker][_side] = ir
+
+    def open_recordings(self, recordings, workers=1, **kwargs):
+        """Reads and deconvolves multiple recording files in parallel.
+
+        Files are opened in a thread pool, reading and FFT based deconvolution release the GIL so the files are
+        processed concurrently. Impulse responses are added in the order of `recordings` regardless of the order in
+        which the files are finished so the result is the same as opening the files one by one.
+
+        Args:
+            recordings: Sequence of (file path, speakers, side) tuples, see `open_recording()`
+            workers: Number of files processed at the same time. 1 opens the files one after another.
+            **kwargs: Keyword arguments for `open_recording()`
+
+        Returns:
+            None
+        """
+        if workers is None or workers < 1:
+            raise ValueError('Number of workers must be a positive integer.')
+
+        def open_part(file_path, speakers, side):
+            part = HRIR(self.estimator)
+            part.open_recording(file_path, speakers, side=side, **kwargs)
+            return part.irs
+
+        if workers == 1 or len(recordings) < 2:
+            parts = [open_part(*recording) for recording in recordings]
+        else:
+            with ThreadPoolExecutor(max_workers=min(workers, len(recordings))) as executor:
+                futures = [executor.submit(open_part, *recording) for recording in recordings]
+                parts = [future.result() for future in futures]
+        for irs in parts:
+            for speaker, pair in irs.items():
+                if speaker not in self.irs:
+                    self.irs[speaker] = dict()
+                self.irs[speaker].update(pair)
+
+    def stream_recording(self, file_path, speakers, side=None, silence_length=None, sweep_offset=None, repeats=1,
+                         n_harmonics=4, block_size=2**16):
+        """Reads and deconvolves combined recording in blocks and yields impulse responses as they become ready.
+
+        Recording is deconvolved as one continuous signal with overlap-save method so only a few blocks and the
+        current sweep window are kept in memory at any time. Impulse responses of a sweep window are yielded as soon as
+        the whole window has been deconvolved. Repeated takes are averaged when all the takes of a speaker have been
+        read.
+
+        Args:
+            file_path: Path to recording file.
+            speakers: Sequence of recorded speakers.
+            side: Which side (ear) tracks are contained in the file if only one. "left" or "right" or None for both.
+            silence_length: Length of silence used during recording in seconds. Estimator's silence length by default.
+            sweep_offset: Time in seconds between starts of consecutive overlapping sweeps. None when sweeps are
+                          separated by silence.
+            repeats: Number of consecutive sweeps (takes) for each speaker.
+            n_harmonics: Number of harmonic distortion impulse responses to keep in the impulse responses, starting
+                         from the second harmonic. Harmonics are not available for overlapping sweeps when streaming
+                         because they are dropped with the previous sweep window.
+            block_size: Number of samples to read at a time.
+
+        Returns:
+            Generator of (speaker, side, ImpulseResponse) tuples
+        """
+        if self.fs != self.estimator.fs:
+            raise ValueError('Refusing to open recording because HRIR\'s sampling rate doesn\'t match impulse response '
+                             'estimator\'s sampling rate.')
+
+        if not os.path.isfile(file_path):
+            raise FileNotFoundError(f'File in path "{os.path.abspath(file_path)}" does not exist.')
+        with sf.SoundFile(file_path) as f:
+            if f.samplerate != self.fs:
+                raise ValueError('Sampling rate of recording must match sampling rate of test signal.')
+
+            tracks_k, n_columns, windows = self._recording_layout(
+                f.channels, speakers, side, silence_length, sweep_offset=sweep_offset, repeats=repeats)
+
+            # Raw recording blocks which have been read but not yet dropped
+            raw = []
+            n_raw = 0
+
+            def read_blocks():
+                nonlocal n_raw
+                for block in f.blocks(blocksize=block_size, dtype=self.estimator.dtype, always_2d=True):
+                    # Soundfile has tracks on columns, we want them on rows
+                    block = np.transpose(block)
+                    raw.append(block)
+                    n_raw += block.shape[1]
+                    yield block
+
+            # Deconvolved samples which have not yet been dropped
+            pending = []
+            n_pending = 0
+            # Absolute index of the first kept raw and deconvolved sample
+            offset = 0
+            j = 0
+            # Raw recordings and estimates of the takes of the current column
+            takes = []
+
+            def take():
+                """Cuts the current window from the buffers and drops samples which are not needed anymore."""
+                nonlocal pending, raw, n_pending, n_raw, offset
+                rec_start, rec_end, est_start, est_end = windows[j]
+                estimates = np.concatenate(pending, axis=1)
+                recording = np.concatenate(raw, axis=1)
+                window = (
+                    recording[:, rec_start - offset:rec_end - offset],
+                    estimates[:, est_start - offset:est_end - offset]
+                )
+                if j + 1 < len(windows):
+                    end = min(windows[j + 1][0], windows[j + 1][2]) - offset
+                else:
+                    end = max(recording.shape[1], estimates.shape[1])
+                pending, raw = [estimates[:, end:]], [recording[:, end:]]
+                n_pending = pending[0].shape[1]
+                n_raw = raw[0].shape[1]
+                offset += end
+                return window
+
+            def column_irs():
+                """Averages the takes of the current column and splits it into impulse responses."""
+                if repeats > 1 and sweep_offset is None:
+                    # Takes are separated by silence, deconvolve the average of the takes like when reading the whole
+                    # file. Transients are smeared over the sweep length in the deconvolved takes.
+                    column = self._average_takes(self._pad_takes([column for column, _ in takes])[None])[0]
+                    estimates = self.estimator.estimate_batch(column)
+                elif repeats > 1:
+                    # Overlapping sweeps are averaged after deconvolution, raw recording is kept from the first take
+                    column = takes[0][0]
+                    estimates = self._average_takes(self._pad_takes([estimates for _, estimates in takes])[None])[0]
+                else:
+                    column, estimates = takes[0]
+                takes.clear()
+                harmonics = None
+                if n_harmonics and sweep_offset is None:
+                    # Window starts with the sweep so the harmonics are in the beginning of it
+                    harmonics = self.estimator.harmonic_windows(estimates, n_harmonics)
+                return self._column_irs(
+                    (j - 1) // repeats, n_columns, column, estimates, speakers, side, tracks_k, harmonics=harmonics)
+
+            for estimate in self.estimator.estimate_stream(read_blocks()):
+                pending.append(estimate)
+                n_pending += estimate.shape[1]
+                # Emit all the windows which are complete
+                while j < len(windows) and offset + n_pending >= windows[j][3] and offset + n_raw >= windows[j][1]:
+                    takes.append(take())
+                    j += 1
+                    if j % repeats == 0:
+                        for _, speaker, _side, ir in column_irs():
+                            yield speaker, _side, ir
+
+            # Last windows can be shorter than the others when recording has been cut short
+            while j < len(windows) and offset + n_pending > windows[j][2]:
+                takes.append(take())
+                j += 1
+                if j % repeats == 0:
+                    for _, speaker, _side, ir in column_irs():
+                        yield speaker, _side, ir
+            if takes:
+                # Incomplete set of takes for the last column
+                for _, speaker, _side, ir in column_irs():
+                    yield speaker, _side, ir
+
+    @staticmethod
+    def _pad_takes(takes):
+        """Zero pads takes of different lengths to the length of the longest one and stacks them."""
+        length = max(take.shape[1] for take in takes)
+        return np.stack([np.pad(take, [(0, 0), (0, length - take.shape[1])]) for take in takes])
+
+    def _average_takes(self, takes):
+        """Aligns and averages repeated takes.
+
+        Takes are aligned with sub-sample accuracy within 10 ms of the first take and averaged. Blocks of takes which
+        contain a transient are left out of the average.
+
+        Args:
+            takes: Takes as Numpy array of shape (n_columns, n_takes, n_tracks, n_samples)
+
+        Returns:
+            Averaged takes with shape (n_columns, n_tracks, n_samples)
+        """
+        aligned, _ = align_takes(takes, max_lag=int(self.fs * 0.01))
+        average, rejected = average_takes(aligned)
+        if np.any(rejected):
+            warnings.warn(f'Rejected {np.sum(rejected)} noisy blocks from repeated takes.')
+        return average
+
+    def _recording_layout(self, n_tracks, speakers, side, silence_length, sweep_offset=None, repeats=1):
+        """Calculates how the sweeps are laid out in a combined recording.
+
+        Args:
+            n_tracks: Number of tracks in the recording.
+            speakers: Sequence of recorded speakers.
+            side: Which side (ear) tracks are contained in the file if only one. "left" or "right" or None for both.
+            silence_length: Length of silence used during recording in seconds. Estimator's silence length if None.
+            sweep_offset: Time in seconds between starts of consecutive overlapping sweeps. None when sweeps are
+                          separated by silence.
+            repeats: Number of consecutive sweeps (takes) for each speaker.
+
+        Returns:
+            - Number of tracks per speaker
+            - Number of speaker columns in each track
+            - List of (recording start, recording end, estimate start, estimate end) sample indices for each sweep
+              window, `repeats` consecutive windows per column. Recording indices select the raw recording of the
+              sweep and estimate indices select the impulse response from the deconvolved track.
+        """
+        if silence_length is None:
+            silence_length = self.estimator.silence_length
+        if not np.isclose(silence_length * self.fs, round(silence_length * self.fs)):
             raise ValueError('Silence length must produce full samples with given sampling rate.')
-        silence_length = int(silence_length * self.fs)
+        silence_length = int(round(silence_length * self.fs))
+        if repeats < 1:
+            raise ValueError('Number of repeats must be at least 1.')
 
         # 2 tracks per speaker when side is not specified, only 1 track per speaker when it is
         tracks_k = 2 if side is None else 1
 
         # Number of speakers in each track
-        n_columns = round(len(speakers) / (recording.shape[0] // tracks_k))
-
-        # Crop out initial silence
-        recording = recording[:, silence_length:]
+        n_columns = round(len(speakers) / (n_tracks // tracks_k))
+
+        windows = []
+        if sweep_offset is None:
+            # Each sweep is followed by silence and deconvolved separately
+            column_size = silence_length + len(self.estimator)
+            for j in range(n_columns * repeats):
+                start = silence_length + j * column_size
+                windows.append((start, start + column_size, start, start + column_size))
+        else:
+            if not np.isclose(sweep_offset * self.fs, round(sweep_offset * self.fs)):
+                raise ValueError('Sweep offset must produce full samples with given sampling rate.')
+            offset = int(round(sweep_offset * self.fs))
+            window_start, window_size = self.estimator.sweep_offset_window(sweep_offset)
+            for j in range(n_columns * repeats):
+                start = silence_length + j * offset
+                windows.append((
+                    start, start + len(self.estimator),
+                    start + window_start, start + window_start + window_size
+                ))
+        return tracks_k, n_columns, windows
+
+    def _column_irs(self, j, n_columns, column, estimates, speakers, side, tracks_k, harmonics=None):
+        """Splits a single sweep window of a combined recording into speaker-ear impulse responses.
 
-        # Split sections in time to columns
-        columns = []
-        column_size = silence_length + len(self.estimator)
-        for i in range(n_columns):
-            columns.append(recording[:, i * column_size:(i + 1) * column_size])
+        Args:
+            j: Index of the sweep window (column)
+            n_columns: Number of sweep windows in each track
+            column: Recording of the sweep window with one row per track
+            estimates: Deconvolved sweep window with one row per track
+            speakers: Sequence of recorded speakers.
+            side: Which side (ear) tracks are contained in the file if only one. "left" or "right" or None for both.
+            tracks_k: Number of tracks per speaker
+            harmonics: Linear and harmonic impulse response windows with one row per track or None
 
-        # Split each track by columns
+        Returns:
+            Generator of (speaker index, speaker, side, ImpulseResponse) tuples
+        """
+        if harmonics is None:
+            harmonics = [None] * column.shape[0]
         i = 0
-        while i < recording.shape[0]:
-            for j, column in enumerate(columns):
-                n = int(i // 2 * len(columns) + j)
-                speaker = speakers[n]
-                if speaker not in SPEAKER_NAMES:
-                    # Skip non-standard speakers. Useful for skipping the other sweep in center channel recording.
-                    continue
-                if speaker not in self.irs:
-                    self.irs[speaker] = dict()
-                if side is None:
-                    # Left first, right then
-                    self.irs[speaker]['left'] = ImpulseResponse(
-                        self.estimator.estimate(column[i, :]),
-                        self.fs,
-                        column[i, :]
-                    )
-                    self.irs[speaker]['right'] = ImpulseResponse(
-                        self.estimator.estimate(column[i + 1, :]),
-                        self.fs,
-                        column[i + 1, :]
-                    )
-                else:
-                    # Only the given side
-                    self.irs[speaker][side] = ImpulseResponse(
-                        self.estimator.estimate(column[i, :]),
-                        self.fs,
-                        column[i, :]
-                    )
+        while i < column.shape[0]:
+            n = int(i // 2 * n_columns + j)
+            speaker = speakers[n]
+            if speaker not in SPEAKER_NAMES:
+                # Skip non-standard speakers. Useful for skipping the other sweep in center channel recording.
+                i += tracks_k
+                continue
+            if side is None:
+                # Left first, right then
+                yield n, speaker, 'left', ImpulseResponse(
+                    estimates[i, :], self.fs, column[i, :], harmonics=harmonics[i])
+                yield n, speaker, 'right', ImpulseResponse(
+                    estimates[i + 1, :], self.fs, column[i + 1, :], harmonics=harmonics[i + 1])
+            else:
+                # Only the given side
+                yield n, speaker, side, ImpulseResponse(estimates[i, :], self.fs, column[i, :], harmonics=harmonics[i])
             i += tracks_k
 
     def write_wav(self, file_path, track_order=None, bit_depth=32):
@@ -117,23 +552,16 @@ class HRIR:
         if track_order is None:
             track_order = HEXADECAGONAL_TRACK_ORDER
 
-        # Add all impulse responses to a list and save channel names
-        irs = []
-        ir_order = []
-        for speaker, pair in self.irs.items():
-            for side, ir in pair.items():
-                irs.append(ir.data)
-                ir_order.append(f'{speaker}-{side}')
+        # All speaker-side impulse responses as rows with a silent track as the last row
+        data = self.consolidate()
+        tracks = np.concatenate([data.reshape(-1, data.shape[-1]), np.zeros((1, data.shape[-1]), dtype=data.dtype)])
 
-        # Add silent tracks
+        # Pick rows in output order, missing speaker-sides are silent
+        rows = []
         for ch in track_order:
-            if ch not in ir_order:
-                irs.append(np.zeros(len(irs[0])))
-                ir_order.append(ch)
-        irs = np.vstack(irs)
-
-        # Sort to output order
-        irs = irs[[ir_order.index(ch) for ch in track_order], :]
+            speaker, side = ch.split('-')
+            rows.append(self.index[speaker] * len(SIDES) + SIDES.index(side) if speaker in self.index else -1)
+        irs = tracks[rows]
 
         # Write to file
         write_wav(file_path, self.fs, irs, bit_depth=bit_depth)
@@ -145,14 +573,34 @@ class HRIR:
             peak_target: Target gain of the peak in dB
             avg_target: Target gain of the mid frequencies average in dB
         """
+        gain = self.normalization_gain(peak_target=peak_target, avg_target=avg_target)
+
+        # 전체 정규화 gain만 출력
+        print(f">>>>>>>>> Applied a normalization gain of {gain:.2f} dB to all channels")
+
+        # 계산된 gain 적용
+        self.consolidate()
+        self.data *= 10 ** (gain / 20)
+        self.touch()
+
+    def normalization_gain(self, peak_target=-0.1, avg_target=None, speakers=None):
+        """Calculates the gain which normalizes output to target without applying it.
+
+        Args:
+            peak_target: Target gain of the peak in dB
+            avg_target: Target gain of the mid frequencies average in dB
+            speakers: Speakers included in the output, all speakers by default. Must not be empty.
+
+        Returns:
+            Gain in dB
+        """
+        if speakers is not None and len(speakers) == 0:
+            raise ValueError('At least one speaker is needed for the normalization gain.')
         # 왼쪽과 오른쪽 IR을 합산하여 전체 신호 생성
-        left = []
-        right = []
-        for speaker, pair in self.irs.items():
-            left.append(pair['left'].data)
-            right.append(pair['right'].data)
-        left = np.sum(np.vstack(left), axis=0)
-        right = np.sum(np.vstack(right), axis=0)
+        data = self.consolidate()
+        if speakers is not None:
+            data = data[[self.index[speaker] for speaker in speakers]]
+        left, right = np.sum(data, axis=0)
 
         # Magnitude response 계산
         f_l, mr_l = magnitude_response(left, self.fs)
@@ -168,17 +616,7 @@ class HRIR:
             ])) * -1 + avg_target
         else:
             raise ValueError('One and only one of the parameters "peak_target" and "avg_target" must be given!')
-
-        # 전체 정규화 gain만 출력
-        print(f">>>>>>>>> Applied a normalization gain of {gain:.2f} dB to all channels")
-
-        # 계산된 gain 적용
-        factor = 10 ** (gain / 20)
-        for speaker, pair in self.irs.items():
-            for side, ir in pair.items():
-                ir.data *= factor
-
-
+        return gain
 
     def crop_heads(self, head_ms=1):
         """Crops heads of impulse responses
@@ -193,10 +631,11 @@ class HRIR:
             raise ValueError('Refusing to crop heads because HRIR sampling rate doesn\'t match impulse response '
                              'estimator\'s sampling rate.')
 
+        peak_indices = self.peak_indices()
         for speaker, pair in self.irs.items():
             # Peaks
-            peak_left = pair['left'].peak_index()
-            peak_right = pair['right'].peak_index()
+            peak_left = peak_indices[(speaker, 'left')]
+            peak_right = peak_indices[(speaker, 'right')]
             itd = np.abs(peak_left - peak_right) / self.fs
 
             # Speaker channel delay
@@ -236,6 +675,83 @@ class HRIR:
             window = signal.hanning(head * 2)[:head]
             pair['left'].data[:head] *= window
             pair['right'].data[:head] *= window
+            pair['left'].touch()
+            pair['right'].touch()
+
+    def decay_params(self):
+        """Determines decay parameters of all impulse responses at once with Lundeby method.
+
+        Impulse responses are zero padded into one array and analyzed together, see `decay.decay_params()`. Results are
+        memoized in the impulse responses.
+
+        Returns:
+            Dict of (peak_ind, knee_point_ind, noise_floor, window_size) tuples with (speaker, side) tuples as keys, see
+            `ImpulseResponse.decay_params()`
+        """
+        params = dict()
+        for speaker, pair in self.irs.items():
+            for side, ir in pair.items():
+                params[(speaker, side)] = ir.cached('decay_params')
+        # Only the impulse responses which have changed since their last analysis are analyzed
+        keys = [key for key, value in params.items() if value is None]
+        if not keys:
+            return params
+        data, lengths = self._stack(keys)
+        peak_indices = self.peak_indices()
+        peak_indices = [peak_indices[key] if length >= 10 else 0 for key, length in zip(keys, lengths)]
+        for key, *values in zip(keys, *decay.decay_params(data, self.fs, peak_indices, lengths=lengths)):
+            peak_ind, knee_point_ind, noise_floor, window_size = values
+            params[key] = (int(peak_ind), int(knee_point_ind), float(noise_floor), int(window_size))
+            self.irs[key[0]][key[1]].cache(params[key], 'decay_params')
+        return params
+
+    def peak_indices(self, start=0, end=None, peak_height=0.12589):
+        """Finds the first high (negative or positive) peak of all impulse responses at once.
+
+        Results are memoized in the impulse responses, see `ImpulseResponse.peak_index()` and `peaks.first_peaks()`.
+
+        Args:
+            start: Index for start of search range
+            end: Index for end of search range, the direct sound is found without scanning the reflections after it
+            peak_height: Minimum peak height. Default is -18 dBFS
+
+        Returns:
+            Dict of peak indices with (speaker, side) tuples as keys
+        """
+        indices = dict()
+        for speaker, pair in self.irs.items():
+            for side, ir in pair.items():
+                indices[(speaker, side)] = ir.cached('peak_index', start=start, end=end, peak_height=peak_height)
+        keys = [key for key, value in indices.items() if value is None]
+        if not keys:
+            return indices
+        data, lengths = self._stack(keys)
+        for key, index in zip(keys, peaks.first_peaks(
+                data, start=start, end=end, peak_height=peak_height, lengths=lengths)):
+            indices[key] = int(index)
+            self.irs[key[0]][key[1]].cache(indices[key], 'peak_index', start=start, end=end, peak_height=peak_height)
+        return indices
+
+    def _stack(self, keys):
+        """Stacks impulse responses into a 2-D array, shorter impulse responses are zero padded.
+
+        Args:
+            keys: List of (speaker, side) tuples
+
+        Returns:
+            - Impulse responses with shape (len(keys), n_samples)
+            - List of impulse response lengths
+        """
+        if self.is_consolidated():
+            rows = [self.index[speaker] * len(SIDES) + SIDES.index(side) for speaker, side in keys]
+            lengths = [len(self.irs[speaker][side]) for speaker, side in keys]
+            return self.data.reshape(-1, self.data.shape[-1])[rows], lengths
+        irs = [self.irs[speaker][side] for speaker, side in keys]
+        lengths = [len(ir) for ir in irs]
+        data = np.zeros((len(irs), max(lengths)), dtype=np.result_type(*[ir.data for ir in irs]))
+        for i, ir in enumerate(irs):
+            data[i, :len(ir)] = ir.data
+        return data, lengths
 
     def crop_tails(self):
         """Crops out tails after every impulse response has decayed to noise floor."""
@@ -243,13 +759,8 @@ class HRIR:
             raise ValueError('Refusing to crop tails because HRIR\'s sampling rate doesn\'t match impulse response '
                              'estimator\'s sampling rate.')
         # Find indices after which there is only noise in each track
-        tail_indices = []
-        lengths = []
-        for speaker, pair in self.irs.items():
-            for side, ir in pair.items():
-                _, tail_ind, _, _ = ir.decay_params()
-                tail_indices.append(tail_ind)
-                lengths.append(len(ir))
+        tail_indices = [tail_ind for _, tail_ind, _, _ in self.decay_params().values()]
+        lengths = [len(ir) for pair in self.irs.values() for ir in pair.values()]
 
         # Crop all tracks by last tail index
         seconds_per_octave = len(self.estimator) / self.estimator.fs / self.estimator.n_octaves
@@ -257,14 +768,28 @@ class HRIR:
         window = signal.hanning(fade_out)[fade_out // 2:]
         fft_len = fftpack.next_fast_len(max(tail_indices))
         tail_ind = min(np.min(lengths), fft_len)
-        for speaker, pair in self.irs.items():
-            for ir in pair.values():
-                ir.data = ir.data[:tail_ind]
-                ir.data *= np.concatenate([np.ones(len(ir.data) - len(window)), window])
+        data = self.consolidate(tail_ind)
+        data[..., tail_ind - len(window):] *= window
+        self.touch()
         
     def align_ipsilateral_all(self,
                               speaker_pairs=None,
-                              segment_ms=30):
+                              segment_ms=30,
+                              weighting=None):
+        """Aligns left side speakers to right side speakers by cross-correlation of the beginning segments.
+
+        Left ear impulse response of the left speaker is correlated with the right ear impulse response of the right
+        speaker. A speaker paired with itself aligns its own left and right ear impulse responses. Lags of all pairs are
+        computed at once with sub-sample precision and applied as fractional delays, see `LagTable`.
+
+        Args:
+            speaker_pairs: List of (left speaker, right speaker) tuples
+            segment_ms: Length of the beginning segment in milliseconds
+            weighting: Cross-correlation weighting, None or "phat"
+
+        Returns:
+            None
+        """
         if speaker_pairs is None:
             speaker_pairs = [('FL','FR'),
                              ('SL','SR'),
@@ -274,51 +799,82 @@ class HRIR:
                              ('TSL','TSR'),
                              ('TBL','TBR'),
                              ('FC','FC')]
-            
-        fs = self.fs
-        seg_len = int(fs * segment_ms / 1000)
+        speaker_pairs = [(sp1, sp2) for sp1, sp2 in speaker_pairs if sp1 in self.irs and sp2 in self.irs]
+        table = self.lag_table(
+            pairs=[((sp1, 'left'), (sp2, 'right')) for sp1, sp2 in speaker_pairs], segment_ms=segment_ms,
+            weighting=weighting)
 
+        delays = dict()
         for sp1, sp2 in speaker_pairs:
-            if sp1 not in self.irs or sp2 not in self.irs:
-                continue
+            lag = table.lag((sp1, 'left'), (sp2, 'right'))
 
             if sp1 == sp2:
-                data_L = self.irs[sp1]['left' ].data[:seg_len]
-                data_R = self.irs[sp1]['right'].data[:seg_len]
-
-                corr  = correlate(data_L, data_R, mode='full')
-                lags  = np.arange(-len(data_L)+1, len(data_L))
-                lag   = lags[np.argmax(corr)]
-
                 if   lag > 0:   # left leads → delay right
-                    d = self.irs[sp1]['right'].data
-                    self.irs[sp1]['right'].data = np.concatenate((np.zeros(lag), d))[:len(d)]
+                    delays[(sp1, 'right')] = lag
                 elif lag < 0:   # right leads → delay left
-                    d = self.irs[sp1]['left'].data
-                    self.irs[sp1]['left' ].data = np.concatenate((np.zeros(-lag), d))[:len(d)]
+                    delays[(sp1, 'left')] = -lag
 
                 continue
 
-            data1 = self.irs[sp1]['left'].data[:seg_len]
-            data2 = self.irs[sp2]['right'].data[:seg_len]
-
-            corr  = correlate(data1, data2, mode='full')
-            lags  = np.arange(-len(data1)+1, len(data1))
-            lag   = lags[np.argmax(corr)]
-
             if lag > 0:
                 for side in ('left','right'):
-                    d = self.irs[sp2][side].data
-                    padded = np.concatenate((np.zeros(lag), d))[:len(d)]
-                    self.irs[sp2][side].data = padded
+                    delays[(sp2, side)] = lag
 
             elif lag < 0:
-                neg = -lag
                 for side in ('left','right'):
-                    d = self.irs[sp1][side].data
-                    padded = np.concatenate((np.zeros(neg), d))[:len(d)]
-                    self.irs[sp1][side].data = padded
-                    
+                    delays[(sp1, side)] = -lag
+
+        self.shift(delays)
+
+    def shift(self, delays, method='sinc'):
+        """Shifts impulse responses in place, lengths of the impulse responses don't change.
+
+        Impulse responses are consolidated and shifted in place with one `shift.shift_channels()` call per distinct
+        impulse response length.
+
+        Args:
+            delays: Dict of delays in samples with (speaker, side) tuples as keys. Positive values delay and negative
+                    values advance the impulse responses. Fractional delays are supported.
+            method: Fractional delay method, "sinc" or "thiran"
+
+        Returns:
+            None
+        """
+        keys = [key for key, delay in delays.items() if delay != 0]
+        if not keys:
+            return
+        lengths = self._lengths()
+        data = self.consolidate()
+        for length in sorted({lengths[key] for key in keys}):
+            # Impulse responses are shifted within their own lengths, rows of the other lengths are not touched
+            row_delays = np.zeros(data.shape[:-1])
+            for speaker, side in keys:
+                if lengths[(speaker, side)] == length:
+                    row_delays[self.index[speaker], SIDES.index(side)] = delays[(speaker, side)]
+            view = data[..., :length]
+            shift.shift_channels(view, row_delays, out=view, method=method)
+        if lengths != self._lengths():
+            # Consolidation padded the shorter impulse responses, they keep their lengths as views into the array
+            self._bind(data, lengths=lengths)
+        for speaker, side in keys:
+            self.irs[speaker][side].touch()
+
+    def lag_table(self, pairs=None, channels=None, segment_ms=30, weighting=None, interpolate=True):
+        """Creates table of cross-correlation lags and peak positions for alignment, see `LagTable`.
+
+        Args:
+            pairs: List of ((speaker, side), (speaker, side)) pairs for cross-correlation lags
+            channels: List of (speaker, side) tuples for peak positions
+            segment_ms: Length of the beginning segment used for cross-correlation in milliseconds
+            weighting: Cross-correlation weighting, None or "phat"
+            interpolate: Refine lags and peaks to sub-sample precision?
+
+        Returns:
+            LagTable instance
+        """
+        return LagTable(
+            self, pairs=pairs, channels=channels, segment_ms=segment_ms, weighting=weighting, interpolate=interpolate)
+
     def align_onset_groups_peak_leftref(self, groups=None):
         """
         Align on “left-channel peak” across speaker groups, keeping each
@@ -327,7 +883,8 @@ class HRIR:
         • We take only each speaker’s left-channel peak_index() as the
         group’s onset.  (We do NOT inspect the right channel for timing.)
         • FL is the fixed reference (using FL’s left channel).
-        • Every speaker’s left+right channels move by the same integer shift.
+        • Every speaker’s left+right channels move by the same shift, peaks are
+        refined to sub-sample precision and shifts can be fractional.
         """
         if groups is None:
             groups = [
@@ -346,7 +903,11 @@ class HRIR:
             sp = grp[0]
             if sp not in self.irs:
                 return None
-            return self.irs[sp]['left'].peak_index()
+            return table.peak(sp, 'left')
+
+        # Peaks of all the groups at once, groups which don't exist are skipped
+        table = self.lag_table(
+            channels=[(grp[0], 'left') for grp in list(groups) + [('FL', 'FR')] if grp[0] in self.irs])
 
         # Reference is FL’s left channel
         ref_grp = ('FL','FR')
@@ -354,6 +915,7 @@ class HRIR:
         if ref_peak is None:
             raise RuntimeError("Cannot find FL’s left channel—reference missing!")
 
+        delays = dict()
         for grp in groups:
             if grp == ref_grp:
                 continue
@@ -366,96 +928,74 @@ class HRIR:
             # positive shift → group is “later” than FL; negative → “earlier”
             shift = gp - ref_peak
 
-            # move each speaker in this group by the same shift
+            # move each speaker in this group by the same shift, late groups are advanced and early groups delayed
             for sp in grp:
                 if sp not in self.irs:
                     continue
                 for side in ('left','right'):
-                    data = self.irs[sp][side].data
-                    n = len(data)
-
-                    if shift > 0:
-                        # group is late → chop off `shift` samples at front, pad zeros at end
-                        trimmed = data[shift:]
-                        if len(trimmed) < n:
-                            trimmed = np.pad(trimmed, (0, n - len(trimmed)))
-                        self.irs[sp][side].data = trimmed
-
-                    elif shift < 0:
-                        # group is early → prepend |shift| zeros, then trim back to length n
-                        delay = -shift
-                        padded = np.concatenate((np.zeros(delay), data))[:n]
-                        self.irs[sp][side].data = padded
-
-                    # if shift == 0, do nothing (already aligned)
-
+                    delays[(sp, side)] = -shift
 
+        self.shift(delays)
 
     def adjust_itd(self, mode: str = 'off'):
 
         if mode == 'off':
             return
 
-        def shift(sig: np.ndarray, samples: int) -> np.ndarray:
-            """Length-preserving shift.  +samples ⇒ delay, −samples ⇒ advance."""
-            if samples == 0:
-                return sig
-            n = len(sig)
-            if samples > 0:                                # delay
-                return np.concatenate((np.zeros(samples, sig.dtype), sig))[:n]
-            else:                                          # advance
-                samples = -samples
-                return np.concatenate((sig[samples:], np.zeros(samples, sig.dtype)))
-
         # Speaker pairs to process (left-hand, right-hand)
         pairs = [
             ('FL', 'FR'), ('SL', 'SR'), ('BL', 'BR'), ('WL', 'WR'),
             ('TFL', 'TFR'), ('TSL', 'TSR'), ('TBL', 'TBR')
         ]
 
-        for sp_left, sp_right in pairs:
-            if sp_left not in self.irs or sp_right not in self.irs:
-                continue
+        pairs = [(sp_left, sp_right) for sp_left, sp_right in pairs if sp_left in self.irs and sp_right in self.irs]
 
-            # Identify the *contralateral* channel for each speaker
-            con_left  = self.irs[sp_left ]['right'] if sp_left .endswith('L') else self.irs[sp_left ]['left']
-            con_right = self.irs[sp_right]['left' ] if sp_right.endswith('R') else self.irs[sp_right]['right']
+        # Identify the *contralateral* channel for each speaker
+        def contralateral(speaker):
+            return (speaker, 'right') if speaker.endswith('L') else (speaker, 'left')
 
-            p_left  = con_left .peak_index()
-            p_right = con_right.peak_index()
-            Δ = p_right - p_left                                   # + ⇒ right later
+        # Peaks of all contralateral channels at once
+        table = self.lag_table(channels=[contralateral(sp) for pair in pairs for sp in pair])
+
+        delays = dict()
+        for sp_left, sp_right in pairs:
+            con_left  = contralateral(sp_left )
+            con_right = contralateral(sp_right)
+
+            p_left  = table.peak(*con_left )
+            p_right = table.peak(*con_right)
+            Δ = p_right - p_left                                   # + ⇒ right later, fractional
             if Δ == 0:
                 continue
 
+            # + ⇒ delay, − ⇒ advance
             if mode == 'e':                                        # early wins
                 if Δ > 0:                                          # right later
-                    con_right.data = shift(con_right.data, -Δ)
+                    delays[con_right] = -Δ
                 else:                                              # left later
-                    con_left .data = shift(con_left .data,  Δ)
+                    delays[con_left ] =  Δ
 
             elif mode == 'l':                                      # late wins
                 if Δ > 0:                                          # right later
-                    con_left .data = shift(con_left .data,  Δ)
+                    delays[con_left ] =  Δ
                 else:                                              # left later
-                    con_right.data = shift(con_right.data, -Δ)
+                    delays[con_right] = -Δ
 
             elif mode == 'a':                                      # average
-                half = abs(Δ) // 2
+                half = abs(Δ) / 2
                 if Δ > 0:                                          # right later
-                    con_left .data = shift(con_left .data,  half)   # delay early
-                    con_right.data = shift(con_right.data, -half)   # advance late
+                    delays[con_left ] =  half                      # delay early
+                    delays[con_right] = -half                      # advance late
                 else:                                              # left later
-                    con_left .data = shift(con_left .data, -half)
-                    con_right.data = shift(con_right.data,  half)
+                    delays[con_left ] = -half
+                    delays[con_right] =  half
 
             else:
                 raise ValueError(f'Unknown ITD mode “{mode}”')
 
+        self.shift(delays)
 
- 
-
-    
-    def channel_balance_firs(self, left_fr, right_fr, method):
+    def channel_balance_firs(self, left_fr, right_fr, method, fir_cache=None):
         """Creates FIR filters for correcting channel balance
 
         Args:
@@ -466,10 +1006,17 @@ class HRIR:
                     to the average fr, "min" equalizes both to the minimum of left and right side frs. Number
                     values will boost or attenuate right side relative to left side by the number of dBs. "mids" is
                     the same as the numerical values but guesses the value automatically from mid frequency levels.
+            fir_cache: FIRCache instance, filters are designed without caching when None
 
         Returns:
             List of two FIR filters as numpy arrays, first for left and second for right
         """
+        if fir_cache is not None:
+            # Left and right side frequency responses fully define the filters
+            return fir_cache.design(
+                lambda: self.channel_balance_firs(left_fr, right_fr, method),
+                left_fr.frequency, left_fr.raw, right_fr.raw, method=f'channel_balance_{method}', fs=self.fs)
+
         if method == 'mids':
             # Find gain for right side
             # R diff - L diff = L mean - R mean
@@ -560,7 +1107,7 @@ class HRIR:
 
         return firs
 
-    def correct_channel_balance(self, method):
+    def correct_channel_balance(self, method, fir_cache=None, max_length=None):
         """Channel balance correction by equalizing left and right ear results to the same frequency response.
 
            Args:
@@ -569,6 +1116,8 @@ class HRIR:
                        to the average fr, "min" equalizes both to the minimum of left and right side frs. Number
                        values will boost or attenuate right side relative to left side by the number of dBs. "mids" is
                        the same as the numerical values but guesses the value automatically from mid frequency levels.
+               fir_cache: FIRCache instance for the filters or None
+               max_length: Maximum length of the impulse responses after filtering, full convolution length when None
 
            Returns:
                HRIR with FIR filter for equalizing each speaker-side
@@ -583,6 +1132,7 @@ class HRIR:
 
         # Group the same left and right side speakers
         eqir = HRIR(self.estimator)
+        speaker_firs = dict()
         for speakers in [['FC'], ['FL', 'FR'], ['SL', 'SR'], ['BL', 'BR'], ['WL', 'WR'], ['TFL', 'TFR'], ['TSL', 'TSR'], ['TBL', 'TBR']]:
             if len([ch for ch in speakers if ch in self.irs]) < len(speakers):
                 # All the speakers in the current speaker group must exist, otherwise balancing makes no sense
@@ -596,11 +1146,20 @@ class HRIR:
             left_fr = ImpulseResponse(np.mean(np.vstack(left), axis=0), self.fs).frequency_response()
             right_fr = ImpulseResponse(np.mean(np.vstack(right), axis=0), self.fs).frequency_response()
             # Create EQ FIR filters
-            firs = self.channel_balance_firs(left_fr, right_fr, method)
-            # Assign to speakers in EQ HRIR
+            firs = self.channel_balance_firs(left_fr, right_fr, method, fir_cache=fir_cache)
             for speaker in speakers:
-                self.irs[speaker]['left'].equalize(firs[0])
-                self.irs[speaker]['right'].equalize(firs[1])
+                speaker_firs[speaker] = firs
+
+        if speaker_firs:
+            # Filter all speakers at once, speakers without balancing get unit impulses
+            self.consolidate()
+            fir = np.zeros((len(self.index), len(SIDES), max(len(f) for firs in speaker_firs.values() for f in firs)))
+            fir[:, :, 0] = 1.0
+            for speaker, firs in speaker_firs.items():
+                for i, f in enumerate(firs):
+                    fir[self.index[speaker], i, :] = 0.0
+                    fir[self.index[speaker], i, :len(f)] = f
+            self.equalize(fir, max_length=max_length)
 
         return eqir
 
@@ -649,11 +1208,7 @@ class HRIR:
             for speaker, pair in self.irs.items():
                 for side, ir in pair.items():
                     file_path = os.path.join(dir_path, f'{speaker}-{side}.png')
-                    figs[speaker][side].savefig(file_path, bbox_inches='tight')
-                    # Optimize file size
-                    im = Image.open(file_path)
-                    im = im.convert('P', palette=Image.ADAPTIVE, colors=60)
-                    im.save(file_path, optimize=True)
+                    save_fig_as_png(file_path, figs[speaker][side])
 
         # Close plots
         if close_plots:
@@ -694,21 +1249,19 @@ class HRIR:
 
         # Save figures
         file_path = os.path.join(dir_path, f'results.png')
-        fig.savefig(file_path, bbox_inches='tight')
+        save_fig_as_png(file_path, fig)
         plt.close(fig)
-        # Optimize file size
-        im = Image.open(file_path)
-        im = im.convert('P', palette=Image.ADAPTIVE, colors=60)
-        im.save(file_path, optimize=True)
 
-    def equalize(self, fir):
+    def equalize(self, fir, max_length=None):
         """Equalizes all impulse responses with given FIR filters.
 
         First row of the fir matrix will be used for all left side impulse responses and the second row for all right
-        side impulse responses.
+        side impulse responses. A 3-D fir array of shape (n_speakers, 2, n) has individual filters for each
+        speaker-side with the rows in the order of `self.index`. A FilterChain applies all of its filters at once.
 
         Args:
-            fir: FIR filter as an array like. Must have same sample rate as this HRIR instance.
+            fir: FIR filter as an array like or FilterChain instance. Must have same sample rate as this HRIR instance.
+            max_length: Maximum length of the impulse responses after filtering, full convolution length when None
 
         Returns:
             None
@@ -725,13 +1278,14 @@ class HRIR:
                 else:
                     fir = fir[0].data.copy()
 
-        if len(fir.shape) == 1 or fir.shape[0] == 1:
-            # Single track in the WAV file, use it for both channels
-            fir = np.tile(fir, (2, 1))
+        if not isinstance(fir, FilterChain):
+            fir = np.asarray(fir)
+            if len(fir.shape) == 1 or fir.shape[0] == 1:
+                # Single track in the WAV file, use it for both channels
+                fir = np.tile(fir, (2, 1))
+            fir = FilterChain([fir])
 
-        for speaker, pair in self.irs.items():
-            for side, ir in pair.items():
-                ir.equalize(fir[0] if side == 'left' else fir[1])
+        self._bind(fir.apply(self.consolidate(), max_length=max_length))
 
     def resample(self, fs):
         """Resamples all impulse response to the given sampling rate.
@@ -745,7 +1299,14 @@ class HRIR:
         Returns:
             None
         """
-        for speaker, pair in self.irs.items():
-            for side, ir in pair.items():
-                ir.resample(fs)
+        if fs == self.fs:
+            return
+        data = self.consolidate()
+        self._bind(nnresample.resample(data, fs, self.fs, axis=-1).astype(data.dtype, copy=False))
+        for pair in self.irs.values():
+            for ir in pair.values():
+                if ir.harmonics is not None:
+                    ir.harmonics = nnresample.resample(
+                        ir.harmonics, fs, ir.fs, axis=-1).astype(ir.harmonics.dtype, copy=False)
+                ir.fs = fs
         self.fs = fs
@@ -2,24 +2,35 @@
 
 import os
 import re
-global copy
-import copy as _copy 
-from scipy.signal import butter, lfilter
+import json
 import argparse
+import warnings
 import sys, re
 from scipy.signal import windows 
 from tabulate import tabulate
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 from virtual_bass import synthesize_virtual_bass
 from autoeq.frequency_response import FrequencyResponse
 from impulse_response_estimator import ImpulseResponseEstimator
+from estimator_cache import EstimatorCache
+from stage_cache import StageCache
+from fir_cache import FIRCache
+from filter_chain import FilterChain
+from batch import run_batch
 from hrir import HRIR
+from exporter import BRIRExporter
 from room_correction import room_correction
 from utils import sync_axes, save_fig_as_png
-from constants import SPEAKER_NAMES, SPEAKER_LIST_PATTERN, HESUVI_TRACK_ORDER
+from artifacts import ArtifactManifest, write_artifact
+from constants import SPEAKER_NAMES, SPEAKER_LIST_PATTERN, HESUVI_TRACK_ORDER, HEXADECAGONAL_TRACK_ORDER, \
+    JAMESDSP_TRACK_ORDER, SIDES
+
+# Parameters which can be changed per variant in addition to "bass_boost" and "decay"
+VARIANT_PARAMETERS = ['tilt', 'target_level', 'channel_balance', 'fs', 'plot', 'jamesdsp', 'hangloose']
 
 def parse_early_args(arg_list):
     """
@@ -36,6 +47,46 @@ def parse_early_args(arg_list):
                          float(m.group(3))))
     return wins
 
+
+def parse_bass_boost(bass_boost):
+    """Parses bass boost argument.
+
+    Args:
+        bass_boost: Gain in dB or comma separated gain, center frequency and quality
+
+    Returns:
+        - Gain in dB
+        - Center frequency in Hz
+        - Quality
+    """
+    bass_boost = bass_boost.split(',')
+    if len(bass_boost) == 1:
+        return float(bass_boost[0]), 105, 0.76
+    elif len(bass_boost) == 3:
+        return float(bass_boost[0]), float(bass_boost[1]), float(bass_boost[2])
+    else:
+        raise ValueError('"--bass_boost" must have one value or three values separated by commas!')
+
+
+def parse_decay(decay):
+    """Parses decay argument.
+
+    Args:
+        decay: Decay time in milliseconds for all channels or comma separated channel name and decay time pairs
+
+    Returns:
+        Dict of target decay times in seconds with speaker names as keys
+    """
+    try:
+        # Single float value
+        return {ch: float(decay) / 1000 for ch in SPEAKER_NAMES}
+    except ValueError:
+        # Channels separated
+        channels = dict()
+        for ch_t in decay.split(','):
+            channels[ch_t.split(':')[0].upper()] = float(ch_t.split(':')[1]) / 1000
+        return channels
+
 def main(dir_path=None,
          test_signal=None,
          room_target=None,
@@ -61,7 +112,19 @@ def main(dir_path=None,
          itd='off',
          vbass='0',
          vp=False,
-         early_windows=None):
+         early_windows=None,
+         alignment_weighting=None,
+         estimator_cache_dir=None,
+         sweep_offset=None,
+         silence_length=None,
+         repeats=None,
+         dtype='float64',
+         stream=False,
+         mmap=False,
+         workers=1,
+         debug=False,
+         stage_cache=True,
+         variants=None):
     """"""
     if dir_path is None or not os.path.isdir(dir_path):
         raise NotADirectoryError(f'Given dir path "{dir_path}"" is not a directory.')
@@ -69,52 +132,386 @@ def main(dir_path=None,
     # Dir path as absolute
     dir_path = os.path.abspath(dir_path)
 
-    # Impulse response estimator
-    print('Creating impulse response estimator...')
-    estimator = open_impulse_response_estimator(dir_path, file_path=test_signal)
-
-    # Room correction frequency responses
-    room_frs = None
-    if do_room_correction:
-        print('Running room correction...')
-        _, room_frs = room_correction(
-            estimator, dir_path,
-            target=room_target,
-            mic_calibration=room_mic_calibration,
-            fr_combination_method=fr_combination_method,
-            specific_limit=specific_limit,
-            generic_limit=generic_limit,
-            plot=plot
+    # Output files which haven't changed since the previous run are not written again
+    n_written, n_skipped = 0, 0
+    with ArtifactManifest(dir_path) as manifest:
+        # Impulse response estimator
+        print('Creating impulse response estimator...')
+        estimator = open_impulse_response_estimator(
+            dir_path, file_path=test_signal, cache=EstimatorCache(estimator_cache_dir))
+        if silence_length is not None:
+            # Override silence length stored with the estimator
+            estimator.silence_length = silence_length
+        # Sequence layout which is not given explicitly comes from the test signal when it has one
+        sequence = estimator.sequence or dict()
+        if sweep_offset is None:
+            sweep_offset = sequence.get('sweep_offset')
+        if repeats is None:
+            repeats = sequence.get('repeats', 1)
+        if estimator.sequence is not None:
+            print(f'Sequence layout from test signal: silence length {estimator.silence_length:.1f}s, '
+                  f'sweep offset {"none" if sweep_offset is None else f"{sweep_offset:.2f}s"}, {repeats} repeats')
+        # Data type for recordings and impulse responses, FIR filter design always uses double precision
+        estimator.dtype = dtype
+
+        # Results of the processing stages are cached in the measurement directory, stage keys are chained so that only
+        # the stages downstream of a change are computed again
+        stages = StageCache(os.path.join(dir_path, '.cache', 'stages'), enabled=stage_cache)
+        estimator_key = stages.key(
+            test_signal=estimator.test_signal_hash(), fs=estimator.fs, silence_length=estimator.silence_length,
+            dtype=estimator.dtype)
+
+        # Room correction frequency responses
+        room_frs = None
+        room_key = None
+        if do_room_correction:
+            print('Running room correction...')
+            # Room measurements, target and microphone calibration, leaving out the debugging output
+            room_files = [
+                os.path.join(dir_path, f) for f in os.listdir(dir_path)
+                if f.startswith('room') and f != 'room-responses.wav']
+            room_files += [f for f in [room_target, room_mic_calibration] if f is not None]
+            room_key = stages.key(
+                estimator_key, files=stages.file_hashes(room_files), target=room_target,
+                mic_calibration=room_mic_calibration, fr_combination_method=fr_combination_method,
+                specific_limit=specific_limit, generic_limit=generic_limit, plot=plot, sweep_offset=sweep_offset,
+                repeats=repeats, stream=stream, debug=debug)
+            # Only the frequency responses are cached, room impulse responses are not needed after this
+            room_frs = stages.run('room', room_key, lambda: room_correction(
+                estimator, dir_path,
+                target=room_target,
+                mic_calibration=room_mic_calibration,
+                fr_combination_method=fr_combination_method,
+                specific_limit=specific_limit,
+                generic_limit=generic_limit,
+                plot=plot,
+                sweep_offset=sweep_offset,
+                repeats=repeats,
+                stream=stream,
+                mmap=mmap,
+                workers=workers,
+                debug=debug
+            )[1])
+
+        # Headphone compensation frequency responses
+        hp_left, hp_right = None, None
+        hp_key = None
+        if do_headphone_compensation:
+            print('Running headphone compensation...')
+            hp_key = stages.key(
+                estimator_key, files=stages.file_hashes([os.path.join(dir_path, 'headphones.wav')]),
+                sweep_offset=sweep_offset, repeats=repeats, stream=stream, debug=debug)
+            hp_left, hp_right = stages.run('headphones', hp_key, lambda: headphone_compensation(
+                estimator, dir_path, sweep_offset=sweep_offset, repeats=repeats, stream=stream, mmap=mmap, debug=debug))
+
+        # Equalization
+        eq_left, eq_right = None, None
+        if do_equalization:
+            print('Creating headphone equalization...')
+            eq_left, eq_right = equalization(estimator, dir_path)
+
+        # HRIR measurements
+        print('Opening binaural measurements...')
+        pattern = r'^{pattern}\.wav$'.format(pattern=SPEAKER_LIST_PATTERN)
+        load_key = stages.key(
+            estimator_key,
+            files=stages.file_hashes([os.path.join(dir_path, f) for f in os.listdir(dir_path) if re.match(pattern, f)]),
+            sweep_offset=sweep_offset, repeats=repeats, stream=stream)
+        hrir = stages.run('load', load_key, lambda: open_binaural_measurements(
+            estimator, dir_path, sweep_offset=sweep_offset, repeats=repeats, stream=stream, mmap=mmap,
+            workers=workers))
+
+        readme = write_readme(os.path.join(dir_path, 'README.md'), hrir, fs)
+
+        if plot:
+            # Plot graphs pre processing
+            os.makedirs(os.path.join(dir_path, 'plots', 'pre'), exist_ok=True)
+            print('Plotting BRIR graphs before processing...')
+            hrir.plot(dir_path=os.path.join(dir_path, 'plots', 'pre'))
+
+        # Crop and align
+        crop_key = stages.key(
+            load_key, head_ms=head_ms, itd=itd, vbass=vbass, vp=vp, early_windows=early_windows,
+            alignment_weighting=alignment_weighting)
+        hrir = stages.run('crop', crop_key, lambda: crop_and_align(
+            hrir, head_ms=head_ms, itd=itd, vbass=vbass, vp=vp, early_windows=early_windows,
+            alignment_weighting=alignment_weighting))
+
+        if debug:
+            # Write multi-channel WAV file with impulse responses before equalization for debugging
+            hrir.write_wav(os.path.join(dir_path, 'responses.wav'))
+
+        # Everything above is shared by all variants, equalization inputs are part of the key of the variant stages
+        shared = dict(
+            estimator=estimator,
+            hrir=hrir,
+            room_frs=room_frs,
+            hp_left=hp_left,
+            hp_right=hp_right,
+            eq_left=eq_left,
+            eq_right=eq_right,
+            equalize=do_headphone_compensation or do_room_correction or do_equalization,
+            # Persisted next to the stage cache, in memory only when the stage cache is disabled
+            fir_cache=FIRCache(os.path.join(dir_path, '.cache', 'firs.pkl') if stage_cache else None),
+            parent_key=stages.key(
+                crop_key, room_key, hp_key,
+                files=stages.file_hashes([
+                    os.path.join(dir_path, f) for f in ['eq.wav', 'eq.csv', 'eq-left.csv', 'eq-right.csv']]),
+                do_equalization=do_equalization),
+        )
+        params = dict(
+            bass_boost_gain=bass_boost_gain,
+            bass_boost_fc=bass_boost_fc,
+            bass_boost_q=bass_boost_q,
+            tilt=tilt,
+            decay=decay,
+            channel_balance=channel_balance,
+            target_level=target_level,
+            fs=fs,
+            plot=plot,
+            jamesdsp=jamesdsp,
+            hangloose=hangloose,
         )
 
-    # Headphone compensation frequency responses
-    hp_left, hp_right = None, None
-    if do_headphone_compensation:
-        print('Running headphone compensation...')
-        hp_left, hp_right = headphone_compensation(estimator, dir_path)
+        if variants is None:
+            render_brirs(dir_path, stages=stages, workers=workers, **shared, **params)
+        else:
+            # Each variant has its own output directory, stage cache and manifest and is rendered in a separate process
+            variant_params = read_variants(variants, defaults=params)
+            print(f'Rendering {len(variant_params)} variants...')
+            with ProcessPoolExecutor(max_workers=min(workers, len(variant_params))) as executor:
+                futures = []
+                for name, kwargs in variant_params.items():
+                    futures.append(executor.submit(
+                        render_variant,
+                        os.path.join(dir_path, 'variants', name),
+                        stages=StageCache(os.path.join(stages.dir_path, 'variants', name), enabled=stage_cache),
+                        **shared, **kwargs))
+                for name, future in zip(variant_params.keys(), futures):
+                    written, skipped = future.result()
+                    print(f'Variant "{name}": wrote {written} output files, {skipped} unchanged files were not '
+                          f'rewritten.')
+                    n_written += written
+                    n_skipped += skipped
+
+        print(readme)
+    n_written += manifest.n_written
+    n_skipped += manifest.n_skipped
+    print(f'Wrote {n_written} output files, {n_skipped} unchanged files were not rewritten.')
+
+
+def render_brirs(dir_path, estimator, hrir, room_frs=None, hp_left=None, hp_right=None, eq_left=None, eq_right=None,
+                 equalize=True, parent_key=None, stages=None, fir_cache=None, bass_boost_gain=0.0, bass_boost_fc=105,
+                 bass_boost_q=0.76, tilt=0.0, decay=None, channel_balance=None, target_level=None, fs=None, plot=False,
+                 jamesdsp=False, hangloose=False, workers=1):
+    """Equalizes, adjusts decay, corrects channel balance, normalizes and writes the BRIRs.
+
+    Args:
+        dir_path: Path to output directory
+        estimator: ImpulseResponseEstimator instance
+        hrir: Cropped and aligned HRIR instance, modified in place
+        room_frs: Room correction frequency responses as dict of dicts or None
+        hp_left: Left side headphone compensation FrequencyResponse or None
+        hp_right: Right side headphone compensation FrequencyResponse or None
+        eq_left: Left side equalization FrequencyResponse or None
+        eq_right: Right side equalization FrequencyResponse or None
+        equalize: Equalize impulse responses?
+        parent_key: Stage key of the cropped HRIR and the equalization inputs
+        stages: StageCache instance, nothing is cached when None
+        fir_cache: FIRCache instance for the equalization and channel balance filters or None
+        bass_boost_gain: Bass boost shelf gain in dB
+        bass_boost_fc: Bass boost shelf center frequency in Hz
+        bass_boost_q: Bass boost shelf quality
+        tilt: Target tilt in dB/octave
+        decay: Dict of target decay times in seconds with speaker names as keys or None
+        channel_balance: Channel balance correction method or None
+        target_level: Target average gain level in dB or None for peak normalization
+        fs: Output sampling rate or None to keep the input sampling rate
+        plot: Plot graphs after processing?
+        jamesdsp: Write jamesdsp.wav with FL and FR only?
+        hangloose: Write Hangloose files, one per speaker?
+        workers: Number of output files written in parallel
 
-    # Equalization
-    eq_left, eq_right = None, None
-    if do_equalization:
-        print('Creating headphone equalization...')
-        eq_left, eq_right = equalization(estimator, dir_path)
+    Returns:
+        None
+    """
+    if stages is None:
+        stages = StageCache(None, enabled=False)
 
     # Bass boost and tilt
     print('Creating frequency response target...')
     target = create_target(estimator, bass_boost_gain, bass_boost_fc, bass_boost_q, tilt)
 
-    # HRIR measurements
-    print('Opening binaural measurements...')
-    hrir = open_binaural_measurements(estimator, dir_path)
+    # Equalize all
+    eq_key = parent_key
+    if equalize:
+        print('Equalizing...')
+        eq_key = stages.key(
+            parent_key, bass_boost_gain=bass_boost_gain, bass_boost_fc=bass_boost_fc, bass_boost_q=bass_boost_q,
+            tilt=tilt)
+        hrir = stages.run('eq', eq_key, lambda: equalize_hrir(
+            estimator, hrir, target, room_frs=room_frs, hp_left=hp_left, hp_right=hp_right, eq_left=eq_left,
+            eq_right=eq_right, fir_cache=fir_cache))
+
+    # Adjust decay time
+    decay_key = eq_key
+    if decay:
+        print('Adjusting decay time...')
+        decay_key = stages.key(eq_key, decay=decay)
+        hrir = stages.run('decay', decay_key, lambda: adjust_decay(hrir, decay))
+
+    # Correct channel balance
+    if channel_balance is not None:
+        print('Correcting channel balance...')
+        balance_key = stages.key(decay_key, channel_balance=channel_balance)
+        # Balance filters don't make the impulse responses longer than equalization did
+        hrir = stages.run('balance', balance_key, lambda: correct_channel_balance(
+            hrir, channel_balance, fir_cache=fir_cache, max_length=hrir.consolidate().shape[-1]))
 
-    readme = write_readme(os.path.join(dir_path, 'README.md'), hrir, fs)
+    # Normalize gain
+    print('Normalizing gain...')
+    hrir.normalize(peak_target=None if target_level is not None else -0.1, avg_target=target_level)
 
     if plot:
-        # Plot graphs pre processing
-        os.makedirs(os.path.join(dir_path, 'plots', 'pre'), exist_ok=True)
-        print('Plotting BRIR graphs before processing...')
-        hrir.plot(dir_path=os.path.join(dir_path, 'plots', 'pre'))
+        print('Plotting BRIR graphs after processing...')
+        # Convolve test signal with all impulse responses at once, re-plot waveform and spectrogram
+        recordings = FilterChain([estimator.test_signal]).apply(hrir.consolidate())
+        for speaker, pair in hrir.irs.items():
+            for side, ir in pair.items():
+                ir.recording = recordings[hrir.index[speaker], SIDES.index(side)]
+        # Plot post processing
+        hrir.plot(os.path.join(dir_path, 'plots', 'post'))
+
+    # Plot results, always
+    print('Plotting results...')
+    hrir.plot_result(os.path.join(dir_path, 'plots'))
+
+    # Re-sample
+    if fs is not None and fs != hrir.fs:
+        print(f'Resampling BRIR to {fs} Hz')
+        hrir.resample(fs)
+        hrir.normalize(peak_target=None if target_level is not None else -0.1, avg_target=target_level)
+
+    # Write BRIRs in all requested layouts, every layout is a permutation of the same channel matrix
+    print('Writing BRIRs...')
+    exporter = BRIRExporter(hrir)
+    # Multi-channel WAV file with standard track order
+    exporter.add(os.path.join(dir_path, 'hrir.wav'), HEXADECAGONAL_TRACK_ORDER)
+    # Multi-channel WAV file with HeSuVi track order
+    exporter.add(os.path.join(dir_path, 'hesuvi.wav'), HESUVI_TRACK_ORDER)
+
+    jamesdsp_speakers = [sp for sp in ['FL', 'FR'] if sp in hrir.irs]
+    if jamesdsp and not jamesdsp_speakers:
+        warnings.warn('Skipping jamesdsp.wav because FL and FR measurements are missing.')
+    elif jamesdsp:
+        print('Generating jamesdsp.wav (FL/FR only, normalized to FL/FR)...')
+        # FL and FR only, normalized as if the other speakers didn't exist
+        gain = hrir.normalization_gain(
+            peak_target=None if target_level is not None else -0.1,
+            avg_target=target_level,
+            speakers=jamesdsp_speakers
+        )
+        exporter.add(os.path.join(dir_path, 'jamesdsp.wav'), JAMESDSP_TRACK_ORDER, gain=gain)
+
+    if hangloose:
+        output_dir = os.path.join(dir_path, 'hangloose')
+        os.makedirs(output_dir, exist_ok=True)
+        # One file per speaker in the speaker order of hrir.wav
+        for sp in HEXADECAGONAL_TRACK_ORDER[::2]:
+            sp = sp.split('-')[0]
+            if sp in hrir.irs:
+                exporter.add(os.path.join(output_dir, f'{sp}.wav'), [f'{sp}-left', f'{sp}-right'])
+                print(f'[Hangloose] 생성됨: {os.path.join(output_dir, f"{sp}.wav")}')
+        # LFE tracks are FL and FR low-passed at 120 Hz and boosted by 10 dB
+        for sp, file_name in [('FL', 'LFEL.wav'), ('FR', 'LFER.wav')]:
+            if sp in hrir.irs:
+                exporter.add_lfe(os.path.join(output_dir, file_name), sp, fc=120, gain=10.0)
+                print(f'[LFE 변환] 생성됨: {os.path.join(output_dir, file_name)}')
+
+    exporter.write(workers=workers)
+
+    if fir_cache is not None:
+        fir_cache.save()
+
+
+def render_variant(dir_path, **kwargs):
+    """Renders one variant into its own directory with its own artifact manifest. Run in a worker process.
+
+    Args:
+        dir_path: Path to variant output directory
+        **kwargs: Keyword arguments for `render_brirs()`
+
+    Returns:
+        - Number of written output files
+        - Number of unchanged output files which were not rewritten
+    """
+    os.makedirs(os.path.join(dir_path, 'plots'), exist_ok=True)
+    with ArtifactManifest(dir_path) as manifest:
+        render_brirs(dir_path, **kwargs)
+    return manifest.n_written, manifest.n_skipped
 
+
+def read_variants(file_path, defaults):
+    """Reads variant parameters from a JSON or YAML file.
+
+    The file maps variant names to parameters which override the defaults. Parameters are "bass_boost", "tilt",
+    "target_level", "decay", "channel_balance", "fs", "plot", "jamesdsp" and "hangloose". "bass_boost" and "decay"
+    take the same values as the command line arguments. YAML files require PyYAML.
+
+    Args:
+        file_path: Path to JSON or YAML file
+        defaults: Dict of default parameters for `render_brirs()`
+
+    Returns:
+        Dict of `render_brirs()` parameters with variant names as keys
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        if os.path.splitext(file_path)[1].lower() in ['.yaml', '.yml']:
+            try:
+                import yaml
+            except ImportError as err:
+                raise ImportError('Reading YAML variant files requires PyYAML, use JSON instead.') from err
+            variants = yaml.safe_load(f)
+        else:
+            variants = json.load(f)
+
+    if not isinstance(variants, dict) or not variants:
+        raise ValueError(f'Variants file "{file_path}" must map variant names to parameters.')
+    params = dict()
+    for name, variant in variants.items():
+        name = str(name)
+        if name in ['', '.', '..'] or re.search(r'[\\/:]', name):
+            raise ValueError(f'Variant name "{name}" is not a valid directory name.')
+        variant = dict(variant or {})
+        kwargs = dict(defaults)
+        if 'bass_boost' in variant:
+            kwargs['bass_boost_gain'], kwargs['bass_boost_fc'], kwargs['bass_boost_q'] = parse_bass_boost(
+                str(variant.pop('bass_boost')))
+        if 'decay' in variant:
+            kwargs['decay'] = parse_decay(str(variant.pop('decay')))
+        unknown = [key for key in variant if key not in VARIANT_PARAMETERS]
+        if unknown:
+            raise ValueError(f'Unknown parameters {unknown} in variant "{name}".')
+        kwargs.update(variant)
+        params[name] = kwargs
+    return params
+
+
+def crop_and_align(hrir, head_ms=1, itd='off', vbass=0, vp=False, early_windows=None, alignment_weighting=None):
+    """Crops heads and tails of the impulse responses and aligns them.
+
+    Args:
+        hrir: HRIR instance, modified in place
+        head_ms: Milliseconds of head room in the beginning before impulse response max which will not be cropped
+        itd: Inter-aural time difference handling, "e", "l", "a" or "off"
+        vbass: Virtual bass crossover frequency in Hz, 0 disables
+        vp: Invert polarity of the virtual bass signal?
+        early_windows: List of (start ms, end ms, gain dB) tuples for early window gain adjustments
+        alignment_weighting: Cross-correlation weighting for aligning the left and right side speakers, None or "phat"
+
+    Returns:
+        HRIR instance
+    """
     # Crop noise and harmonics from the beginning
     print('Cropping impulse responses...')
     hrir.crop_heads(head_ms=head_ms)
@@ -122,7 +519,8 @@ def main(dir_path=None,
         speaker_pairs=[('FL','FR'), ('SL','SR'), ('BL','BR'),
                         ('TFL','TFR'), ('TSL','TSR'), ('TBL','TBR'),
                         ('FC','FC'), ('WL','WR')],
-        segment_ms=30
+        segment_ms=30,
+        weighting=alignment_weighting
     )
     hrir.align_onset_groups_peak_leftref()
 
@@ -151,24 +549,22 @@ def main(dir_path=None,
                     fs   = ir.fs
 
                 # 1) ITD 샘플 차이 계산
-                    itd = abs(pair['left'].peak_index()
-                              - pair['right'].peak_index())
+                    # Peaks of the impulse responses which haven't changed are memoized, the first call of each window
+                    # searches all of them at once and the later calls only the impulse responses adjusted since
+                    peak_indices = hrir.peak_indices()
+                    itd = abs(peak_indices[(speaker, 'left')]
+                              - peak_indices[(speaker, 'right')])
 
                 # 2) cross-channel 판정
                     is_cross = ((side=='right' and speaker.endswith('L')) or
                                 (side=='left'  and speaker.endswith('R')))
 
-                # 3) aligned 배열 준비
-                    if is_cross:
-                        # cross-channel: 앞당겨서 복사본 생성
-                        aligned = np.roll(data, -itd)
-                    else:
-                        # direct channel: 원본 배열 그대로 사용
-                        aligned = data
+                # 3) cross-channel은 ITD만큼 늦게 도착하므로 윈도우도 같은 만큼 뒤로 이동
+                    offset = itd if is_cross else 0
 
                     # 4) 윈도우 구간 계산
-                    s = int(start_ms * fs / 1000)
-                    e = int(end_ms   * fs / 1000)
+                    s = int(start_ms * fs / 1000) + offset
+                    e = int(end_ms   * fs / 1000) + offset
                     N = e - s
 
                     # 5)
@@ -177,186 +573,123 @@ def main(dir_path=None,
                     g = 10**(gain_db / 20)
                     k = g - 1
 
-                    # 6) 부드러운 가감산 적용
-                    segment = aligned[s:e]
-                    aligned[s:e] = segment + k * w * segment
+                    # 6) 부드러운 가감산을 원본 배열에 in-place로 적용
+                    segment = data[s:e]
+                    segment += k * w[:len(segment)] * segment
+                    ir.touch()
 
-                    # 7) 결과를 ir.data에 반영
-                    if is_cross:
-                        # cross-channel: 다시 원위치로 롤 복원
-                        ir.data = np.roll(aligned, itd)
-                    else:
-                        # direct: aligned가 data alias이므로 이미 in-place로 반영됨
-                        ir.data = aligned
+    return hrir
 
- 
-  # 디버깅용 responses.wav 출력
-    hrir.write_wav(os.path.join(dir_path, 'responses.wav'))
 
-    # Write multi-channel WAV file with sine sweeps for debugging
-    hrir.write_wav(os.path.join(dir_path, 'responses.wav'))
+def equalize_hrir(estimator, hrir, target, room_frs=None, hp_left=None, hp_right=None, eq_left=None, eq_right=None,
+                  fir_cache=None):
+    """Equalizes impulse responses with room correction, headphone compensation and equalization.
 
-    # Equalize all
-    if do_headphone_compensation or do_room_correction or do_equalization:
-        print('Equalizing...')
-        for speaker, pair in hrir.irs.items():
-            for side, ir in pair.items():
-                fr = FrequencyResponse(
-                    name=f'{speaker}-{side} eq',
-                    frequency=FrequencyResponse.generate_frequencies(f_step=1.01, f_min=10, f_max=estimator.fs / 2),
-                    raw=0, error=0
-                )
+    Args:
+        estimator: ImpulseResponseEstimator instance
+        hrir: HRIR instance, modified in place
+        target: Bass boost and tilt target FrequencyResponse
+        room_frs: Room correction frequency responses as dict of dicts or None
+        hp_left: Left side headphone compensation FrequencyResponse or None
+        hp_right: Right side headphone compensation FrequencyResponse or None
+        eq_left: Left side equalization FrequencyResponse or None
+        eq_right: Right side equalization FrequencyResponse or None
+        fir_cache: FIRCache instance for the equalization filters, identical filters are designed once when None
+
+    Returns:
+        HRIR instance
+    """
+    if fir_cache is None:
+        fir_cache = FIRCache()
+    firs = dict()
+    for speaker, pair in hrir.irs.items():
+        for side, ir in pair.items():
+            fr = FrequencyResponse(
+                name=f'{speaker}-{side} eq',
+                frequency=FrequencyResponse.generate_frequencies(f_step=1.01, f_min=10, f_max=estimator.fs / 2),
+                raw=0, error=0
+            )
 
-                if room_frs is not None and speaker in room_frs and side in room_frs[speaker]:
-                    # Room correction
-                    fr.error += room_frs[speaker][side].error
+            if room_frs is not None and speaker in room_frs and side in room_frs[speaker]:
+                # Room correction
+                fr.error += room_frs[speaker][side].error
 
-                hp_eq = hp_left if side == 'left' else hp_right
-                if hp_eq is not None:
-                    # Headphone compensation
-                    fr.error += hp_eq.error
+            hp_eq = hp_left if side == 'left' else hp_right
+            if hp_eq is not None:
+                # Headphone compensation
+                fr.error += hp_eq.error
 
-                eq = eq_left if side == 'left' else eq_right
-                if eq is not None and type(eq) == FrequencyResponse:
-                    # Equalization
-                    fr.error += eq.error
+            eq = eq_left if side == 'left' else eq_right
+            if eq is not None and type(eq) == FrequencyResponse:
+                # Equalization
+                fr.error += eq.error
 
-                # Remove bass and tilt target from the error
-                fr.error -= target.raw
+            # Remove bass and tilt target from the error
+            fr.error -= target.raw
 
+            def design():
                 # Smoothen and equalize
                 fr.smoothen_heavy_light()
                 fr.equalize(max_gain=40, treble_f_lower=10000, treble_f_upper=estimator.fs / 2)
+                # Create FIR filter
+                return fr.minimum_phase_impulse_response(fs=estimator.fs, normalize=False, f_res=5)
 
-                # Create FIR filter and equalize
-                fir = fr.minimum_phase_impulse_response(fs=estimator.fs, normalize=False, f_res=5)
-                ir.equalize(fir)
-
-    # Adjust decay time
-    if decay:
-        print('Adjusting decay time...')
-        for speaker, pair in hrir.irs.items():
-            for side, ir in pair.items():
-                if speaker in decay:
-                    ir.adjust_decay(decay[speaker])
-
-    # Correct channel balance
-    if channel_balance is not None:
-        print('Correcting channel balance...')
-        hrir.correct_channel_balance(channel_balance)
-
-    # Normalize gain
-    print('Normalizing gain...')
-    hrir.normalize(peak_target=None if target_level is not None else -0.1, avg_target=target_level)
+            # Speakers without specific room correction share the same error curve on each side
+            firs[(speaker, side)] = fir_cache.design(
+                design, fr.frequency, fr.error, method='equalize', fs=estimator.fs, max_gain=40, treble_f_lower=10000,
+                f_res=5)
 
-    if plot:
-        print('Plotting BRIR graphs after processing...')
-        # Convolve test signal, re-plot waveform and spectrogram
-        for speaker, pair in hrir.irs.items():
-            for side, ir in pair.items():
-                ir.recording = ir.convolve(estimator.test_signal)
-        # Plot post processing
-        hrir.plot(os.path.join(dir_path, 'plots', 'post'))
+    # Equalize all impulse responses at once, filters are zero padded to the same length
+    hrir.consolidate()
+    fir = np.zeros((len(hrir.index), len(SIDES), max(len(f) for f in firs.values())))
+    for (speaker, side), f in firs.items():
+        fir[hrir.index[speaker], SIDES.index(side), :len(f)] = f
+    hrir.equalize(fir)
 
-    # Plot results, always
-    print('Plotting results...')
-    hrir.plot_result(os.path.join(dir_path, 'plots'))
-
-    # Re-sample
-    if fs is not None and fs != hrir.fs:
-        print(f'Resampling BRIR to {fs} Hz')
-        hrir.resample(fs)
-        hrir.normalize(peak_target=None if target_level is not None else -0.1, avg_target=target_level)
-
-    # Write multi-channel WAV file with standard track order
-    print('Writing BRIRs...')
-    hrir.write_wav(os.path.join(dir_path, 'hrir.wav'))
-
-    # Write multi-channel WAV file with HeSuVi track order
-    hrir.write_wav(os.path.join(dir_path, 'hesuvi.wav'), track_order=HESUVI_TRACK_ORDER)
-
-    print(readme)
-
-
-    if jamesdsp:
-        print('Generating jamesdsp.wav (FL/FR only, normalized to FL/FR)...')
-        import copy, contextlib, io
-
-        # 전체 HRIR 복사 후 FL/FR 외 모든 채널 제거
-        dsp_hrir = copy.deepcopy(hrir)
-        for sp in list(dsp_hrir.irs.keys()):
-            if sp not in ['FL', 'FR']:
-                del dsp_hrir.irs[sp]
-
-        with contextlib.redirect_stdout(io.StringIO()):
-            dsp_hrir.normalize(
-                peak_target=None if target_level is not None else -0.1,
-                avg_target=target_level
-            )
-
-        # FL‑L, FL‑R, FR‑L, FR‑R 순서로 파일 생성
-        jd_order = ['FL-left', 'FL-right', 'FR-left', 'FR-right']
-        out_path = os.path.join(dir_path, 'jamesdsp.wav')
-        dsp_hrir.write_wav(out_path, track_order=jd_order)
-
-    if hangloose:
-        from scipy.io import wavfile
-
-        output_dir = os.path.join(dir_path, 'hangloose')
-        os.makedirs(output_dir, exist_ok=True)
+    return hrir
 
-        # Hrir.wav 기준 최대 채널 순서
-        full_order = [
-            'FL','FR','FC','LFE','BL','BR','SL','SR',
-            'WL','WR','TFL','TFR','TSL','TSR','TBL','TBR'
-        ]
-        processed = [sp for sp in full_order if sp in hrir.irs]
-
-        # 1) 스피커별 WAV 생성 (FC도 포함)
-        for sp in processed:
-            single = _copy.deepcopy(hrir)
-            for other in list(single.irs.keys()):
-                if other != sp:
-                    del single.irs[other]
-
-            track_order = [f'{sp}-left', f'{sp}-right']
-            out_path     = os.path.join(output_dir, f'{sp}.wav')
-            single.write_wav(out_path, track_order=track_order)
-            print(f'[Hangloose] 생성됨: {out_path}')
-
-        # 2) FL.wav 과 FR.wav 읽어서 각각 LFEL.wav, LFR.wav 생성
-        for sp, out_name in [('FL', 'LFEL.wav'), ('FR', 'LFER.wav')]:
-            src_path = os.path.join(output_dir, f'{sp}.wav')
-            if not os.path.isfile(src_path):
-                continue
 
-            # 2.1) 읽기
-            fs_read, data = wavfile.read(src_path)  # data.shape == (N, 2)
+def adjust_decay(hrir, decay):
+    """Adjusts decay times of the impulse responses.
 
-            # 2.2) 120 Hz 로우패스 필터 설계
-            b, a = butter(4, 120/(fs_read/2), btype='low', analog=False)
-            gain_lin = 10**(10/20)  # +10 dB
+    Args:
+        hrir: HRIR instance, modified in place
+        decay: Dict of target decay times in milliseconds with speaker names as keys
 
-            # 2.3) 좌/우 채널 필터링 + 게인 적용
-            filtered_l = lfilter(b, a, data[:, 0]) * gain_lin
-            filtered_r = lfilter(b, a, data[:, 1]) * gain_lin
+    Returns:
+        HRIR instance
+    """
+    params = hrir.decay_params()
+    for speaker, pair in hrir.irs.items():
+        for side, ir in pair.items():
+            if speaker in decay:
+                ir.adjust_decay(decay[speaker], decay_params=params[(speaker, side)])
+    return hrir
 
-            # 2.4) 저장
-            out_path = os.path.join(output_dir, out_name)
-            lfe_data = np.vstack((filtered_l, filtered_r)).T.astype(data.dtype)
-            wavfile.write(out_path, fs_read, lfe_data)
-            print(f'[LFE 변환] 생성됨: {out_path}')
 
+def correct_channel_balance(hrir, method, fir_cache=None, max_length=None):
+    """Corrects channel balance of the impulse responses, see `HRIR.correct_channel_balance()`.
 
+    Args:
+        hrir: HRIR instance, modified in place
+        method: Channel balance correction method
+        fir_cache: FIRCache instance for the channel balance filters or None
+        max_length: Maximum length of the impulse responses after filtering, full convolution length when None
 
+    Returns:
+        HRIR instance
+    """
+    hrir.correct_channel_balance(method, fir_cache=fir_cache, max_length=max_length)
+    return hrir
 
 
-def open_impulse_response_estimator(dir_path, file_path=None):
+def open_impulse_response_estimator(dir_path, file_path=None, cache=None):
     """Opens impulse response estimator from a file
 
     Args:
         dir_path: Path to directory
         file_path: Explicitly given (if any) path to impulse response estimator Pickle or test signal WAV file
+        cache: EstimatorCache instance for test signal and inverse filter of WAV file test signals
 
     Returns:
         ImpulseResponseEstimator instance
@@ -369,7 +702,7 @@ def open_impulse_response_estimator(dir_path, file_path=None):
             file_path = os.path.join(dir_path, 'test.wav')
     if re.match(r'^.+\.wav$', file_path, flags=re.IGNORECASE):
         # Test signal is WAV file
-        estimator = ImpulseResponseEstimator.from_wav(file_path)
+        estimator = ImpulseResponseEstimator.from_wav(file_path, cache=cache)
     elif re.match(r'^.+\.pkl$', file_path, flags=re.IGNORECASE):
         # Test signal is Pickle file
         estimator = ImpulseResponseEstimator.from_pickle(file_path)
@@ -437,20 +770,30 @@ def equalization(estimator, dir_path):
     return left_fr, right_fr
 
 
-def headphone_compensation(estimator, dir_path):
+def headphone_compensation(estimator, dir_path, sweep_offset=None, repeats=1, stream=False, mmap=False,
+                           debug=False):
     """Equalizes HRIR tracks with headphone compensation measurement.
 
     Args:
         estimator: ImpulseResponseEstimator instance
         dir_path: Path to output directory
+        sweep_offset: Time in seconds between starts of consecutive overlapping sweeps in the headphone recording.
+                      None when sweeps are separated by silence.
+        repeats: Number of consecutive sweeps (takes) for each side in the headphone recording.
+        stream: Read and deconvolve the recording in blocks instead of reading the whole file into memory.
+        mmap: Read the sweep windows through a memory mapped view of the file.
+        debug: Write headphone impulse responses to headphone-responses.wav?
 
     Returns:
         None
     """
     # Read WAV file
     hp_irs = HRIR(estimator)
-    hp_irs.open_recording(os.path.join(dir_path, 'headphones.wav'), speakers=['FL', 'FR'])
-    hp_irs.write_wav(os.path.join(dir_path, 'headphone-responses.wav'))
+    hp_irs.open_recording(
+        os.path.join(dir_path, 'headphones.wav'), speakers=['FL', 'FR'], sweep_offset=sweep_offset, repeats=repeats,
+        stream=stream, mmap=mmap)
+    if debug:
+        hp_irs.write_wav(os.path.join(dir_path, 'headphone-responses.wav'))
 
     # Frequency responses
     left = hp_irs.irs['FL']['left'].frequency_response()
@@ -537,25 +880,35 @@ def create_target(estimator, bass_boost_gain, bass_boost_fc, bass_boost_q, tilt)
     return target
 
 
-def open_binaural_measurements(estimator, dir_path):
+def open_binaural_measurements(estimator, dir_path, sweep_offset=None, repeats=1, stream=False, mmap=False,
+                               workers=1):
     """Opens binaural measurement WAV files.
 
     Args:
         estimator: ImpulseResponseEstimator
         dir_path: Path to directory
+        sweep_offset: Time in seconds between starts of consecutive overlapping sweeps. None when sweeps are separated
+                      by silence.
+        repeats: Number of consecutive sweeps (takes) for each speaker.
+        stream: Read and deconvolve the recordings in blocks instead of reading whole files into memory.
+        mmap: Read the sweep windows through memory mapped views of the files.
+        workers: Number of recording files read and deconvolved in parallel.
 
     Returns:
         HRIR instance
     """
     hrir = HRIR(estimator)
     pattern = r'^{pattern}\.wav$'.format(pattern=SPEAKER_LIST_PATTERN)  # FL,FR.wav
-    for file_name in [f for f in os.listdir(dir_path) if re.match(pattern, f)]:
+    recordings = []
+    for file_name in sorted(f for f in os.listdir(dir_path) if re.match(pattern, f)):
         # Read the speaker names from the file name into a list
         speakers = re.search(SPEAKER_LIST_PATTERN, file_name)[0].split(',')
         # Form absolute path
         file_path = os.path.join(dir_path, file_name)
-        # Open the file and add tracks to HRIR
-        hrir.open_recording(file_path, speakers=speakers)
+        recordings.append((file_path, speakers, None))
+    # Open the files and add tracks to HRIR
+    hrir.open_recordings(
+        recordings, workers=workers, sweep_offset=sweep_offset, repeats=repeats, stream=stream, mmap=mmap)
     if len(hrir.irs) == 0:
         raise ValueError('No HRIR recordings found in the directory.')
     return hrir
@@ -579,14 +932,16 @@ def write_readme(file_path, hrir, fs):
     rt = None
     table = []
     speaker_names = sorted(hrir.irs.keys(), key=lambda x: SPEAKER_NAMES.index(x))
+    params = hrir.decay_params()
+    peak_indices = hrir.peak_indices()
     for speaker in speaker_names:
         pair = hrir.irs[speaker]
-        itd = np.abs(pair['right'].peak_index() - pair['left'].peak_index()) / hrir.fs * 1e6
+        itd = np.abs(peak_indices[(speaker, 'right')] - peak_indices[(speaker, 'left')]) / hrir.fs * 1e6
         for side, ir in pair.items():
             # Zero for the first ear
             _itd = itd if side == 'left' and speaker[1] == 'R' or side == 'right' and speaker[1] == 'L' else 0.0
             # Use the largest decay time parameter available
-            peak_ind, knee_point_ind, noise_floor, window_size = ir.decay_params()
+            peak_ind, knee_point_ind, noise_floor, window_size = params[(speaker, side)]
             edt, rt20, rt30, rt60 = ir.decay_times(peak_ind, knee_point_ind, noise_floor, window_size)
             if rt60 is not None:
                 rt_name = 'RT60'
@@ -633,6 +988,24 @@ def write_readme(file_path, hrir, fs):
         )
     energy_str = "\n" + "\n".join(energy_lines)
 
+    # Total harmonic distortion by octave bands from the harmonic impulse responses
+    thd_table = []
+    thd_frequencies = None
+    for speaker in speaker_names:
+        for side, ir in hrir.irs[speaker].items():
+            thd = ir.harmonic_distortion()
+            if thd is None:
+                continue
+            thd_frequencies = [fc for fc, _ in thd]
+            thd_table.append([speaker, side] + [f'{value:.2f} %' for _, value in thd])
+    thd_str = ''
+    if thd_table:
+        thd_str = '\n**Total harmonic distortion:**\n\n' + tabulate(
+            thd_table,
+            headers=['Speaker', 'Side'] + [f'{fc} Hz' if fc < 1000 else f'{fc // 1000} kHz' for fc in thd_frequencies],
+            tablefmt='github'
+        )
+
     s = f'''# HRIR
 
     **Date:** {datetime.now().strftime('%Y-%m-%d %H:%M')}  
@@ -641,11 +1014,11 @@ def write_readme(file_path, hrir, fs):
 
     {table_str}
     {energy_str}
+    {thd_str}
     '''
     s = re.sub('\n[ \t]+', '\n', s).strip()
 
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(s)
+    write_artifact(file_path, s.encode('utf-8'))
 
     return s
 
@@ -660,7 +1033,16 @@ def create_cli():
                             help='Generate an additional jamesdsp.wav containing only FL/FR IRs.')
     arg_parser.add_argument('--hangloose', action='store_true',
                    help='채널별 Hangloose 파일(스피커별 좌/우 WAV) 생성')    
-    arg_parser.add_argument('--dir_path', type=str, required=True, help='Path to directory for recordings and outputs.')
+    arg_parser.add_argument('--dir_path', type=str, default=argparse.SUPPRESS,
+                            help='Path to directory for recordings and outputs.')
+    arg_parser.add_argument('--batch', type=str, nargs='+', default=argparse.SUPPRESS,
+                            help='Paths or glob patterns of measurement directories to process instead of a single '
+                                 '"--dir_path". Directories are processed in parallel by "--workers" processes with '
+                                 'the same arguments, output of each directory is written to impulcifer.log in it. '
+                                 'A failing directory doesn\'t stop the others.')
+    arg_parser.add_argument('--batch_summary', type=str, default=argparse.SUPPRESS,
+                            help='Path to Markdown file for the batch summary table with the status and processing '
+                                 'time of each directory. The table is always printed.')
     arg_parser.add_argument('--test_signal', type=str, default=argparse.SUPPRESS,
                             help='Path to sine sweep test signal or pickled impulse response estimator.')
     arg_parser.add_argument('--room_target', type=str, default=argparse.SUPPRESS,
@@ -734,33 +1116,77 @@ def create_cli():
                     help='Enable virtual bass – value is XO freq in Hz (0 = off)')
     arg_parser.add_argument('--vp', action='store_true',
                             help='Invert polarity of the virtual bass signal.')
+    arg_parser.add_argument('--alignment_weighting', type=str, default=argparse.SUPPRESS, choices=['phat'],
+                            help='Cross-correlation weighting for aligning the left and right side speakers. "phat" '
+                                 'uses generalized cross-correlation with phase transform (GCC-PHAT) which whitens '
+                                 'the spectra and gives a sharper correlation peak in reverberant rooms. Plain '
+                                 'cross-correlation is used by default.')
+    arg_parser.add_argument('--estimator_cache_dir', type=str, default=argparse.SUPPRESS,
+                            help='Path to directory where generated test signals and inverse filters are cached. '
+                                 'Defaults to ".cache/impulcifer/estimators" in the user\'s home directory.')
+    arg_parser.add_argument('--sweep_offset', type=float, default=argparse.SUPPRESS,
+                            help='Time in seconds between starts of consecutive sweeps when the binaural, '
+                                 'speaker-ear specific room and headphone recordings were made with overlapping '
+                                 'sweeps (multiple exponential sweep method). Must be the same value which was used '
+                                 'to create the sweep sequence. Read from the test signal when it was created '
+                                 'together with the sweep sequence or when the sweep sequence is used as the test '
+                                 'signal, otherwise sweeps are expected to be separated by silence.')
+    arg_parser.add_argument('--silence_length', type=float, default=argparse.SUPPRESS,
+                            help='Length of silence in seconds before the first sweep and after each sweep in the '
+                                 'recordings. Must be the same value which was used to create the sweep sequence. '
+                                 'Read from the test signal like "--sweep_offset", otherwise defaults to 2.0 '
+                                 'seconds.')
+    arg_parser.add_argument('--repeats', type=int, default=argparse.SUPPRESS,
+                            help='Number of consecutive sweeps for each speaker in the binaural, speaker-ear '
+                                 'specific room and headphone recordings. Takes are aligned and averaged. Must be the '
+                                 'same value which was used to create the sweep sequence. Read from the test signal '
+                                 'like "--sweep_offset", otherwise defaults to 1.')
+    arg_parser.add_argument('--dtype', type=str, default=argparse.SUPPRESS, choices=['float32', 'float64'],
+                            help='Data type for reading recordings and processing impulse responses. "float32" halves '
+                                 'the memory use and speeds up deconvolution at the cost of precision. Defaults to '
+                                 '"float64".')
+    arg_parser.add_argument('--stream', action='store_true', default=argparse.SUPPRESS,
+                            help='Read and deconvolve the recordings in blocks with overlap-save method instead of '
+                                 'reading whole files into memory. Memory use stays constant regardless of the '
+                                 'recording length which helps with long multi-speaker recordings. Harmonic '
+                                 'distortion is not analyzed for overlapping sweeps when streaming.')
+    arg_parser.add_argument('--mmap', action='store_true', default=argparse.SUPPRESS,
+                            help='Read the sweep windows of silence separated recordings through memory mapped views '
+                                 'of the files instead of reading them with soundfile. Only the pages of the sweep '
+                                 'windows are loaded which is faster for long recordings on fast disks. Works with '
+                                 'plain PCM and float WAV files, other files are read normally. Results are the '
+                                 'same either way.')
+    arg_parser.add_argument('--no_stage_cache', dest='stage_cache', action='store_false', default=argparse.SUPPRESS,
+                            help='Process everything from scratch without using or updating the stage cache in '
+                                 '".cache/stages" of the measurement directory.')
+    arg_parser.add_argument('--variants', type=str, default=argparse.SUPPRESS,
+                            help='Path to JSON or YAML file which maps variant names to parameters. Recordings are '
+                                 'processed once up to equalization and every variant is rendered into '
+                                 '"variants/<name>" of the measurement directory in a separate process. Variants can '
+                                 'change "bass_boost", "tilt", "target_level", "decay", "channel_balance", "fs", '
+                                 '"plot", "jamesdsp" and "hangloose", other parameters come from the command line. '
+                                 'YAML files require PyYAML.')
+    arg_parser.add_argument('--debug', action='store_true',
+                            help='Write debugging artifacts responses.wav, headphone-responses.wav and '
+                                 'room-responses.wav.')
+    arg_parser.add_argument('--workers', type=int, default=argparse.SUPPRESS,
+                            help='Number of recording files read and deconvolved in parallel, number of output '
+                                 'files written in parallel, number of variants rendered in parallel and number of '
+                                 'directories processed in parallel in batch mode. Defaults to 1.')
     
     known_args, unknown_args = arg_parser.parse_known_args()
     args = vars(known_args)
 
+    if ('dir_path' in args) == ('batch' in args):
+        arg_parser.error('Exactly one of "--dir_path" and "--batch" is required.')
+    if 'batch_summary' in args and 'batch' not in args:
+        arg_parser.error('"--batch_summary" requires "--batch".')
+
     if 'bass_boost' in args:
-        bass_boost = args['bass_boost'].split(',')
-        if len(bass_boost) == 1:
-            args['bass_boost_gain'] = float(bass_boost[0])
-            args['bass_boost_fc'] = 105
-            args['bass_boost_q'] = 0.76
-        elif len(bass_boost) == 3:
-            args['bass_boost_gain'] = float(bass_boost[0])
-            args['bass_boost_fc'] = float(bass_boost[1])
-            args['bass_boost_q'] = float(bass_boost[2])
-        else:
-            raise ValueError('"--bass_boost" must have one value or three values separated by commas!')
+        args['bass_boost_gain'], args['bass_boost_fc'], args['bass_boost_q'] = parse_bass_boost(args['bass_boost'])
         del args['bass_boost']
     if 'decay' in args:
-        decay = dict()
-        try:
-            # Single float value
-            decay = {ch: float(args['decay']) / 1000 for ch in SPEAKER_NAMES}
-        except ValueError:
-            # Channels separated
-            for ch_t in args['decay'].split(','):
-                decay[ch_t.split(':')[0].upper()] = float(ch_t.split(':')[1]) / 1000
-        args['decay'] = decay
+        args['decay'] = parse_decay(args['decay'])
     if  'c' in args:
         args['head_ms'] = args['c']
         del args['c']
@@ -770,4 +1196,8 @@ def create_cli():
 
 
 if __name__ == '__main__':
-    main(**create_cli())
+    cli_args = create_cli()
+    if 'batch' in cli_args:
+        results = run_batch(cli_args.pop('batch'), summary_path=cli_args.pop('batch_summary', None), **cli_args)
+        sys.exit(0 if all(result['status'] == 'ok' for result in results) else 1)
+    main(**cli_args)
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import inspect
+import functools
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
@@ -13,19 +15,123 @@ from copy import deepcopy
 from autoeq.frequency_response import FrequencyResponse
 from utils import magnitude_response, get_ylim, running_mean
 from constants import COLORS
+import decay
+import peaks
 
 EPSILON = 1e-20 # Small constant to avoid log(0) or division by zero with tiny numbers
 
+# Memoization hits and misses of the impulse response methods in this process, see memo_stats()
+_MEMO_STATS = dict()
+
+
+def memo_stats():
+    """Memoization statistics of the derived quantities of impulse responses.
+
+    Returns:
+        Dict of dicts with "hits" and "misses" counts, method names as keys
+    """
+    return {name: dict(stats) for name, stats in _MEMO_STATS.items()}
+
+
+def reset_memo_stats():
+    """Resets memoization statistics."""
+    _MEMO_STATS.clear()
+
+
+def memoized(method):
+    """Decorator which memoizes the results of an ImpulseResponse method until the data changes.
+
+    Results are shared by all callers and must not be modified, arrays are marked read-only.
+    """
+    name = method.__name__.lstrip('_')
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        # Arguments are passed as keywords with the defaults filled in so that equivalent calls share the value
+        arguments = signature.bind(self, *args, **kwargs)
+        arguments.apply_defaults()
+        kwargs = dict(list(arguments.arguments.items())[1:])
+        value = self.cached(name, **kwargs)
+        if value is None:
+            value = method(self, **kwargs)
+            for array in value if isinstance(value, tuple) else [value]:
+                if isinstance(array, np.ndarray):
+                    array.setflags(write=False)
+            self.cache(value, name, **kwargs)
+        return value
+
+    return wrapper
+
 
 class ImpulseResponse:
-    def __init__(self, data, fs, recording=None):
+    def __init__(self, data, fs, recording=None, harmonics=None):
         self.fs = fs
-        self.data = data
+        # Incremented every time the data changes, memoized values are valid for a single version
+        self.version = 0
+        self._memo = dict()
+        self._data = data
         self.recording = recording
+        # Linear and harmonic distortion impulse response windows, see ImpulseResponseEstimator.harmonic_windows()
+        self.harmonics = harmonics
 
     def copy(self):
         return deepcopy(self)
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Memoized values are not shared with copies, they are computed again when needed
+        state['_memo'] = dict()
+        return state
+
+    def __setstate__(self, state):
+        if 'data' in state:
+            # Pickled before data became a property
+            state['_data'] = state.pop('data')
+        state.setdefault('version', 0)
+        state.setdefault('_memo', dict())
+        self.__dict__.update(state)
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self.touch()
+
+    def touch(self):
+        """Marks the data changed and discards memoized values computed from the old data.
+
+        Assigning new data does this automatically, it must be called after modifying the data in place.
+        """
+        self.version += 1
+        self._memo = dict()
+
+    def cached(self, name, *args, **kwargs):
+        """Memoized result of a method call for the current data.
+
+        Args:
+            name: Method name
+            *args: Positional arguments of the call
+            **kwargs: Keyword arguments of the call, memoized methods are keyed with all arguments as keywords
+
+        Returns:
+            Memoized result or None if it hasn't been computed for the current data
+        """
+        stats = _MEMO_STATS.setdefault(name, {'hits': 0, 'misses': 0})
+        key = (name, self.fs, args, tuple(sorted(kwargs.items())))
+        if key in self._memo:
+            stats['hits'] += 1
+            return self._memo[key]
+        stats['misses'] += 1
+        return None
+
+    def cache(self, value, name, *args, **kwargs):
+        """Memoizes result of a method call for the current data, see `cached()`."""
+        self._memo[(name, self.fs, args, tuple(sorted(kwargs.items())))] = value
+
     def __len__(self):
         """Impulse response length in samples."""
         return len(self.data)
@@ -34,9 +140,13 @@ class ImpulseResponse:
         """Impulse response duration in seconds."""
         return len(self) / self.fs
 
+    @memoized
     def peak_index(self, start=0, end=None, peak_height=0.12589):
         """Finds the first high (negative or positive) peak in the impulse response wave form.
 
+        Single channel case of `peaks.first_peaks()`, use that directly or `HRIR.peak_indices()` to search many impulse
+        responses at once.
+
         Args:
             start: Index for start of search range
             end: Index for end of search range
@@ -45,353 +155,31 @@ class ImpulseResponse:
         Returns:
             Peak index to impulse response data
         """
-        if len(self.data) == 0: # Handle empty IR data
-            # print("Warning: peak_index called on empty data.")
-            return 0
-            
-        if end is None:
-            end = len(self.data)
-        # Peak height threshold, relative to the data maximum value
-        # Copy to avoid manipulating the original data here
-        data_copy = self.data.copy() # Renamed to avoid conflict with input 'data' if this class is nested
-        # Limit search to given range
-        data_to_search = data_copy[start:end]
-
-        if len(data_to_search) == 0: # Handle empty search range
-            # print(f"Warning: peak_index search range [{start}:{end}] is empty for data of len {len(data_copy)}.")
-            return start # Or raise error, or return a sentinel like -1
-
-        max_abs_val = np.max(np.abs(data_to_search))
-        if max_abs_val < EPSILON: # Essentially silent signal
-            # print("Warning: peak_index called on silent or near-silent data. Returning middle of search range.")
-            # For silent signal, any point can be peak; pick first or middle.
-            # Defaulting to first point of search range
-            return start
-
-        # Normalize to 1.0
-        data_to_search /= max_abs_val
-        
-        # Find positive peaks
-        peaks_pos, _ = signal.find_peaks(data_to_search, height=peak_height)
-        # Find negative peaks that are at least
-        peaks_neg, _ = signal.find_peaks(data_to_search * -1.0, height=peak_height)
-        
-        # Combine positive and negative peaks
-        peaks = np.concatenate([peaks_pos, peaks_neg])
-        
-        if len(peaks) == 0:
-            # No peaks found meeting height criteria, fall back to absolute maximum in range
-            # This can happen if peak_height is too high for the actual data's character
-            # print(f"Warning: No peaks found with height {peak_height}. Using absolute max in range.")
-            peak_idx_in_search_range = np.argmax(np.abs(data_to_search))
-            return peak_idx_in_search_range + start
-
-        # Add start delta to peak indices
-        peaks += start
-        # Return the first one
-        return np.min(peaks)
+        return int(peaks.first_peaks(self.data[np.newaxis, :], start=start, end=end, peak_height=peak_height)[0])
 
+    @memoized
     def decay_params(self):
         """Determines decay parameters with Lundeby method
 
         https://www.ingentaconnect.com/content/dav/aaua/1995/00000081/00000004/art00009
         http://users.spa.aalto.fi/mak/PUB/AES_Modal9992.pdf
 
+        Single channel case of `decay.decay_params()`, use that directly to analyze many impulse responses at once.
+
         Returns:
             - peak_ind: Fundamental starting index
             - knee_point_ind: Index where decay reaches noise floor
             - noise_floor: Noise floor in dBFS, also peak to noise ratio
             - window_size: Averaging window size as determined by Lundeby method
         """
-        if len(self.data) < 10: # Arbitrary small length, too short for meaningful analysis
-            # print("Warning: IR too short for decay_params. Returning fallback.")
-            return 0, len(self.data), -200.0, len(self.data) if len(self.data) > 0 else 1
-
-        peak_index = self.peak_index()
-
-        # 1. The squared impulse response is averaged into localtime intervals in the range of 10–50 ms,
-        # to yield a smooth curve without losing short decays.
-        data = self.data.copy()
-        # From peak to 2 seconds after the peak
-        analysis_end_idx = min(peak_index + int(2 * self.fs), len(self))
-        if peak_index >= analysis_end_idx : # peak is at or after the desired analysis window end
-             # print(f"Warning: Peak index {peak_index} is at or beyond analysis window end {analysis_end_idx}. IR likely too short post-peak.")
-             # Provide minimal valid data for squaring, or return early
-             if peak_index >= len(self.data): peak_index = len(self.data) -1 # ensure peak_index is valid
-             if peak_index < 0: peak_index = 0
-             data_segment = data[peak_index : peak_index+1] if peak_index < len(data) else np.array([EPSILON])
-        else:
-            data_segment = data[peak_index:analysis_end_idx]
-        
-        if len(data_segment) == 0: data_segment = np.array([EPSILON]) # ensure not empty
-
-        max_abs_segment = np.max(np.abs(data_segment))
-        if max_abs_segment < EPSILON: # essentially silent
-            data_segment_norm = data_segment # avoid division by zero
-        else:
-            data_segment_norm = data_segment / max_abs_segment  # Normalize
-        
-        squared = data_segment_norm ** 2  # Squared impulse response starting from the peak
-        
-        if len(squared) == 0: # Should not happen due to above checks, but as a safeguard
-            # print("Warning: 'squared' array is empty in decay_params. Fallback.")
-            return peak_index, len(self.data), -200.0, 100 # arbitrary w_fallback
-
-        t_squared = np.linspace(0, len(squared) / self.fs, len(squared))  # Time stamps starting from peak
-        
-        wd = 0.03  # Window duration, let's start with 30 ms (wd_initial)
-        n = int(len(squared) / self.fs / wd) if self.fs > 0 and wd > 0 else 0 # Number of time windows (n_initial)
-        
-        if n == 0:
-            # Signal is too short for even one 30ms window.
-            # print("Warning: Signal too short for initial 30ms window in decay_params. Fallback.")
-            noise_floor_val = np.mean(squared) if len(squared) > 0 else EPSILON
-            noise_floor_db = 10 * np.log10(max(noise_floor_val, EPSILON))
-            w_fallback_short = max(1, len(squared)) # Use full length as window size
-            return peak_index, peak_index + len(squared), noise_floor_db, w_fallback_short
-            
-        w = int(len(squared) / n)  # Width of a single time window (w_initial)
-        if w == 0: w = 1 # Ensure window width is at least 1
-        w_fallback = w # Store this initial w for potential fallback return
-
-        t_windows = np.arange(n) * wd + wd / 2  # Timestamps for the window centers
-        
-        # Ensure reshaping is possible: len(squared) must be >= n*w
-        # This can be an issue if n*w from integer truncation slightly exceeds len(squared)
-        squared_to_reshape = squared[:n*w]
-        if len(squared_to_reshape) < n*w and n > 0 :
-             # This implies problem with n or w calculation, or very short squared
-             # print(f"Warning: Cannot reshape squared array of length {len(squared_to_reshape)} into ({n}, {w}). Adjusting n or w.")
-             # Adjust n to fit
-             n = len(squared_to_reshape) // w if w > 0 else 0
-             if n == 0: # Still problematic
-                 noise_floor_val = np.mean(squared) if len(squared) > 0 else EPSILON
-                 noise_floor_db = 10 * np.log10(max(noise_floor_val, EPSILON))
-                 return peak_index, peak_index + len(squared), noise_floor_db, w_fallback
-        
-        if n == 0: # Recalculated n is 0
-             noise_floor_val = np.mean(squared) if len(squared) > 0 else EPSILON
-             noise_floor_db = 10 * np.log10(max(noise_floor_val, EPSILON))
-             return peak_index, peak_index + len(squared), noise_floor_db, w_fallback
-
-        windows_reshaped = np.reshape(squared_to_reshape, (n, w)) # Split into time windows, one window per row
-        windows_mean = np.mean(windows_reshaped, axis=1)  # Average each time window
-        windows = 10 * np.log10(np.maximum(windows_mean, EPSILON))  # dB, prevent -inf
-
-        # 2. A first estimate for the background noise level is determined
-        tail_start_idx = int(len(squared) * 0.9) # Original: int(-0.1 * len(squared)) means last 10%
-        tail = squared[tail_start_idx:]
-        if len(tail) == 0: tail = squared # Use all of squared if tail is empty
-        
-        mean_tail_val = np.mean(tail) if len(tail) > 0 else EPSILON
-        noise_floor = 10 * np.log10(np.maximum(mean_tail_val, EPSILON)) # Ensure finite
-
-        # 3. The decay slope is estimated
-        slope_end_threshold = noise_floor + 10.0
-        
-        # Find indices where windows are below or at the threshold
-        candidate_indices = np.where(windows <= slope_end_threshold)[0]
-        
-        idx_for_regression_end = len(windows) # Default: use all windows for regression
-        if len(candidate_indices) > 0:
-            first_candidate = candidate_indices[0]
-            if first_candidate > 0: # If first candidate is not the very first window
-                idx_for_regression_end = first_candidate # Regress up to (but not including) this point
-                                                          # Original: first_candidate - 1, so including point before
-                                                          # For slice windows[:idx], use first_candidate
-        
-        # Ensure at least 2 points for linear regression
-        if idx_for_regression_end < 2:
-            if len(windows) >= 2: # If enough windows overall, use all of them
-                idx_for_regression_end = len(windows)
-            else: # Not enough windows for regression at all
-                # print(f"Warning: Not enough windows ({len(windows)}) for Lundeby slope. Using fallback decay params.")
-                return peak_index, peak_index + len(squared), noise_floor, w_fallback
-        
-        x_fit = t_windows[:idx_for_regression_end]
-        y_fit = windows[:idx_for_regression_end]
-
-        slope, intercept, _, _, _ = stats.linregress(x_fit, y_fit)
-
-        # CRITICAL FIX: Check for NaN or zero slope
-        if np.isnan(slope) or abs(slope) < EPSILON:
-            # print(f"Warning: Initial Lundeby slope is problematic (slope={slope}). Using fallback decay params.")
-            return peak_index, peak_index + len(squared), noise_floor, w_fallback
-
-        # 4. A preliminary knee point is determined
-        # Ensure slope is not zero for division
-        if abs(slope) < EPSILON: # Should be caught above, but as safeguard
-            knee_point_time = t_squared[-1] if len(t_squared)>0 else 0 # End of signal
-        else:
-            knee_point_time = (noise_floor - intercept) / slope
-        
-        # Ensure knee_point_time is within the bounds of t_squared
-        if len(t_squared) > 0:
-            knee_point_time = np.clip(knee_point_time, t_squared[0], t_squared[-1])
-        else: # t_squared is empty, should not happen if len(squared) > 0
-            knee_point_time = 0
-
-
-        # 5. A new time interval length is calculated
-        n_windows_per_10dB = 3
-        # wd calculation (line 119 in user's file, now safe due to slope check)
-        wd_denominator = abs(slope) * n_windows_per_10dB
-        if wd_denominator < EPSILON: # Denominator too small
-            # print(f"Warning: Denominator for wd calculation is too small ({wd_denominator}). Using large wd.")
-            wd = (t_squared[-1] if len(t_squared) > 0 else 1.0) / 3.0 # Default wd to 1/3 of signal duration
-        else:
-            wd = 10 / wd_denominator
-        
-        # n calculation (line 120, where error occurred)
-        if self.fs <= 0 or wd <= EPSILON : # wd can be very small if slope is very large
-             # print(f"Warning: Unsuitable fs ({self.fs}) or wd ({wd}) for n calculation. Fallback for n.")
-             n_new = 1 # Default to 1 window
-        else:
-            n_new = int(len(squared) / self.fs / wd)
-
-        if n_new == 0: n_new = 1 # Ensure at least one window for the loop
-        
-        w_new = int(len(squared) / n_new) # Width of a single time window for iteration
-        if w_new == 0: w_new = 1 # Ensure window width is at least 1
-
-        t_windows_new = np.arange(n_new) * wd + wd / 2 # Time window center time stamps
-
-        # 6. The squared impulse is averaged into the new local time intervals.
-        squared_to_reshape_new = squared[:n_new*w_new]
-        if len(squared_to_reshape_new) < n_new*w_new and n_new > 0: # Adjust n_new if needed
-            n_new = len(squared_to_reshape_new) // w_new if w_new > 0 else 0
-            if n_new == 0 : # Still problematic, exit gracefully from loop part
-                # print("Warning: Cannot proceed with Lundeby iteration due to reshaping issues. Using pre-loop results.")
-                idx_knee_pt_final = np.argmin(np.abs(t_squared - knee_point_time)) if len(t_squared)>0 else 0
-                return peak_index, peak_index + idx_knee_pt_final, noise_floor, w_new # return current best w
-        
-        if n_new == 0: # Should be caught above
-            idx_knee_pt_final = np.argmin(np.abs(t_squared - knee_point_time)) if len(t_squared)>0 else 0
-            return peak_index, peak_index + idx_knee_pt_final, noise_floor, w_fallback # Use original w_fallback
-
-        windows_reshaped_new = np.reshape(squared_to_reshape_new, (n_new, w_new))
-        windows_mean_new = np.mean(windows_reshaped_new, axis=1)
-        windows_new = 10 * np.log10(np.maximum(windows_mean_new, EPSILON)) # dB
-
-        try:
-            idx_knee_prelim_in_new_windows = np.argwhere(t_windows_new >= knee_point_time)[0, 0]
-            val_knee_prelim_in_new_windows = windows_new[idx_knee_prelim_in_new_windows]
-        except IndexError:
-            # Knee point time is beyond the new t_windows, or t_windows_new is empty
-            # print("Warning: Preliminary knee_point_time is outside new t_windows range. Using end of t_windows_new.")
-            if len(t_windows_new) > 0:
-                knee_point_time = t_windows_new[-1]
-                val_knee_prelim_in_new_windows = windows_new[-1]
-                idx_knee_prelim_in_new_windows = len(t_windows_new) -1
-            else: # t_windows_new is empty, critical failure of iteration setup
-                 # print("Warning: t_windows_new is empty. Fallback.")
-                 idx_knee_pt_final = np.argmin(np.abs(t_squared - knee_point_time)) if len(t_squared)>0 else 0
-                 return peak_index, peak_index + idx_knee_pt_final, noise_floor, w_new
-
-        # Steps 7–9 are iterated
-        noise_floor_iter = noise_floor # Start with pre-loop noise_floor
-        knee_point_time_iter = knee_point_time
-        val_knee_iter = val_knee_prelim_in_new_windows
-        idx_knee_iter_in_windows = idx_knee_prelim_in_new_windows
-
-        for i in range(5): # Max 5 iterations
-            # 7. Re-estimate background noise level
-            try:
-                # Find where decay is 5dB below current knee point value
-                noise_start_idx_in_windows = np.argwhere(windows_new <= val_knee_iter - 5)[0, 0]
-            except IndexError: # No point is 5dB below knee value, or windows_new is too short/flat
-                break # Cannot refine noise floor, exit loop
-            
-            noise_start_time_candidate = t_windows_new[noise_start_idx_in_windows]
-            # Noise segment starts 5-10dB after knee OR min 10% of total response length
-            # Here self.duration() refers to original IR, t_squared is for the segment after peak
-            total_response_duration_from_peak = t_squared[-1] if len(t_squared)>0 else 0.0
-            noise_floor_est_start_time = max(noise_start_time_candidate, 0.1 * total_response_duration_from_peak)
-            
-            # Ensure start time is within t_windows_new bounds
-            if noise_floor_est_start_time > t_windows_new[-1]: break
-
-            # Noise floor estimation ends one full (current) decay time after its start, or end of signal
-            noise_floor_est_end_time = min(noise_floor_est_start_time + knee_point_time_iter, total_response_duration_from_peak)
-            
-            # Find corresponding indices in t_squared
-            idx_noise_start_in_tsq = np.argmin(np.abs(t_squared - noise_floor_est_start_time))
-            idx_noise_end_in_tsq   = np.argmin(np.abs(t_squared - noise_floor_est_end_time))
-
-            if idx_noise_start_in_tsq >= idx_noise_end_in_tsq : # Invalid range for noise estimation
-                 break
-
-            noise_segment_for_avg = squared[idx_noise_start_in_tsq : idx_noise_end_in_tsq]
-            if len(noise_segment_for_avg) == 0: noise_segment_for_avg = np.array([EPSILON]) # Avoid empty mean
-
-            mean_noise_segment = np.mean(noise_segment_for_avg)
-            noise_floor_iter = 10 * np.log10(np.maximum(mean_noise_segment, EPSILON))
-
-            # 8. Estimate late decay slope
-            slope_late_end_headroom = 8.0
-            slope_late_dynamic_range = 20.0
-            
-            # Find points for late slope regression: 5-10dB above new noise_floor_iter, for 10-20dB range
-            late_slope_end_val_target = noise_floor_iter + slope_late_end_headroom
-            late_slope_start_val_target = noise_floor_iter + slope_late_end_headroom + slope_late_dynamic_range
-            
-            try:
-                # Indices in 'windows_new'
-                late_slope_end_idx_in_win = np.argwhere(windows_new <= late_slope_end_val_target)[0,0] -1
-                late_slope_start_idx_in_win = np.argwhere(windows_new <= late_slope_start_val_target)[0,0] -1
-            except IndexError: # Not enough dynamic range or points above noise floor
-                break 
-
-            if late_slope_start_idx_in_win < 0 : late_slope_start_idx_in_win = 0
-            if late_slope_end_idx_in_win <= late_slope_start_idx_in_win + 1: # Need at least 2 points
-                break
-            
-            x_late_fit = t_windows_new[late_slope_start_idx_in_win : late_slope_end_idx_in_win]
-            y_late_fit = windows_new[late_slope_start_idx_in_win : late_slope_end_idx_in_win]
-
-            if len(x_late_fit) < 2: break # Still not enough points after adjustments
-
-            late_slope, late_intercept, _, _, _ = stats.linregress(x_late_fit, y_late_fit)
-
-            if np.isnan(late_slope) or abs(late_slope) < EPSILON:
-                break # Late slope calculation failed
-
-            # 9. Find new knee_point
-            if abs(late_slope) < EPSILON: # Avoid division by zero
-                new_knee_point_time = t_windows_new[-1] if len(t_windows_new)>0 else 0
-            else:
-                new_knee_point_time = (noise_floor_iter - late_intercept) / late_slope
-
-            if len(t_windows_new) == 0: break # Should not happen here
-            new_knee_point_time = np.clip(new_knee_point_time, t_windows_new[0], t_windows_new[-1])
-
-            try:
-                new_idx_knee_in_windows = np.argwhere(t_windows_new >= new_knee_point_time)[0,0]
-            except IndexError: # new_knee_point_time is past the end of t_windows_new
-                 new_idx_knee_in_windows = len(t_windows_new) - 1 if len(t_windows_new)>0 else 0
-            
-            if new_idx_knee_in_windows == idx_knee_iter_in_windows: # Converged
-                idx_knee_iter_in_windows = new_idx_knee_in_windows
-                knee_point_time_iter = t_windows_new[idx_knee_iter_in_windows] if len(t_windows_new)>0 else 0
-                break 
-            else: # Update for next iteration
-                idx_knee_iter_in_windows = new_idx_knee_in_windows
-                knee_point_time_iter = t_windows_new[idx_knee_iter_in_windows] if len(t_windows_new)>0 and idx_knee_iter_in_windows < len(t_windows_new) else (t_windows_new[-1] if len(t_windows_new)>0 else 0)
-                val_knee_iter = windows_new[idx_knee_iter_in_windows] if len(windows_new)>0 and idx_knee_iter_in_windows < len(windows_new) else (windows_new[-1] if len(windows_new)>0 else -200)
-        else: # Loop finished without break (i.e., did not converge in 5 iterations)
-            pass # Use the last calculated knee_point_time_iter
-
-        # Final knee_point_index in the original 'squared' array (relative to peak_index)
-        if len(t_squared) > 0 :
-            final_knee_point_idx_in_squared = np.argmin(np.abs(t_squared - knee_point_time_iter))
-        else: # t_squared was empty
-            final_knee_point_idx_in_squared = 0
-            
-        # w_new is the window size from the iterative part.
-        return peak_index, peak_index + final_knee_point_idx_in_squared, noise_floor_iter, w_new
+        peak_index = self.peak_index() if len(self.data) >= 10 else 0
+        peak_ind, knee_point_ind, noise_floor, window_size = decay.decay_params(
+            self.data[np.newaxis, :], self.fs, [peak_index])
+        return int(peak_ind[0]), int(knee_point_ind[0]), float(noise_floor[0]), int(window_size[0])
 
     # ... (rest of the ImpulseResponse class methods remain the same) ...
 
+    @memoized
     def decay_times(self, peak_ind=None, knee_point_ind=None, noise_floor=None, window_size=None):
         """Calculates decay times EDT, RT20, RT30, RT60
 
@@ -612,6 +400,8 @@ class ImpulseResponse:
             None
         """
         if len(self.data) == 0 or len(fir) == 0: return # Cannot convolve with empty data/fir
+        # FIR filters are designed in double precision, filtering happens in the data type of the impulse response
+        fir = np.asarray(fir).astype(self.data.dtype, copy=False)
         self.data = signal.convolve(self.data, fir, mode='full')[:len(self.data)+len(fir)-1 if len(self.data)>0 else len(fir)-1] # Match typical full conv length
         # Truncate to a reasonable length if it gets too long, or keep full.
         # Original behavior seems to be 'full' length. If this is too long, it might need trimming.
@@ -622,9 +412,45 @@ class ImpulseResponse:
         """Resamples this impulse response to the given sampling rate."""
         if len(self.data) == 0: return
         if self.fs == fs : return # No need to resample
-        self.data = nnresample.resample(self.data, fs, self.fs)
+        self.data = nnresample.resample(self.data, fs, self.fs).astype(self.data.dtype, copy=False)
+        if self.harmonics is not None:
+            self.harmonics = nnresample.resample(
+                self.harmonics, fs, self.fs, axis=-1).astype(self.harmonics.dtype, copy=False)
         self.fs = fs
 
+    def harmonic_distortion(self, frequencies=None):
+        """Calculates total harmonic distortion in octave bands from the harmonic impulse responses.
+
+        Harmonic impulse response of order n contains the distortion as a function of the harmonic frequency so the
+        power of n-th harmonic for an excitation band is read from the band n times higher.
+
+        Args:
+            frequencies: Octave band center frequencies of the excitation. Bands where the highest harmonic doesn't
+                         fit below Nyquist frequency are left out.
+
+        Returns:
+            List of (frequency, THD in percents) tuples or None when harmonic impulse responses are not available
+        """
+        if self.harmonics is None:
+            return None
+        if frequencies is None:
+            frequencies = [63, 125, 250, 500, 1000, 2000, 4000, 8000]
+        n = self.harmonics.shape[-1]
+        power = np.abs(np.fft.rfft(self.harmonics, axis=-1)) ** 2
+        f = np.fft.rfftfreq(n, 1 / self.fs)
+        n_orders = self.harmonics.shape[0]
+        thd = []
+        for fc in frequencies:
+            if fc * n_orders * np.sqrt(2) > self.fs / 2:
+                continue
+            # Band power of the fundamental and each harmonic
+            band_powers = []
+            for order in range(1, n_orders + 1):
+                band = np.logical_and(f >= order * fc / np.sqrt(2), f < order * fc * np.sqrt(2))
+                band_powers.append(np.mean(power[order - 1, band]))
+            thd.append((fc, 100 * np.sqrt(np.sum(band_powers[1:]) / (band_powers[0] + EPSILON))))
+        return thd
+
     def convolve(self, x):
         """Convolves input data with this impulse response
 
@@ -637,17 +463,20 @@ class ImpulseResponse:
         if len(self.data) == 0 or len(x) == 0: return np.array([])
         return signal.convolve(x, self.data, mode='full')
 
-    def adjust_decay(self, target):
+    def adjust_decay(self, target, decay_params=None):
         """Adjusts decay time in place.
 
         Args:
             target: Target 60 dB decay time in seconds
+            decay_params: Decay parameters as returned by `decay_params()`. Optional.
 
         Returns:
             None
         """
         if len(self.data) < 10 : return # Too short
-        peak_index, knee_point_index, _, window_size_lundeby = self.decay_params() # Added window_size
+        if decay_params is None:
+            decay_params = self.decay_params()
+        peak_index, knee_point_index, _, window_size_lundeby = decay_params
         edt, rt20, rt30, rt60 = self.decay_times(peak_ind=peak_index, knee_point_ind=knee_point_index, window_size=window_size_lundeby) # Pass it
         
         rt_slope = None
@@ -751,13 +580,19 @@ class ImpulseResponse:
 
         self.data *= final_gain_window  # Scale impulse response data with the gain window
 
+    @memoized
     def magnitude_response(self):
-        """Calculates magnitude response for the data."""
+        """Calculates magnitude response for the data, the arrays are read-only."""
         if len(self.data) == 0: return np.array([]), np.array([])
         return magnitude_response(self.data, self.fs)
 
     def frequency_response(self):
         """Creates FrequencyResponse instance."""
+        return deepcopy(self._frequency_response())
+
+    @memoized
+    def _frequency_response(self):
+        """Log-frequency response shared by all `frequency_response()` calls until the data changes."""
         if len(self.data) < 2: # Need at least 2 points for FFT based magnitude_response
             # print("Warning: Data too short for frequency_response. Returning flat FR.")
             f = FrequencyResponse.generate_frequencies(f_step=1.01, f_min=10, f_max=self.fs / 2)
@@ -1,14 +1,25 @@
 # -*- coding: utf-8 -*-
 
 import os
+import json
+import hashlib
 from argparse import ArgumentParser
 import pickle
+import soundfile as sf
 from scipy.fftpack import fft
+from scipy.fft import rfft, irfft, next_fast_len
 from scipy.signal import convolve
 from scipy.signal.windows import hann
 import numpy as np
 import matplotlib.pyplot as plt
-from utils import read_wav, write_wav, magnitude_response
+from impulse_response import ImpulseResponse
+import peaks
+from utils import read_wav, write_wav, read_wav_metadata, wav_subtype, magnitude_response
+from constants import SEQUENCE_TRACK_LAYOUTS
+
+# Identifies the test signal signature in WAV file comments, bump the version when signature content changes
+SIGNATURE_FORMAT = 'impulcifer-test-signal'
+SIGNATURE_VERSION = 1
 
 
 class ImpulseResponseEstimator(object):
@@ -18,7 +29,21 @@ class ImpulseResponseEstimator(object):
     Angelo Farina
     """
 
-    def __init__(self, min_duration=5.0, fs=44100):
+    def __init__(self, min_duration=5.0, fs=44100, fade_in=1/2, fade_out=None, cache=None, silence_length=2.0,
+                 dtype='float64'):
+        """
+        Args:
+            min_duration: Minimum test signal duration in seconds.
+            fs: Sampling rate in Hertz.
+            fade_in: Size of test signal fade-in Hanning window in octaves. None value disables fade-in.
+            fade_out: Size of test signal fade-out Hanning window in octaves. None value disables fade-out.
+            cache: EstimatorCache instance for loading and storing the test signal and inverse filter. Both are
+                   generated from scratch if not given.
+            silence_length: Length of silence in seconds before the first sweep and after each sweep in sweep
+                            sequences and recordings. See `probe_silence_length()`.
+            dtype: Data type for deconvolution, "float64" or "float32". Test signal and inverse filter are always
+                   generated with double precision and converted when transformed.
+        """
         if fs != int(fs):
             raise ValueError('Sampling rate "fs" must be an integer.')
         self.fs = int(fs)
@@ -34,16 +59,72 @@ class ImpulseResponseEstimator(object):
         self.w1 = self.low / self.fs * 2 * np.pi
         self.w2 = self.high / self.fs * 2 * np.pi
 
-        # Generate test signal
-        self.test_signal = self.generate_test_signal(min_duration)
+        self.fade_in = fade_in
+        self.fade_out = fade_out
+        self.silence_length = silence_length
+        self.dtype = np.dtype(dtype).name
+        # Layout of the sweep sequence which was played during the recordings when known, see `from_wav()`
+        self.sequence = None
+
+        # Real spectra of the inverse filter, one per FFT length
+        self._inverse_filter_spectra = dict()
+
+        self.cache = cache
+        self._cache_key = None
+        self._test_signal_hash = None
+        entry = None
+        if cache is not None:
+            # Minimum duration is represented by the length multiplier so that all durations which produce the same
+            # test signal share the cache entry
+            self._cache_key = cache.key(
+                fs=self.fs,
+                n_octaves=float(self.n_octaves),
+                length_multiplier=float(self.length_multiplier(min_duration)),
+                fade_in=fade_in,
+                fade_out=fade_out
+            )
+            entry = cache.load(self._cache_key)
+
+        if entry is not None:
+            self.test_signal = entry['test_signal']
+            self.inverse_filter = entry['inverse_filter']
+            self._test_signal_hash = entry['meta'].get('test_signal_hash')
+        else:
+            # Generate test signal
+            self.test_signal = self.generate_test_signal(min_duration, fade_in=fade_in, fade_out=fade_out)
+            # Generate inverse filter
+            self.inverse_filter = self.generate_inverse_filter()
+            if cache is not None:
+                cache.store(
+                    self._cache_key,
+                    meta={'test_signal_hash': self.test_signal_hash()},
+                    test_signal=self.test_signal,
+                    inverse_filter=self.inverse_filter
+                )
         self.duration = len(self.test_signal) / self.fs
 
-        # Generate inverse filter
-        self.inverse_filter = self.generate_inverse_filter()
-
     def __len__(self):
         return len(self.test_signal)
 
+    def __getstate__(self):
+        # Spectra are derived data and can be large, don't pickle them
+        state = self.__dict__.copy()
+        state['_inverse_filter_spectra'] = dict()
+        return state
+
+    def __setstate__(self, state):
+        # Pickles created before these attributes existed don't have them
+        state.setdefault('_inverse_filter_spectra', dict())
+        state.setdefault('fade_in', 1/2)
+        state.setdefault('fade_out', None)
+        state.setdefault('cache', None)
+        state.setdefault('_cache_key', None)
+        state.setdefault('_test_signal_hash', None)
+        state.setdefault('silence_length', 2.0)
+        state.setdefault('dtype', 'float64')
+        state.setdefault('sequence', None)
+        self.__dict__.update(state)
+
     def plot(self):
         f, m = magnitude_response(self.test_signal, self.fs)
         plt.plot(f, m)
@@ -62,6 +143,21 @@ class ImpulseResponseEstimator(object):
         plt.grid(True)
         plt.show()
 
+    def length_multiplier(self, min_duration):
+        """Calculates test signal length multiplier M for the given minimum duration.
+
+        See equation 2 in Garai and Guidorzi 2015. Here it's selected such that the test signal duration is equal or
+        greater than minimum duration.
+
+        Args:
+            min_duration: Minimum test signal duration in seconds.
+
+        Returns:
+            Length multiplier
+        """
+        P = self.n_octaves
+        return np.ceil(min_duration * self.fs * (np.pi / 2**P) / (np.pi * 2 * np.log(2**P)))
+
     def generate_inverse_filter(self):
         """Generates inverse filter for test signal.
 
@@ -105,9 +201,7 @@ class ImpulseResponseEstimator(object):
         # P is the number of octaves in the test signal
         P = self.n_octaves
         # M is a length multiplier
-        # See equation 2 in Garai and Guidorzi 2015
-        # Here it's selected such that the test signal duration is equal or greater than minimum duration
-        M = np.ceil(min_duration * self.fs * (np.pi / 2**P) / (np.pi * 2 * np.log(2**P)))
+        M = self.length_multiplier(min_duration)
         # L is the real number length of the test signal in samples
         L = M * np.pi * 2 * np.log(2**P) / (np.pi / 2**P)
         # N is the actual length of the test signal in samples
@@ -145,11 +239,191 @@ class ImpulseResponseEstimator(object):
 
         return test_signal
 
+    def inverse_filter_spectrum(self, n_fft):
+        """Real spectrum of the inverse filter zero padded to the given FFT length.
+
+        Spectra are cached per FFT length so that the inverse filter is transformed only once for all the recordings
+        which are deconvolved with the same FFT length. Spectrum is calculated in double precision and converted to
+        the complex type matching the estimator's data type. Only the spectrum of the fixed streaming FFT length is
+        persisted in the estimator cache, batch FFT lengths depend on the recording length and would make the cache
+        entry grow with every new recording length.
+
+        Args:
+            n_fft: FFT length in samples
+
+        Returns:
+            Inverse filter spectrum as complex Numpy array
+        """
+        key = (n_fft, self.dtype)
+        if key not in self._inverse_filter_spectra:
+            spectrum = None
+            persist = self.cache is not None and n_fft == self.stream_fft_length()
+            if persist:
+                spectrum = self.cache.load_array(self._cache_key, f'spectrum-{n_fft:d}')
+            if spectrum is None:
+                spectrum = rfft(self.inverse_filter, n_fft)
+                if persist:
+                    self.cache.store_array(self._cache_key, f'spectrum-{n_fft:d}', spectrum)
+            self._inverse_filter_spectra[key] = np.asarray(
+                spectrum, dtype=np.result_type(self.dtype, np.complex64))
+        return self._inverse_filter_spectra[key]
+
     def estimate(self, recording):
         """Estimates impulse response"""
-        return convolve(recording, self.inverse_filter, mode='same', method='auto')
+        return self.estimate_batch(recording)[0]
+
+    def estimate_batch(self, segments, n_harmonics=0):
+        """Estimates impulse responses for multiple recordings in one vectorized pass.
+
+        Each row is deconvolved with the inverse filter in the same way as `estimate()` does for a single recording:
+        output has the same length as the input and is centered with respect to the full convolution.
+
+        Harmonic distortion impulse responses are cut from the same deconvolution result when `n_harmonics` is given,
+        see `harmonic_windows()`.
+
+        Args:
+            segments: Recordings as 2-D Numpy array with one recording per row. Single dimensional array is treated as
+                      one row.
+            n_harmonics: Number of harmonic distortion impulse responses to return, starting from the second harmonic.
+
+        Returns:
+            Impulse responses as 2-D Numpy array with one impulse response per row. When `n_harmonics` is given,
+            returns a tuple of impulse responses and harmonic windows.
+        """
+        segments = np.atleast_2d(segments).astype(self.dtype, copy=False)
+        n = segments.shape[1]
+        m = len(self.inverse_filter)
+        n_fft = next_fast_len(n + m - 1)
+        spectrum = rfft(segments, n_fft, axis=1)
+        spectrum *= self.inverse_filter_spectrum(n_fft)
+        start = (m - 1) // 2
+        estimates = irfft(spectrum, n_fft, axis=1)[:, start:start + n]
+        if n_harmonics:
+            return estimates, self.harmonic_windows(estimates, n_harmonics)
+        return estimates
+
+    def zero_lag(self):
+        """Index of the zero lag (linear impulse response) in the output of `estimate()` for a sweep which starts at
+        the beginning of the recording."""
+        m = len(self.inverse_filter)
+        return m - 1 - (m - 1) // 2
+
+    def harmonic_window_size(self, n_harmonics):
+        """Length of the windows in samples which separate harmonic impulse responses from each other.
+
+        Harmonic impulse responses get closer to each other with increasing order, window size is the time between the
+        highest returned harmonic and the one after it.
+
+        Args:
+            n_harmonics: Number of harmonic distortion impulse responses, starting from the second harmonic.
+
+        Returns:
+            Window size in samples
+        """
+        return int((self.harmonic_delay(n_harmonics + 2) - self.harmonic_delay(n_harmonics + 1)) * self.fs)
+
+    def harmonic_windows(self, estimates, n_harmonics, peak_indices=None):
+        """Cuts linear and harmonic distortion impulse responses from deconvolved signals.
+
+        Impulse response of the n-th harmonic precedes the linear impulse response by `harmonic_delay(n)`. All
+        responses are cut with windows of equal length which start a quarter of the window before the response so
+        that the windows of consecutive harmonics don't overlap. Windows are anchored on the peak of the linear impulse
+        response instead of the zero lag of the deconvolution because the playback and recording latency moves all the
+        responses by the same amount.
 
-    def sweep_sequence(self, speakers, tracks):
+        Args:
+            estimates: Deconvolved signals as 2-D Numpy array with one signal per row.
+            n_harmonics: Number of harmonic distortion impulse responses, starting from the second harmonic.
+            peak_indices: Index of the linear impulse response peak on each row. Defaults to the first peak of each
+                          row, see `peaks.first_peaks()`.
+
+        Returns:
+            Numpy array with shape (number of rows, `n_harmonics` + 1, window size). First window on each row is the
+            linear impulse response and the rest are the harmonic impulse responses from the second harmonic upwards.
+        """
+        estimates = np.atleast_2d(estimates)
+        if peak_indices is None:
+            peak_indices = peaks.first_peaks(estimates)
+        peak_indices = np.broadcast_to(np.asarray(peak_indices, dtype=int), estimates.shape[:1])
+        size = self.harmonic_window_size(n_harmonics)
+        rows = np.arange(estimates.shape[0])[:, np.newaxis]
+        windows = np.zeros((estimates.shape[0], n_harmonics + 1, size), dtype=estimates.dtype)
+        for k in range(n_harmonics + 1):
+            # Harmonic delay of order 1 is zero, that's the linear impulse response
+            starts = peak_indices - int(round(self.harmonic_delay(k + 1) * self.fs)) - size // 4
+            indices = starts[:, np.newaxis] + np.arange(size)
+            # Parts of the windows outside of the rows are left as zeros
+            valid = (indices >= 0) & (indices < estimates.shape[1])
+            windows[:, k] = np.where(valid, estimates[rows, np.clip(indices, 0, estimates.shape[1] - 1)], 0)
+        return windows
+
+    def stream_fft_length(self):
+        """FFT length used by `estimate_stream()`, depends only on the inverse filter length."""
+        return next_fast_len(2 * len(self.inverse_filter))
+
+    def estimate_stream(self, blocks):
+        """Estimates impulse response of a continuous recording given in blocks with overlap-save method.
+
+        Output is aligned with the input in the same way as with `estimate()` for the whole recording: the n-th output
+        sample corresponds to the n-th input sample. Output is produced in chunks of roughly the inverse filter
+        length and it lags behind the input by the same amount. Only the last inverse filter length of the input is
+        kept in memory.
+
+        Args:
+            blocks: Iterable of recording blocks as 2-D Numpy arrays with one track per row. Blocks can have any number
+                    of samples but the number of tracks must remain the same.
+
+        Returns:
+            Generator of impulse response chunks as 2-D Numpy arrays with one track per row
+        """
+        m = len(self.inverse_filter)
+        n_fft = self.stream_fft_length()
+        # Number of new output samples per FFT
+        step = n_fft - m + 1
+        spectrum = self.inverse_filter_spectrum(n_fft)
+        # Number of full convolution output samples before the output aligned with the input starts
+        skip = (m - 1) // 2
+
+        # Input buffer starts with m - 1 history samples, zeros before the recording starts
+        buffer = None
+        n_input = 0
+        n_output = 0
+
+        def process():
+            # Full convolution output for the first step samples in the buffer after the history
+            return irfft(rfft(buffer[:, :n_fft], n_fft, axis=1) * spectrum, n_fft, axis=1)[:, m - 1:]
+
+        for block in blocks:
+            block = np.atleast_2d(block).astype(self.dtype, copy=False)
+            if buffer is None:
+                buffer = np.zeros((block.shape[0], m - 1), dtype=self.dtype)
+            buffer = np.concatenate([buffer, block], axis=1)
+            n_input += block.shape[1]
+            while buffer.shape[1] >= n_fft:
+                output = process()
+                buffer = buffer[:, step:]
+                start = max(skip - n_output, 0)
+                n_output += step
+                if start < step:
+                    yield output[:, start:]
+
+        if buffer is None:
+            return
+        # Flush the remaining input by zero padding the buffer until all the output samples have been produced
+        n_total = skip + n_input
+        while n_output < n_total:
+            if buffer.shape[1] < n_fft:
+                buffer = np.concatenate(
+                    [buffer, np.zeros((buffer.shape[0], n_fft - buffer.shape[1]), dtype=self.dtype)], axis=1)
+            output = process()
+            buffer = buffer[:, step:]
+            start = max(skip - n_output, 0)
+            end = min(n_total - n_output, step)
+            n_output += step
+            if start < end:
+                yield output[:, start:end]
+
+    def sweep_sequence(self, speakers, tracks, sweep_offset=None, repeats=1):
         """Creates sine sweep sequence data with multiple tracks
 
         Output depends on the speakers and tracks in a way that speakers define which physical speakers will should be
@@ -170,34 +444,49 @@ class ImpulseResponseEstimator(object):
         be achieved by setting speakers to [FC] and tracks to "7.1" or "5.1". Playing mono sweep on left channel could
         be achieved by setting speakers to [FL] and tracks to "stereo" (or higher depending on the speaker system).
 
+        When sweep offset is given the sweeps are not separated by silence but each sweep starts the given time after
+        the previous one, so consecutive sweeps overlap. This is the multiple exponential sweep method (MESM) by Majdak
+        et al. After deconvolution the impulse response of each speaker appears the sweep offset after the previous
+        one and the offset needs to be long enough for the impulse responses and harmonic distortion impulse responses
+        not to overlap, see `min_sweep_offset()`.
+
         Args:
             speakers: List of speaker names to use in the sequence
-            tracks: Tracks configuration. "7.1", "5.1", "stereo" or "mono".
+            tracks: Tracks configuration, one of the keys in `SEQUENCE_TRACK_LAYOUTS`: "mono", "stereo", "5.1", "7.1",
+                    "7.1.4" or "9.1.6".
+            sweep_offset: Time in seconds between starts of consecutive sweeps. None for sweeps separated by silence.
+            repeats: Number of consecutive sweeps for each speaker. Repeated takes are averaged when the recording is
+                     opened which improves signal to noise ratio without making the sweep longer.
 
         Returns:
             Sweep sequence data as Numpy array. Each row represents a single track.
         """
-        unique_speakers = []
-        for speaker in speakers:
-            if speaker in unique_speakers:
-                raise ValueError('All speaker names in speakers must be unique.')
+        return np.hstack(list(self.sweep_sequence_blocks(speakers, tracks, sweep_offset=sweep_offset, repeats=repeats)))
+
+    def _sequence_layout(self, speakers, tracks, sweep_offset=None, repeats=1):
+        """Calculates where the sweeps are in a sweep sequence.
+
+        Args:
+            speakers: List of speaker names to use in the sequence
+            tracks: Tracks configuration, one of the keys in `SEQUENCE_TRACK_LAYOUTS`.
+            sweep_offset: Time in seconds between starts of consecutive sweeps. None for sweeps separated by silence.
+            repeats: Number of consecutive sweeps for each speaker.
+
+        Returns:
+            - Number of tracks
+            - List of (track index, start sample) tuples, one for each sweep
+            - Sequence length in samples
+        """
+        if len(set(speakers)) != len(speakers):
+            raise ValueError('All speaker names in speakers must be unique.')
 
         # Remap channels
-        if tracks == '7.1':
-            standard_order = 'FL FR FC LFE BL BR SL SR'.split()
-            n_tracks = 8
-        elif tracks == '5.1':
-            standard_order = 'FL FR FC LFE BL BR'.split()
-            n_tracks = 6
-        elif tracks == 'stereo':
-            standard_order = 'FL FR'.split()
-            n_tracks = 2
-        elif tracks == 'mono':
-            standard_order = ['FL']
-            speakers = ['FL']
-            n_tracks = 1
-        else:
+        if tracks not in SEQUENCE_TRACK_LAYOUTS:
             raise ValueError('Unsupported track configuration "{}".'.format(tracks))
+        standard_order = SEQUENCE_TRACK_LAYOUTS[tracks]
+        n_tracks = len(standard_order)
+        if tracks == 'mono':
+            speakers = ['FL']
 
         for speaker in speakers:
             if speaker not in standard_order:
@@ -207,26 +496,246 @@ class ImpulseResponseEstimator(object):
                 ))
         speaker_indices = [standard_order.index(ch) for ch in speakers]
 
-        # Create test signal sequence
-        data = np.zeros((n_tracks, int((self.fs * 2.0 + len(self)) * len(speakers) + self.fs * 2.0)))
-        for i, speaker in enumerate(speakers):
-            start_zeros = int((self.fs * 2.0 + len(self)) * i + self.fs * 2.0)
-            end_zeros = int((self.fs * 2.0 + len(self)) * (len(speakers) - i - 1) + self.fs * 2.0)
-            sweep_padded = np.concatenate([
-                np.zeros((start_zeros,)),
-                self.test_signal,
-                np.zeros((end_zeros,))
-            ])
-            data[speaker_indices[i], :] = sweep_padded
-        data = np.vstack(data)
-
-        return data
+        silence_length = int(round(self.fs * self.silence_length))
+        if sweep_offset is None:
+            # Sweeps one after another separated by silence
+            step = silence_length + len(self)
+        else:
+            # Overlapping sweeps with a fixed offset between sweep starts
+            step = int(round(sweep_offset * self.fs))
+            if repeats > 1 and step < len(self):
+                raise ValueError('Sweep offset must be at least the sweep length with repeats because takes of the same '
+                                 'speaker are played on the same track.')
+        # All takes of a speaker are consecutive
+        sweeps = [(speaker_indices[i // repeats], silence_length + step * i) for i in range(len(speakers) * repeats)]
+        return n_tracks, sweeps, sweeps[-1][1] + len(self) + silence_length
+
+    def sweep_sequence_blocks(self, speakers, tracks, sweep_offset=None, repeats=1, block_size=2**16):
+        """Creates sine sweep sequence in blocks.
+
+        Same as `sweep_sequence()` but the sequence is generated one block at a time so that long sequences with many
+        tracks never need to be in memory as a whole. Only the sweeps which overlap with a block are copied into it.
+
+        Args:
+            speakers: List of speaker names to use in the sequence
+            tracks: Tracks configuration, one of the keys in `SEQUENCE_TRACK_LAYOUTS`.
+            sweep_offset: Time in seconds between starts of consecutive sweeps. None for sweeps separated by silence.
+            repeats: Number of consecutive sweeps for each speaker.
+            block_size: Number of samples in each block. Last block can be shorter.
+
+        Returns:
+            Generator of sweep sequence blocks as Numpy arrays, each row represents a single track
+        """
+        n_tracks, sweeps, length = self._sequence_layout(speakers, tracks, sweep_offset=sweep_offset, repeats=repeats)
+        for block_start in range(0, length, block_size):
+            block_end = min(block_start + block_size, length)
+            block = np.zeros((n_tracks, block_end - block_start))
+            for track, start in sweeps:
+                # Part of the sweep which overlaps with the block
+                first = max(start, block_start)
+                last = min(start + len(self), block_end)
+                if first < last:
+                    block[track, first - block_start:last - block_start] += self.test_signal[first - start:last - start]
+            yield block
+
+    def write_sweep_sequence(self, file_path, speakers, tracks, sweep_offset=None, repeats=1, bit_depth=32,
+                             block_size=2**16):
+        """Writes sine sweep sequence to a WAV file block by block.
+
+        Args:
+            file_path: Path to output WAV file
+            speakers: List of speaker names to use in the sequence
+            tracks: Tracks configuration, one of the keys in `SEQUENCE_TRACK_LAYOUTS`.
+            sweep_offset: Time in seconds between starts of consecutive sweeps. None for sweeps separated by silence.
+            repeats: Number of consecutive sweeps for each speaker.
+            bit_depth: Number of bits per sample. 16, 24 or 32
+            block_size: Number of samples to generate and write at a time
+
+        Returns:
+            None
+        """
+        n_tracks, _, _ = self._sequence_layout(speakers, tracks, sweep_offset=sweep_offset, repeats=repeats)
+        blocks = self.sweep_sequence_blocks(
+            speakers, tracks, sweep_offset=sweep_offset, repeats=repeats, block_size=block_size)
+        with sf.SoundFile(file_path, mode='w', samplerate=self.fs, channels=n_tracks,
+                          subtype=wav_subtype(bit_depth)) as f:
+            # Signature with the sequence layout
+            f.comment = self.wav_metadata(sequence={
+                'speakers': speakers,
+                'tracks': tracks,
+                'sweep_offset': sweep_offset,
+                'silence_length': self.silence_length,
+                'repeats': repeats
+            })['comment']
+            for block in blocks:
+                # Soundfile wants tracks on columns
+                f.write(np.transpose(block))
+
+    def probe_silence_length(self, recording, margin=0.2, min_silence_length=0.5):
+        """Calculates sufficient silence length between sweeps from a recording of a single test signal.
+
+        Impulse response is estimated from the probe recording and the silence is sized by the time it takes for the
+        impulse response to decay into the noise floor (knee point of the Lundeby method). Dead rooms get short
+        silences and live rooms get long enough silences for the decay tails.
+
+        Args:
+            recording: Recording of the test signal with one row per track, followed by at least as much silence as
+                       the room decay takes
+            margin: Safety margin in seconds added to the decay time
+            min_silence_length: Minimum silence length in seconds
+
+        Returns:
+            Silence length in seconds, rounded up to 0.1 seconds
+        """
+        recording = np.atleast_2d(recording)
+        decay_time = 0.0
+        for track, estimate in zip(recording, self.estimate_batch(recording)):
+            peak_ind, knee_point_ind, _, _ = ImpulseResponse(estimate, self.fs, track).decay_params()
+            decay_time = max(decay_time, (knee_point_ind - peak_ind) / self.fs)
+        return max(np.ceil((decay_time + margin) * 10) / 10, min_silence_length)
+
+    def harmonic_delay(self, order):
+        """Calculates how much harmonic distortion impulse response precedes the linear impulse response.
+
+        Exponential sweep makes the impulse response of n-th harmonic appear before the linear impulse response in the
+        deconvolved output. The time difference depends only on the sweep rate.
+
+        Args:
+            order: Harmonic order, 2 for the second harmonic etc...
+
+        Returns:
+            Delay in seconds
+        """
+        return len(self) / self.fs / (self.n_octaves * np.log(2)) * np.log(order)
+
+    def sweep_offset_window(self, sweep_offset, max_harmonic=5):
+        """Calculates where the impulse response of a sweep is in a deconvolved sequence of overlapping sweeps.
+
+        Window starts half of the second harmonic delay before the linear impulse response so that the head of the
+        impulse response is kept but the harmonic distortion is left out. Window ends where the harmonic impulse
+        response of `max_harmonic` order of the next sweep starts.
+
+        Args:
+            sweep_offset: Time in seconds between starts of consecutive sweeps
+            max_harmonic: Highest harmonic order which is kept separated
+
+        Returns:
+            - Window start in samples relative to the start of the sweep in the recording
+            - Window length in samples
+        """
+        peak = self.zero_lag()
+        head = int(round(self.harmonic_delay(2) / 2 * self.fs))
+        length = int(round(sweep_offset * self.fs)) + head - int(round(self.harmonic_delay(max_harmonic) * self.fs))
+        if length <= head:
+            raise ValueError(
+                f'Sweep offset {sweep_offset:.2f}s is too short, harmonic distortion of the next sweep would overlap '
+                f'with the impulse response. Sweep offset must be more than {self.min_sweep_offset(0.0):.2f}s.')
+        return peak - head, length
+
+    def min_sweep_offset(self, ir_length, max_harmonic=5):
+        """Calculates shortest sweep offset for overlapping sweeps which keeps the impulse responses separated.
+
+        Impulse response of a sweep must decay before the harmonic distortion impulse responses of the next sweep
+        start.
+
+        Args:
+            ir_length: Length of the impulse response (decay time) in seconds
+            max_harmonic: Highest harmonic order which is kept separated
+
+        Returns:
+            Sweep offset in seconds
+        """
+        return ir_length + self.harmonic_delay(max_harmonic)
+
+    def test_signal_hash(self):
+        """SHA-256 hash of the generated test signal as hex string."""
+        if self._test_signal_hash is None:
+            data = np.ascontiguousarray(self.test_signal, dtype=np.float64)
+            self._test_signal_hash = hashlib.sha256(data.tobytes()).hexdigest()
+        return self._test_signal_hash
+
+    def signature(self):
+        """Signature which identifies the test signal.
+
+        Signature is embedded in the comment of the WAV files written by the estimator so that `from_wav()` can
+        identify the test signal without reading and comparing the audio data.
+
+        Returns:
+            Signature as JSON serializable dict
+        """
+        return {
+            'format': SIGNATURE_FORMAT,
+            'version': SIGNATURE_VERSION,
+            'fs': self.fs,
+            'length': len(self),
+            'low': float(self.low),
+            'high': float(self.high),
+            'n_octaves': float(self.n_octaves),
+            'fade_in': self.fade_in,
+            'fade_out': self.fade_out,
+            'hash': self.test_signal_hash()
+        }
+
+    def wav_metadata(self, **fields):
+        """WAV file metadata with the test signal signature in the comment.
+
+        Args:
+            **fields: Additional JSON serializable fields added to the signature
+
+        Returns:
+            Metadata dict for `utils.write_wav()`
+        """
+        return {'comment': json.dumps(dict(self.signature(), **fields))}
+
+    @staticmethod
+    def read_signature(file_path):
+        """Reads test signal signature from a WAV file, None if the file doesn't have one."""
+        metadata, _, _ = read_wav_metadata(file_path)
+        try:
+            signature = json.loads(metadata.get('comment', ''))
+        except ValueError:
+            return None
+        if not isinstance(signature, dict) or signature.get('format') != SIGNATURE_FORMAT \
+                or signature.get('version') != SIGNATURE_VERSION:
+            return None
+        return signature
 
     @classmethod
-    def from_wav(cls, file_path):
-        """Creates ImpulseResponseEstimator instance from test signal WAV."""
+    def from_wav(cls, file_path, cache=None):
+        """Creates ImpulseResponseEstimator instance from test signal WAV.
+
+        WAV files written by the estimator contain a signature of the test signal. When the signature matches the
+        signature of the estimator created with the same parameters, the audio data is not read at all and with a
+        cache the estimator is loaded without generating anything. Other files are compared sample by sample.
+
+        Signatures of sweep sequences and of test signals written together with a sequence contain the sequence
+        layout. Sweep sequence WAVs can be used as the test signal file and the layout is available in `sequence`
+        with the silence length applied to the estimator.
+
+        Args:
+            file_path: Path to test signal or sweep sequence WAV file
+            cache: EstimatorCache instance for loading the test signal and inverse filter
+
+        Returns:
+            ImpulseResponseEstimator instance
+        """
+        signature = cls.read_signature(file_path)
+        if signature is not None:
+            _, fs, n = read_wav_metadata(file_path)
+            sequence = signature.get('sequence')
+            ire = cls(
+                min_duration=(signature['length'] - 1) / fs, fs=fs, cache=cache,
+                fade_in=signature['fade_in'], fade_out=signature['fade_out'],
+                silence_length=sequence['silence_length'] if sequence is not None else 2.0
+            )
+            # Sequence files are longer than the test signal
+            if all(signature.get(key) == value for key, value in ire.signature().items()) \
+                    and (n == len(ire) or sequence is not None):
+                ire.sequence = sequence
+                return ire
+
         fs, data = read_wav(file_path)
-        ire = cls(min_duration=(len(data) - 1) / fs, fs=fs)
+        ire = cls(min_duration=(len(data) - 1) / fs, fs=fs, cache=cache)
         if np.max(ire.test_signal - data) > 1e-9:
             raise ValueError('Data read from WAV file does not match generated test signal. WAV file must be generated '
                              'with the current version of ImpulseResponseEstimator.')
@@ -272,11 +781,33 @@ def create_cli():
                                  'order of given speaker channels. Stereo sequence can be generated by supplying value '
                                  '"FL,FR". Supported channel names are "FL", "FR", "FC", "SL", "SR", "BL" and "BR".')
     arg_parser.add_argument('--tracks', type=str, required=False, default='mono',
-                            help='WAV file track configuration. Supported values are "mono", "stereo", "5.1" and '
-                                 '"7.1". This should be set according to sound card. Supported speaker names for '
-                                 '"stereo" are "FL" and "FR". Supported speaker names for "7.1" are "FL", "FR", "FC", '
-                                 '"BL" and "BR". Supported speaker names for "5.1" are "FL", "FR", "FC", '
-                                 '"SL", "SR", "BL" and "BR". "mono" will force speakers to "FL".')
+                            help='WAV file track configuration. Supported values are "mono", "stereo", "5.1", "7.1", '
+                                 '"7.1.4" and "9.1.6". This should be set according to sound card. Supported speaker '
+                                 'names for "stereo" are "FL" and "FR". Supported speaker names for "5.1" are "FL", '
+                                 '"FR", "FC", "BL" and "BR". "7.1" adds "SL" and "SR", "7.1.4" adds "TFL", "TFR", '
+                                 '"TBL" and "TBR" to "7.1" and "9.1.6" adds "WL", "WR", "TSL" and "TSR" to "7.1.4". '
+                                 '"mono" will force speakers to "FL".')
+    arg_parser.add_argument('--sweep_offset', type=float, required=False, default=None,
+                            help='Time in seconds between starts of consecutive sweeps in the test signal sequence. '
+                                 'When given, the sweeps overlap instead of being separated by silence which makes '
+                                 'the measurements much faster. Offset must be long enough for the room impulse '
+                                 'response to decay and for the harmonic distortion of the next sweep to stay '
+                                 'separate. Recordings need to be processed with the same sweep offset.')
+    arg_parser.add_argument('--repeats', type=int, required=False, default=1,
+                            help='Number of consecutive sweeps for each speaker in the test signal sequence. Takes are '
+                                 'aligned and averaged when the recordings are processed, which improves signal to '
+                                 'noise ratio more cheaply than a longer sweep. With three or more takes, noise bursts '
+                                 'in single takes are rejected. Recordings need to be processed with the same number '
+                                 'of repeats.')
+    arg_parser.add_argument('--silence_length', type=float, required=False, default=2.0,
+                            help='Length of silence in seconds before the first sweep and after each sweep in the test '
+                                 'signal sequence. Defaults to 2.0 seconds. Silence length is saved in the pickle '
+                                 'file.')
+    arg_parser.add_argument('--probe', type=str, required=False, default=None,
+                            help='Path to a recording of the single test signal in the room. When given, silence '
+                                 'length is calculated automatically from the decay time of the room instead of '
+                                 'using "--silence_length". The test signal has to be created first with the same '
+                                 'parameters and the recording needs to have enough silence after the sweep.')
     cli_args = arg_parser.parse_args()
     if not os.path.isdir(cli_args.dir_path):
         # File path is required
@@ -293,22 +824,47 @@ def main():
     bit_depth = cli_args.bit_depth
     speakers = cli_args.speakers.split(',')
     tracks = cli_args.tracks
-
-    # Create sweep sequence WAV data
-    ire = ImpulseResponseEstimator(min_duration=duration, fs=fs)
-    wav_data = ire.sweep_sequence(speakers, tracks)
+    sweep_offset = cli_args.sweep_offset
+
+    ire = ImpulseResponseEstimator(min_duration=duration, fs=fs, silence_length=cli_args.silence_length)
+    if cli_args.probe is not None:
+        # Size the silences by room decay time
+        probe_fs, probe = read_wav(cli_args.probe, expand=True)
+        if probe_fs != ire.fs:
+            raise ValueError('Sampling rate of probe recording must match sampling rate of test signal.')
+        ire.silence_length = ire.probe_silence_length(probe)
+        print(f'Silence length from probe recording: {ire.silence_length:.1f}s')
+    # Test signal files carry the layout of the sequence so that Impulcifer doesn't need it from the command line
+    ire.sequence = {
+        'speakers': speakers,
+        'tracks': tracks,
+        'sweep_offset': sweep_offset,
+        'silence_length': ire.silence_length,
+        'repeats': cli_args.repeats
+    }
 
     # Write test signal to WAV file
     file_name = f'sweep-{ire.file_name(bit_depth)}.wav'
-    write_wav(os.path.join(dir_path, file_name), ire.fs, ire.test_signal, bit_depth=bit_depth)
+    write_wav(
+        os.path.join(dir_path, file_name), ire.fs, ire.test_signal, bit_depth=bit_depth,
+        metadata=ire.wav_metadata(sequence=ire.sequence))
 
     # Write test signal to pickle file
     file_name = f'sweep-{ire.file_name(bit_depth)}.pkl'
     ire.to_pickle(os.path.join(dir_path, file_name))
 
     # Write test signal sequence to WAV file
-    file_name = f'sweep-seg-{",".join(speakers)}-{tracks}-{ire.file_name(bit_depth)}.wav'
-    write_wav(os.path.join(dir_path, file_name), fs, wav_data, bit_depth=bit_depth)
+    file_name = f'sweep-seg-{",".join(speakers)}-{tracks}-{ire.file_name(bit_depth)}'
+    if sweep_offset is not None:
+        file_name += f'-offset-{sweep_offset:.2f}s'
+    if ire.silence_length != 2.0:
+        file_name += f'-silence-{ire.silence_length:.1f}s'
+    if cli_args.repeats > 1:
+        file_name += f'-repeats-{cli_args.repeats}'
+    file_name += '.wav'
+    ire.write_sweep_sequence(
+        os.path.join(dir_path, file_name), speakers, tracks, sweep_offset=sweep_offset, repeats=cli_args.repeats,
+        bit_depth=bit_depth)
 
 
 if __name__ == '__main__':
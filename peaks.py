@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from scipy import signal
+
+EPSILON = 1e-20
+
+# Number of samples searched for the threshold crossing at a time
+SEARCH_BLOCK_LENGTH = 4096
+
+# Number of samples after the threshold crossing searched for the local maximum before falling back to find_peaks
+REFINE_LENGTH = 64
+
+
+def first_peaks(data, start=0, end=None, peak_height=0.12589, lengths=None):
+    """Finds the first high (negative or positive) peak in every channel at once.
+
+    Gives the same peaks as `scipy.signal.find_peaks()` for both polarities with a height threshold relative to the
+    maximum absolute value of the search range but doesn't look for all the peaks. The first sample which crosses the
+    threshold is found for all channels with `argmax()` of a boolean mask and the peak is the local maximum which
+    follows it. Channels where the local maximum is not found close to the crossing or is at the edge of the search
+    range are searched with `find_peaks()`.
+
+    Args:
+        data: Impulse responses as Numpy array with shape (n_channels, n_samples)
+        start: Index for start of search range
+        end: Index for end of search range, limits the search to the direct sound so that late reflections are not
+             scanned. Search range ends at the end of each channel when None.
+        peak_height: Minimum peak height relative to the maximum of the search range. Default is -18 dBFS
+        lengths: Number of valid samples in each channel when the channels have been zero padded to a common length,
+                 all samples are valid when None
+
+    Returns:
+        Peak indices as Numpy array, start of the search range for silent channels and zero for empty channels
+    """
+    data = np.atleast_2d(data)
+    n_channels, n_samples = data.shape
+    lengths = np.full(n_channels, n_samples, dtype=int) if lengths is None else np.asarray(lengths, dtype=int)
+    ends = lengths if end is None else np.minimum(lengths, end)
+    peaks = np.where(lengths > 0, start, 0)
+    width = int(np.max(ends, initial=0)) - start
+    if width <= 0:
+        return peaks
+
+    x = data[:, start:start + width]
+    if np.any(ends - start < width):
+        # Samples outside of the search range of each channel are ignored
+        x = np.where(np.arange(width) < (ends - start)[:, np.newaxis], x, 0)
+    max_abs = np.maximum(np.max(x, axis=1), -np.min(x, axis=1))
+    active = (ends > start) & (max_abs >= EPSILON)
+    if not np.any(active):
+        return peaks
+    max_abs = np.where(active, max_abs, 1).astype(x.dtype, copy=False)
+
+    # First sample crossing the threshold, normalized the same way as the data searched by find_peaks. Direct sound is
+    # usually in the beginning so the search proceeds in blocks and stops when every channel has crossed.
+    crossing = np.zeros(n_channels, dtype=int)
+    searching = active.copy()
+    for block_start in range(0, width, SEARCH_BLOCK_LENGTH):
+        rows = np.flatnonzero(searching)
+        block = x[rows, block_start:block_start + SEARCH_BLOCK_LENGTH]
+        block = np.abs(block) / max_abs[rows, np.newaxis] >= peak_height
+        crossed = np.any(block, axis=1)
+        crossing[rows[crossed]] = block_start + np.argmax(block[crossed], axis=1)
+        searching[rows[crossed]] = False
+        if not np.any(searching):
+            break
+
+    # Local maximum of the crossing polarity after the crossing, peak of a plateau is its middle sample
+    rows = np.arange(n_channels)[:, np.newaxis]
+    indices = crossing[:, np.newaxis] + np.arange(REFINE_LENGTH + 1)
+    polarity = np.where(x[rows[:, 0], crossing] < 0, -1, 1).astype(x.dtype)
+    y = x[rows, np.minimum(indices, width - 1)] / max_abs[:, np.newaxis] * polarity[:, np.newaxis]
+    diff = np.diff(y, axis=1)
+    falls = diff < 0
+    found = np.any(falls, axis=1)
+    right = np.argmax(falls, axis=1)
+    # Values only rise or stay the same before the first fall, plateau starts after the last rise
+    offsets = np.arange(REFINE_LENGTH)
+    left = np.max(np.where((diff > 0) & (offsets < right[:, np.newaxis]), offsets, -1), axis=1) + 1
+    peak = crossing + (left + right) // 2
+
+    # Index zero and the last sample of the search range can't be peaks, these are left for find_peaks
+    resolved = active & found & (crossing > 0) & (crossing + right + 1 < ends - start)
+    peaks = np.where(resolved, peak + start, peaks)
+    for i in np.flatnonzero(active & ~resolved):
+        peaks[i] = start + _first_peak(x[i, :ends[i] - start] / max_abs[i], peak_height)
+    return peaks
+
+
+def _first_peak(x, peak_height):
+    """First peak of normalized data with find_peaks, absolute maximum when there are no peaks."""
+    peaks_pos, _ = signal.find_peaks(x, height=peak_height)
+    peaks_neg, _ = signal.find_peaks(x * -1.0, height=peak_height)
+    peaks = np.concatenate([peaks_pos, peaks_neg])
+    if len(peaks) == 0:
+        return int(np.argmax(np.abs(x)))
+    return int(np.min(peaks))
@@ -3,6 +3,7 @@
 import os
 import re
 import sounddevice as sd
+import soundfile as sf
 from utils import read_wav, write_wav
 import numpy as np
 from threading import Thread
@@ -174,9 +175,13 @@ def play_and_record(
         output_device=None,
         host_api=None,
         channels=2,
-        append=False):
+        append=False,
+        block_size=2**14):
     """Plays one file and records another at the same time
 
+    Playback file is streamed from the disk in blocks so that long multi-track sweep sequences don't need to fit in
+    memory.
+
     Args:
         play: File path to playback file
         record: File path to output recording file
@@ -186,6 +191,7 @@ def play_and_record(
         channels: Number of output channels
         append: Add track(s) to an existing file? Silence will be added to end of each track to make all equal in
                 length
+        block_size: Number of samples to read from the playback file and write to the output device at a time
 
     Returns:
         None
@@ -194,9 +200,13 @@ def play_and_record(
     out_dir, out_file = os.path.split(os.path.abspath(record))
     os.makedirs(out_dir, exist_ok=True)
 
-    # Read playback file
-    fs, data = read_wav(play)
-    n_channels = data.shape[0]
+    # Open playback file
+    if not os.path.isfile(play):
+        raise FileNotFoundError(f'File in path "{os.path.abspath(play)}" does not exist.')
+    with sf.SoundFile(play) as f:
+        fs = f.samplerate
+        n_channels = f.channels
+        length = f.frames
 
     # Find and set devices as default
     input_device, output_device = get_devices(
@@ -212,11 +222,15 @@ def play_and_record(
 
     recorder = Thread(
         target=record_target,
-        args=(record, data.shape[1], fs),
+        args=(record, length, fs),
         kwargs={'channels': channels, 'append': append}
     )
     recorder.start()
-    sd.play(np.transpose(data), samplerate=fs, blocking=True)
+    with sf.SoundFile(play) as f, sd.OutputStream(samplerate=fs, channels=n_channels, dtype='float32') as stream:
+        # Blocking writes keep the output buffer filled
+        for block in f.blocks(blocksize=block_size, dtype='float32', always_2d=True):
+            stream.write(block)
+    recorder.join()
 
 
 def create_cli():
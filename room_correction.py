@@ -20,7 +20,13 @@ def room_correction(
         fr_combination_method='average',
         specific_limit=20000,
         generic_limit=1000,
-        plot=False):
+        plot=False,
+        sweep_offset=None,
+        repeats=1,
+        stream=False,
+        mmap=False,
+        workers=1,
+        debug=False):
     """Corrects room acoustics
 
     Args:
@@ -33,6 +39,15 @@ def room_correction(
         specific_limit: Upper limit in Hertz for equalization of specific room eq. 0 disables limit.
         generic_limit: Upper limit in Hertz for equalization of generic room eq. 0 disables limit.
         plot: Plot graphs?
+        sweep_offset: Time in seconds between starts of consecutive overlapping sweeps in speaker-ear specific room
+                      measurements. None when sweeps are separated by silence.
+        repeats: Number of consecutive sweeps (takes) for each speaker in speaker-ear specific room measurements.
+        stream: Read and deconvolve speaker-ear specific room measurements in blocks instead of reading whole files
+                into memory.
+        mmap: Read the sweep windows of speaker-ear specific room measurements through memory mapped views of the
+              files.
+        workers: Number of speaker-ear specific room measurement files read and deconvolved in parallel.
+        debug: Write room impulse responses to room-responses.wav?
 
     Returns:
         - Room Impulse Responses as HRIR or None
@@ -41,7 +56,8 @@ def room_correction(
     # Open files
     target = open_room_target(estimator, dir_path, target=target)
     mic_calibration = open_mic_calibration(estimator, dir_path, mic_calibration=mic_calibration)
-    rir = open_room_measurements(estimator, dir_path)
+    rir = open_room_measurements(
+        estimator, dir_path, sweep_offset=sweep_offset, repeats=repeats, stream=stream, mmap=mmap, workers=workers)
     missing = [ch for ch in SPEAKER_NAMES if ch not in rir.irs]
     room_fr = open_generic_room_measurement(
         estimator,
@@ -66,7 +82,8 @@ def room_correction(
             for side, ir in pair.items():
                 ir.crop_head()
         rir.crop_tails()
-        rir.write_wav(os.path.join(dir_path, 'room-responses.wav'))
+        if debug:
+            rir.write_wav(os.path.join(dir_path, 'room-responses.wav'))
 
         if plot:
             # Plot all but frequency response
@@ -146,12 +163,18 @@ def room_correction(
     return rir, frs
 
 
-def open_room_measurements(estimator, dir_path):
+def open_room_measurements(estimator, dir_path, sweep_offset=None, repeats=1, stream=False, mmap=False, workers=1):
     """Opens speaker-ear specific room measurements.
 
     Args:
         estimator: ImpulseResponseEstimator instance
         dir_path: Path to directory
+        sweep_offset: Time in seconds between starts of consecutive overlapping sweeps. None when sweeps are separated
+                      by silence.
+        repeats: Number of consecutive sweeps (takes) for each speaker.
+        stream: Read and deconvolve the files in blocks instead of reading whole files into memory.
+        mmap: Read the sweep windows through memory mapped views of the files.
+        workers: Number of files read and deconvolved in parallel.
 
     Returns:
         HRIR instance with the room measurements
@@ -160,7 +183,8 @@ def open_room_measurements(estimator, dir_path):
     rir = HRIR(estimator)
     # room-BL,SL.wav, room-left-FL,FR.wav, room-right-FC.wav, etc...
     pattern = rf'^room-{SPEAKER_LIST_PATTERN}(-(left|right))?\.wav$'
-    for i, file_name in enumerate([f for f in os.listdir(dir_path) if re.match(pattern, f)]):
+    recordings = []
+    for file_name in sorted(f for f in os.listdir(dir_path) if re.match(pattern, f)):
         # Read the speaker names from the file name into a list
         speakers = re.search(SPEAKER_LIST_PATTERN, file_name)
         if speakers is not None:
@@ -171,8 +195,10 @@ def open_room_measurements(estimator, dir_path):
         side = re.search(r'(left|right)', file_name)
         if side is not None:
             side = side[0]
-        # Read file
-        rir.open_recording(file_path, speakers, side=side)
+        recordings.append((file_path, speakers, side))
+    # Read files
+    rir.open_recordings(
+        recordings, workers=workers, sweep_offset=sweep_offset, repeats=repeats, stream=stream, mmap=mmap)
     return rir
 
 
@@ -203,29 +229,37 @@ def open_generic_room_measurement(estimator,
         return None
 
     # Read the file
-    fs, data = read_wav(file_path, expand=True)
+    fs, data = read_wav(file_path, expand=True, dtype=estimator.dtype)
 
     if fs != estimator.fs:
         raise ValueError(f'Sampling rate of "{file_path}" doesn\'t match!')
 
     # Average frequency responses of all tracks of the generic room measurement file
-    irs = []
+    sweeps = []
+    silence_length = int(round(estimator.silence_length * estimator.fs))
     for track in data:
-        n_cols = int(round((len(track) / estimator.fs - 2) / (estimator.duration + 2)))
+        n_cols = int(round((len(track) - silence_length) / (silence_length + len(estimator))))
         for i in range(n_cols):
-            # Starts at 2 seconds in the beginning plus previous sweeps and their tails
-            start = int(2 * estimator.fs + i * (2 * estimator.fs + len(estimator)))
+            # Starts after the initial silence plus previous sweeps and their tails
+            start = silence_length + i * (silence_length + len(estimator))
             # Ends at start plus one more (current) sweep
-            end = int(start + 2 * estimator.fs + len(estimator))
+            end = start + silence_length + len(estimator)
             end = min(end, len(track))
             # Select current sweep
-            sweep = track[start:end]
-            # Deconvolve as impulse response
-            ir = ImpulseResponse(estimator.estimate(sweep), estimator.fs, sweep)
-            # Crop harmonic distortion from the head
-            # Noise in the tail should not affect frequency response so it doesn't have to be cropped
-            ir.crop_head(head_ms=1)
-            irs.append(ir)
+            sweeps.append(track[start:end])
+
+    # Deconvolve all sweeps as impulse responses in one pass, shorter sweeps are zero padded for it
+    segments = np.zeros((len(sweeps), max(len(sweep) for sweep in sweeps)))
+    for i, sweep in enumerate(sweeps):
+        segments[i, :len(sweep)] = sweep
+    estimates = estimator.estimate_batch(segments)
+    irs = []
+    for sweep, estimate in zip(sweeps, estimates):
+        ir = ImpulseResponse(estimate[:len(sweep)], estimator.fs, sweep)
+        # Crop harmonic distortion from the head
+        # Noise in the tail should not affect frequency response so it doesn't have to be cropped
+        ir.crop_head(head_ms=1)
+        irs.append(ir)
 
     # Frequency response for the generic room measurement
     room_fr = FrequencyResponse(
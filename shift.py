@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+from functools import lru_cache
+import numpy as np
+from scipy import signal
+from scipy.special import comb
+
+# Fractional parts closer than this to a whole sample are treated as whole sample delays
+FRACTION_TOLERANCE = 1e-6
+
+
+def shift(x, delay, out=None, method='sinc'):
+    """Shifts signals by a delay in samples, the vacated samples are filled with zeros.
+
+    Whole sample shifts only copy the samples and can be done in place by giving the input as the output. Fractional
+    delays are done with a windowed sinc FIR filter or a Thiran all-pass filter before the whole sample shift.
+
+    Args:
+        x: Numpy array with samples on the last axis
+        delay: Delay in samples, positive values delay and negative values advance the signal
+        out: Output array, can be x itself for shifting in place and can have a different length than x. New array with
+             the shape of x is created when None.
+        method: Fractional delay method, "sinc" for windowed sinc or "thiran" for Thiran all-pass
+
+    Returns:
+        Output array
+    """
+    if out is None:
+        out = np.empty_like(x)
+    whole = int(np.round(delay))
+    fraction = float(delay) - whole
+    if abs(fraction) > FRACTION_TOLERANCE:
+        x = fractional_delay(x, fraction, method=method)
+    n = x.shape[-1]
+    m = out.shape[-1]
+    if whole >= 0:
+        k = max(min(n, m - whole), 0)
+        # Overlapping copy is safe, Numpy buffers it when the input and output share memory
+        out[..., whole:whole + k] = x[..., :k]
+        out[..., :min(whole, m)] = 0.0
+        out[..., whole + k:] = 0.0
+    else:
+        k = max(min(n + whole, m), 0)
+        out[..., :k] = x[..., -whole:-whole + k]
+        out[..., k:] = 0.0
+    return out
+
+
+def shift_channels(data, delays, out=None, method='sinc'):
+    """Shifts every channel by its own delay, the vacated samples are filled with zeros.
+
+    Fractional parts of the delays are applied to all the channels which need them at once, windowed sinc kernels are
+    stacked and convolved with a single FFT convolution and Thiran all-pass filters are run once per distinct
+    fraction. Whole sample shifts are slice copies straight into the output like in `shift()`, the slices are computed
+    once for all the channels which share a delay and channels shifted in place by zero samples are not copied.
+
+    Args:
+        data: Numpy array with samples on the last axis, e.g. (n_speakers, 2, n) HRIR data. Broadcasts to the shape of
+              the output without the last axis so one set of signals can be shifted by many delays.
+        delays: Delays in samples, shape broadcasts to the shape of the output without the last axis
+        out: Output array, can be data itself for shifting in place and can have a different length than data. New
+             array with the shape of data is created when None.
+        method: Fractional delay method, see `shift()`
+
+    Returns:
+        Output array
+    """
+    if out is None:
+        out = np.empty_like(data)
+    shape = out.shape[:-1]
+    n = data.shape[-1]
+    m = out.shape[-1]
+    data = np.broadcast_to(data, shape + (n,))
+    delays = np.broadcast_to(np.asarray(delays, dtype=float), shape)
+    whole = np.round(delays).astype(int)
+    fraction = delays - whole
+    channels = list(np.ndindex(*shape))
+
+    # Fractionally delayed copies of the channels which need them
+    sources = dict()
+    fractional = [channel for channel in channels if abs(fraction[channel]) > FRACTION_TOLERANCE]
+    if fractional:
+        x = np.stack([data[channel] for channel in fractional])
+        fractions = np.round([fraction[channel] for channel in fractional], 9)
+        if method == 'sinc':
+            kernels = np.stack([sinc_kernel(f) for f in fractions])
+            half = kernels.shape[1] // 2
+            y = signal.oaconvolve(x, kernels, axes=-1)[:, half:half + n].astype(x.dtype, copy=False)
+        else:
+            y = np.empty_like(x)
+            for f in np.unique(fractions):
+                rows = np.flatnonzero(fractions == f)
+                y[rows] = fractional_delay(x[rows], f, method=method)
+        sources = dict(zip(fractional, y))
+
+    groups = dict()
+    for channel in channels:
+        groups.setdefault(int(whole[channel]), []).append(channel)
+    for delay, group in groups.items():
+        # Destination and source slices, and the slices which are left empty
+        if delay >= 0:
+            k = max(min(n, m - delay), 0)
+            dst, src, zeros = slice(delay, delay + k), slice(0, k), [slice(0, min(delay, m)), slice(delay + k, m)]
+        else:
+            k = max(min(n + delay, m), 0)
+            dst, src, zeros = slice(0, k), slice(-delay, -delay + k), [slice(k, m)]
+        for channel in group:
+            y = out[channel]
+            x = sources[channel] if channel in sources else data[channel]
+            if delay == 0 and n == m and x.ctypes.data == y.ctypes.data and x.strides == y.strides:
+                # Shifted in place by nothing
+                continue
+            # Overlapping copy is safe, Numpy buffers it when the input and output share memory
+            y[dst] = x[src]
+            for z in zeros:
+                y[z] = 0.0
+    return out
+
+
+def fractional_delay(x, fraction, method='sinc'):
+    """Delays signals by a fraction of a sample without changing their length.
+
+    Args:
+        x: Numpy array with samples on the last axis
+        fraction: Delay between -0.5 and 0.5 samples
+        method: "sinc" for windowed sinc FIR filter or "thiran" for Thiran all-pass filter
+
+    Returns:
+        Delayed signals as a new array
+    """
+    fraction = round(fraction, 9)
+    if method == 'sinc':
+        kernel = sinc_kernel(fraction)
+        half = len(kernel) // 2
+        y = signal.oaconvolve(x, kernel.reshape((1,) * (x.ndim - 1) + (-1,)), axes=-1)
+        return y[..., half:half + x.shape[-1]].astype(x.dtype, copy=False)
+    elif method == 'thiran':
+        b, a = thiran_coefficients(fraction)
+        order = len(a) - 1
+        # All-pass delay is the order plus the fraction, advance by the order afterwards
+        y = signal.lfilter(b, a, np.concatenate([x, np.zeros(x.shape[:-1] + (order,), dtype=x.dtype)], axis=-1))
+        return y[..., order:].astype(x.dtype, copy=False)
+    raise ValueError(f'Unknown fractional delay method "{method}".')
+
+
+@lru_cache(maxsize=256)
+def sinc_kernel(fraction, half=32):
+    """Blackman windowed sinc fractional delay FIR filter.
+
+    Args:
+        fraction: Delay between -0.5 and 0.5 samples
+        half: Number of taps on each side of the center tap
+
+    Returns:
+        FIR filter with 2 * half + 1 taps, center tap is at zero delay
+    """
+    t = np.arange(-half, half + 1) - fraction
+    kernel = np.sinc(t) * np.blackman(2 * half + 3)[1:-1]
+    kernel /= np.sum(kernel)
+    kernel.setflags(write=False)
+    return kernel
+
+
+@lru_cache(maxsize=256)
+def thiran_coefficients(fraction, order=3):
+    """Thiran all-pass fractional delay filter with a maximally flat group delay of order + fraction samples.
+
+    Args:
+        fraction: Delay between -0.5 and 0.5 samples
+        order: Filter order
+
+    Returns:
+        - Numerator coefficients
+        - Denominator coefficients
+    """
+    delay = order + fraction
+    a = np.array([
+        (-1) ** k * comb(order, k) * np.prod([(delay - order + n) / (delay - order + k + n) for n in range(order + 1)])
+        for k in range(order + 1)
+    ])
+    b = a[::-1].copy()
+    a.setflags(write=False)
+    b.setflags(write=False)
+    return b, a
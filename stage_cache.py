@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import pickle
+import hashlib
+import warnings
+from artifacts import atomic_write, record_artifacts
+
+# Bump this when a processing stage changes so that results of the old implementation are not used anymore
+STAGE_CACHE_VERSION = 6
+
+
+class StageCache:
+    """Persistent cache of processing stage results in a measurement directory.
+
+    Each stage result is stored with a key which is a hash of everything the stage depends on: contents of the input
+    files, the parameters and the keys of the stages it builds on. Keys are chained so a change in an early stage
+    invalidates every stage after it while a change in a late stage parameter reuses all the earlier results. Only the
+    latest result of each stage is kept. Output files which a stage writes with `artifacts.write_artifact()`, such as
+    plots, are recorded with the result and the stage is computed again when any of them is missing.
+    """
+
+    def __init__(self, dir_path, enabled=True):
+        """
+        Args:
+            dir_path: Path to the cache directory
+            enabled: Use the cache? When disabled every stage is computed and nothing is stored.
+        """
+        self.dir_path = dir_path
+        self.enabled = enabled
+        self._file_hashes = dict()
+
+    @staticmethod
+    def key(*parents, **params):
+        """Creates stage key.
+
+        Args:
+            *parents: Keys of the stages this stage builds on
+            **params: JSON serializable parameters and input file hashes of the stage
+
+        Returns:
+            Key as hex string
+        """
+        content = {'version': STAGE_CACHE_VERSION, 'parents': parents, 'params': params}
+        return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def file_hashes(self, file_paths):
+        """Hashes input files.
+
+        Args:
+            file_paths: Paths to the input files. Files which don't exist are left out.
+
+        Returns:
+            Dict of SHA-256 hashes with file names as keys
+        """
+        hashes = dict()
+        for file_path in sorted(file_paths):
+            if not os.path.isfile(file_path):
+                continue
+            stat = os.stat(file_path)
+            memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+            if memo_key not in self._file_hashes:
+                sha = hashlib.sha256()
+                with open(file_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(2**20), b''):
+                        sha.update(chunk)
+                self._file_hashes[memo_key] = sha.hexdigest()
+            hashes[os.path.basename(file_path)] = self._file_hashes[memo_key]
+        return hashes
+
+    def run(self, stage, key, fn):
+        """Returns cached stage result or computes and stores it.
+
+        Args:
+            stage: Stage name
+            key: Stage key as returned by `key()`
+            fn: Function which computes the stage result, called without arguments
+
+        Returns:
+            Stage result
+        """
+        if self.enabled:
+            found, value = self.load(stage, key)
+            if found:
+                print(f'Using cached {stage} stage.')
+                return value
+        with record_artifacts() as outputs:
+            value = fn()
+        if self.enabled:
+            self.store(stage, key, value, outputs=outputs)
+        return value
+
+    def _path(self, stage):
+        return os.path.join(self.dir_path, f'{stage}.pkl')
+
+    def load(self, stage, key):
+        """Loads stage result if the stored result has the given key and its output files exist.
+
+        Args:
+            stage: Stage name
+            key: Stage key
+
+        Returns:
+            - True if the result was found
+            - Stage result or None
+        """
+        try:
+            with open(self._path(stage), 'rb') as f:
+                # Key and output files are pickled separately before the result so that a stale result is never
+                # unpickled
+                if pickle.load(f) != key:
+                    return False, None
+                outputs = pickle.load(f)
+                if not all(os.path.isfile(os.path.join(self.dir_path, path)) for path in outputs):
+                    return False, None
+                return True, pickle.load(f)
+        except (OSError, EOFError, ValueError, AttributeError, ImportError, pickle.UnpicklingError):
+            # Missing or broken entry
+            return False, None
+
+    def store(self, stage, key, value, outputs=None):
+        """Stores stage result, replaces the previous result of the stage.
+
+        Args:
+            stage: Stage name
+            key: Stage key
+            value: Picklable stage result
+            outputs: Paths to the output files written by the stage
+
+        Returns:
+            None
+        """
+        try:
+            os.makedirs(self.dir_path, exist_ok=True)
+            # Relative to the cache so that moving the measurement directory doesn't invalidate the results
+            outputs = sorted({os.path.relpath(os.path.abspath(path), self.dir_path) for path in outputs or []})
+            data = pickle.dumps(key) + pickle.dumps(outputs) + pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            atomic_write(self._path(stage), data)
+        except OSError as err:
+            warnings.warn(f'Could not write stage cache to "{self.dir_path}": {err}')
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from scipy import signal
+from alignment import cross_correlation_lags, parabolic_peak, LagTable
+from impulse_response_estimator import ImpulseResponseEstimator
+from impulse_response import ImpulseResponse
+from hrir import HRIR
+
+
+def noise_burst(n=2048, start=200, length=400, seed=0):
+    """Band limited noise burst in silence."""
+    rng = np.random.default_rng(seed)
+    x = np.zeros(n)
+    x[start:start + length] = signal.sosfilt(signal.butter(8, 0.3, output='sos'), rng.standard_normal(length))
+    return x
+
+
+def fractional_delay(x, delay):
+    """Delays signal by a phase shift in frequency domain."""
+    f = np.fft.rfftfreq(len(x))
+    return np.fft.irfft(np.fft.rfft(x) * np.exp(-2j * np.pi * f * delay), len(x))
+
+
+@pytest.mark.parametrize('weighting', [None, 'phat'])
+def test_lag_sign_matches_scipy_correlate(weighting):
+    y = noise_burst()
+    delays = [-37, -1, 0, 1, 5, 120]
+    x = np.vstack([np.roll(y, delay) for delay in delays])
+    lags = cross_correlation_lags(x, np.tile(y, (len(delays), 1)), weighting=weighting, interpolate=False)
+    for delay, row, lag in zip(delays, x, lags):
+        corr = signal.correlate(row, y, mode='full')
+        expected = signal.correlation_lags(len(row), len(y), mode='full')[np.argmax(corr)]
+        # Positive lag means that x is delayed relative to y
+        assert expected == delay
+        assert lag == expected
+
+
+def test_lags_of_swapped_signals_are_negated():
+    y = noise_burst()
+    x = fractional_delay(y, 7.3)
+    assert cross_correlation_lags(x, y) == pytest.approx(-cross_correlation_lags(y, x), abs=1e-9)
+
+
+@pytest.mark.parametrize('delay', [0.25, -0.4, 3.7, -12.5])
+def test_refined_lag_matches_fractional_delay(delay):
+    y = noise_burst()
+    x = fractional_delay(y, delay)
+    assert cross_correlation_lags(x, y) == pytest.approx(delay, abs=0.05)
+    assert abs(cross_correlation_lags(x, y, interpolate=False) - delay) <= 0.5
+    # Phase transform whitens the spectra, the sharper peak is refined less precisely
+    assert cross_correlation_lags(x, y, weighting='phat') == pytest.approx(delay, abs=0.2)
+
+
+def test_lag_table():
+    fs = 8000
+    hrir = HRIR(ImpulseResponseEstimator(min_duration=1.0, fs=fs))
+    y = noise_burst()
+    # Gaussian pulses without side lobes peaking at 100 and 102.6 samples
+    pulse, delayed_pulse = [np.exp(-0.5 * ((np.arange(512) - peak) / 2) ** 2) for peak in [100, 102.6]]
+    # Right ear is 2.6 samples later
+    hrir.irs['FL'] = {'left': ImpulseResponse(y, fs), 'right': ImpulseResponse(fractional_delay(y, 2.6), fs)}
+    # Negative polarity of the left ear doesn't change its peak position
+    hrir.irs['FR'] = {'left': ImpulseResponse(-pulse, fs), 'right': ImpulseResponse(delayed_pulse, fs)}
+    table = LagTable(
+        hrir, pairs=[(('FL', 'right'), ('FL', 'left'))], channels=[('FR', 'left'), ('FR', 'right')], segment_ms=200)
+    assert table.lag(('FL', 'right'), ('FL', 'left')) == pytest.approx(2.6, abs=0.05)
+    assert table.lag(('FL', 'left'), ('FL', 'right')) == -table.lag(('FL', 'right'), ('FL', 'left'))
+    assert table.peak('FR', 'left') == pytest.approx(100)
+    assert table.peak('FR', 'right') == pytest.approx(102.6, abs=0.1)
+
+
+def test_unknown_weighting():
+    with pytest.raises(ValueError):
+        cross_correlation_lags(np.zeros(16), np.zeros(16), weighting='foo')
+
+
+def test_parabolic_peak():
+    # Samples of a parabola with the vertex at 10.3
+    y = -(np.arange(20) - 10.3) ** 2
+    assert parabolic_peak(y, 10) == pytest.approx(10.3)
+    # Peaks at the edges are not refined
+    assert parabolic_peak(np.arange(20.0), 19) == 19
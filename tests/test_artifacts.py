@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import pytest
+import artifacts
+import impulcifer
+from artifacts import ArtifactManifest, write_artifact, MANIFEST_FILE_NAME
+
+
+def test_unchanged_files_are_skipped(tmp_path):
+    file_path = str(tmp_path / 'a.txt')
+    with ArtifactManifest(tmp_path) as manifest:
+        assert write_artifact(file_path, b'foo')
+    assert (manifest.n_written, manifest.n_skipped) == (1, 0)
+
+    # Same content is skipped, changed content is written
+    with ArtifactManifest(tmp_path) as manifest:
+        assert not write_artifact(file_path, b'foo')
+        assert write_artifact(str(tmp_path / 'b.txt'), b'bar')
+    assert (manifest.n_written, manifest.n_skipped) == (1, 1)
+    with ArtifactManifest(tmp_path) as manifest:
+        assert write_artifact(file_path, b'baz')
+    with open(file_path, 'rb') as f:
+        assert f.read() == b'baz'
+
+
+@pytest.mark.parametrize('change', ['modify', 'delete'])
+def test_outside_change_forces_rewrite(tmp_path, change):
+    file_path = str(tmp_path / 'a.txt')
+    with ArtifactManifest(tmp_path):
+        write_artifact(file_path, b'foo')
+    if change == 'modify':
+        with open(file_path, 'wb') as f:
+            f.write(b'changed')
+    else:
+        os.remove(file_path)
+
+    with ArtifactManifest(tmp_path) as manifest:
+        assert write_artifact(file_path, b'foo')
+    assert (manifest.n_written, manifest.n_skipped) == (1, 0)
+    with open(file_path, 'rb') as f:
+        assert f.read() == b'foo'
+
+
+def test_files_outside_manifest_are_not_tracked(tmp_path):
+    os.makedirs(tmp_path / 'tracked')
+    with ArtifactManifest(tmp_path / 'tracked') as manifest:
+        assert write_artifact(str(tmp_path / 'a.txt'), b'foo')
+        assert write_artifact(str(tmp_path / 'a.txt'), b'foo')
+    assert manifest.entries == dict()
+
+
+def test_failed_run_keeps_written_hashes(tmp_path, monkeypatch):
+    """Manifest of a run which raises is closed and saved with the files written before the error."""
+    file_path = str(tmp_path / 'README.md')
+
+    def fail(*args, **kwargs):
+        write_artifact(file_path, b'foo')
+        raise RuntimeError('Failed')
+
+    monkeypatch.setattr(impulcifer, 'open_impulse_response_estimator', fail)
+    with pytest.raises(RuntimeError):
+        impulcifer.main(dir_path=str(tmp_path))
+    assert artifacts._active_manifests == []
+    with open(tmp_path / MANIFEST_FILE_NAME, 'r', encoding='utf-8') as f:
+        assert 'README.md' in json.load(f)['files']
+
+    with ArtifactManifest(tmp_path) as manifest:
+        assert not write_artifact(file_path, b'foo')
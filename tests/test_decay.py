@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from scipy import stats
+import decay
+
+EPSILON = 1e-20
+
+
+def lundeby(data, fs, peak_index):
+    """Single channel Lundeby method which the batched implementation replaced, kept as the reference."""
+    if len(data) < 10:
+        return 0, len(data), -200.0, len(data) if len(data) > 0 else 1
+
+    # 1. Squared impulse response from peak to 2 seconds after the peak, normalized to its maximum
+    data = data.astype(np.float64)
+    segment = data[peak_index:min(peak_index + int(2 * fs), len(data))]
+    max_abs = np.max(np.abs(segment))
+    squared = (segment / max_abs if max_abs >= EPSILON else segment) ** 2
+    t_squared = np.linspace(0, len(squared) / fs, len(squared))
+
+    wd = 0.03
+    n = int(len(squared) / fs / wd)
+    if n == 0:
+        return peak_index, peak_index + len(squared), 10 * np.log10(max(np.mean(squared), EPSILON)), len(squared)
+    w = max(int(len(squared) / n), 1)
+    t_windows = np.arange(n) * wd + wd / 2
+    windows = 10 * np.log10(np.maximum(np.mean(np.reshape(squared[:n * w], (n, w)), axis=1), EPSILON))
+
+    # 2. First estimate of the noise floor from the last 10 %
+    noise_floor = 10 * np.log10(max(np.mean(squared[int(len(squared) * 0.9):]), EPSILON))
+
+    # 3. Decay slope from the windows above noise floor + 10 dB
+    candidates = np.where(windows <= noise_floor + 10.0)[0]
+    regression_end = candidates[0] if len(candidates) and candidates[0] > 0 else len(windows)
+    if regression_end < 2:
+        if len(windows) < 2:
+            return peak_index, peak_index + len(squared), noise_floor, w
+        regression_end = len(windows)
+    slope, intercept, _, _, _ = stats.linregress(t_windows[:regression_end], windows[:regression_end])
+    if np.isnan(slope) or abs(slope) < EPSILON:
+        return peak_index, peak_index + len(squared), noise_floor, w
+
+    # 4. Preliminary knee point
+    knee_point_time = np.clip((noise_floor - intercept) / slope, t_squared[0], t_squared[-1])
+
+    # 5. New time interval length, 3 windows per 10 dB
+    wd = 10 / (abs(slope) * 3)
+    n = max(int(len(squared) / fs / wd), 1)
+    w = max(int(len(squared) / n), 1)
+    n = min(n, len(squared) // w)
+    t_windows = np.arange(n) * wd + wd / 2
+
+    # 6. Squared impulse response averaged into the new time intervals
+    windows = 10 * np.log10(np.maximum(np.mean(np.reshape(squared[:n * w], (n, w)), axis=1), EPSILON))
+    knee_candidates = np.argwhere(t_windows >= knee_point_time)
+    if len(knee_candidates):
+        knee_idx = knee_candidates[0, 0]
+    else:
+        knee_idx = n - 1
+        knee_point_time = t_windows[-1]
+    knee_val = windows[knee_idx]
+
+    # Steps 7–9 are iterated
+    noise_floor_iter = noise_floor
+    for _ in range(5):
+        # 7. Noise floor from where decay is 5 dB below the knee point value
+        candidates = np.argwhere(windows <= knee_val - 5)
+        if not len(candidates):
+            break
+        noise_start_time = max(t_windows[candidates[0, 0]], 0.1 * t_squared[-1])
+        if noise_start_time > t_windows[-1]:
+            break
+        noise_end_time = min(noise_start_time + knee_point_time, t_squared[-1])
+        noise_start = np.argmin(np.abs(t_squared - noise_start_time))
+        noise_end = np.argmin(np.abs(t_squared - noise_end_time))
+        if noise_start >= noise_end:
+            break
+        noise_floor_iter = 10 * np.log10(max(np.mean(squared[noise_start:noise_end]), EPSILON))
+
+        # 8. Late decay slope from 8 dB above the noise floor for 20 dB dynamic range
+        end_candidates = np.argwhere(windows <= noise_floor_iter + 8.0)
+        start_candidates = np.argwhere(windows <= noise_floor_iter + 28.0)
+        if not len(end_candidates) or not len(start_candidates):
+            break
+        late_end = end_candidates[0, 0] - 1
+        late_start = max(start_candidates[0, 0] - 1, 0)
+        if late_end <= late_start + 1:
+            break
+        late_slope, late_intercept, _, _, _ = stats.linregress(
+            t_windows[late_start:late_end], windows[late_start:late_end])
+        if np.isnan(late_slope) or abs(late_slope) < EPSILON:
+            break
+
+        # 9. New knee point
+        new_knee_time = np.clip((noise_floor_iter - late_intercept) / late_slope, t_windows[0], t_windows[-1])
+        candidates = np.argwhere(t_windows >= new_knee_time)
+        new_knee_idx = candidates[0, 0] if len(candidates) else n - 1
+        converged = new_knee_idx == knee_idx
+        knee_idx = new_knee_idx
+        knee_point_time = t_windows[knee_idx]
+        knee_val = windows[knee_idx]
+        if converged:
+            break
+
+    return peak_index, peak_index + np.argmin(np.abs(t_squared - knee_point_time)), noise_floor_iter, w
+
+
+def decaying_noise(rng, fs, length, peak, rt60, noise_db):
+    """Exponentially decaying noise starting from a peak on top of a noise floor."""
+    x = rng.standard_normal(length) * 10 ** (noise_db / 20)
+    t = np.arange(length - peak) / fs
+    x[peak:] += rng.standard_normal(length - peak) * 10 ** (-3 * t / rt60)
+    x[peak] = 4.0
+    return x
+
+
+def test_decay_params_match_single_channel_method():
+    fs = 8000
+    rng = np.random.default_rng(0)
+    irs = []
+    for _ in range(40):
+        length = int(rng.integers(fs // 2, 3 * fs))
+        irs.append(decaying_noise(
+            rng, fs, length, int(rng.integers(0, fs // 10)), rng.uniform(0.1, 0.8), rng.uniform(-90, -40)))
+    # Too short for analysis
+    irs.append(rng.standard_normal(5))
+    # Less than one 30 ms window after the peak
+    irs.append(decaying_noise(rng, fs, 200, 10, 0.05, -60))
+    # One window is not enough for the regression
+    irs.append(decaying_noise(rng, fs, 400, 10, 0.05, -60))
+    # Flat response has zero slope
+    irs.append(np.ones(fs))
+    # Silence
+    irs.append(np.zeros(fs))
+
+    lengths = [len(ir) for ir in irs]
+    data = np.zeros((len(irs), max(lengths)))
+    for i, ir in enumerate(irs):
+        data[i, :len(ir)] = ir
+    peak_indices = [int(np.argmax(np.abs(ir))) if len(ir) >= 10 else 0 for ir in irs]
+
+    results = decay.decay_params(data, fs, peak_indices, lengths=lengths)
+    for i, (ir, peak_index) in enumerate(zip(irs, peak_indices)):
+        peak_ind, knee_point_ind, noise_floor, window_size = lundeby(ir, fs, peak_index)
+        assert results[0][i] == peak_ind, i
+        assert results[1][i] == knee_point_ind, i
+        assert results[2][i] == pytest.approx(noise_floor, abs=1e-6), i
+        assert results[3][i] == window_size, i
+        # Zero padding of the other rows doesn't change the result
+        single = decay.decay_params(ir[np.newaxis], fs, [peak_index])
+        assert [int(single[0][0]), int(single[1][0]), int(single[3][0])] == [
+            int(results[0][i]), int(results[1][i]), int(results[3][i])], i
+        assert single[2][0] == pytest.approx(results[2][i], abs=1e-9), i
+
+    # Fallbacks end the decay at the end of the impulse response
+    short, no_window, one_window, flat = range(40, 44)
+    assert (results[1][short], results[2][short]) == (5, -200)
+    assert (results[1][no_window], results[3][no_window]) == (200, 190)
+    assert (results[1][one_window], results[3][one_window]) == (400, 390)
+    assert (results[1][flat], results[3][flat]) == (fs, fs // int(fs / (0.03 * fs)))
+
+
+def test_decay_params_single_channel():
+    fs = 8000
+    ir = decaying_noise(np.random.default_rng(1), fs, 2 * fs, 100, 0.3, -70)
+    batched = decay.decay_params(ir, fs, [100])
+    assert [int(batched[0][0]), int(batched[1][0]), int(batched[3][0])] == [
+        int(v) for v in np.array(lundeby(ir, fs, 100))[[0, 1, 3]]]
+    # Noise floor is about the level of the added noise relative to the peak
+    assert batched[2][0] == pytest.approx(-70 - 20 * np.log10(4.0), abs=3)
+
+
+def test_decay_params_lengths_exceed_samples():
+    with pytest.raises(ValueError):
+        decay.decay_params(np.zeros((1, 10)), 8000, [0], lengths=[11])
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+import pytest
+import soundfile as sf
+from impulse_response_estimator import ImpulseResponseEstimator
+from hrir import HRIR
+
+
+def test_harmonic_windows_with_latency(tmp_path):
+    """Harmonic windows follow the linear impulse response when the recording has latency."""
+    fs = 48000
+    estimator = ImpulseResponseEstimator(min_duration=2.0, fs=fs, silence_length=1.0)
+    # Second order distortion, second harmonic is half of the coefficient which makes THD 0.5 %
+    sequence = estimator.sweep_sequence(['FL', 'FR'], 'stereo')
+    recording = sequence + 0.01 * sequence ** 2
+    # Half a second of recording latency on both tracks
+    latency = fs // 2
+    recording = np.pad(recording, [(0, 0), (latency, 0)])[:, :sequence.shape[1]]
+    file_path = tmp_path / 'FL,FR.wav'
+    sf.write(file_path, recording.T, fs, subtype='FLOAT')
+
+    hrir = HRIR(estimator)
+    hrir.open_recording(str(file_path), ['FL', 'FR'], n_harmonics=4)
+    size = estimator.harmonic_window_size(4)
+    for speaker, side in [('FL', 'left'), ('FR', 'right')]:
+        ir = hrir.irs[speaker][side]
+        assert ir.peak_index() == estimator.zero_lag() + latency
+        # Linear impulse response is a quarter of the window from the start of the first window
+        assert np.argmax(np.abs(ir.harmonics[0])) == size // 4
+        for fc, thd in ir.harmonic_distortion(frequencies=[250, 500, 1000, 2000]):
+            assert 0.4 < thd < 0.6, (speaker, fc, thd)
+
+
+def test_sweep_sequence_duplicate_speakers():
+    estimator = ImpulseResponseEstimator(min_duration=1.0, fs=8000)
+    with pytest.raises(ValueError):
+        estimator.sweep_sequence(['FL', 'FR', 'FL'], 'stereo')
+
+
+def test_from_wav_sequence_layout(tmp_path):
+    """Sequence layout written with the sweep sequence is read back with the estimator."""
+    estimator = ImpulseResponseEstimator(min_duration=1.0, fs=8000, silence_length=0.7)
+    file_path = str(tmp_path / 'sequence.wav')
+    estimator.write_sweep_sequence(file_path, ['FL', 'FR'], 'stereo', sweep_offset=None, repeats=2)
+    opened = ImpulseResponseEstimator.from_wav(file_path)
+    assert len(opened) == len(estimator)
+    assert opened.silence_length == 0.7
+    assert opened.sequence['repeats'] == 2
+    assert opened.sequence['sweep_offset'] is None
+
+
+def test_float32_deconvolution_matches_float64():
+    """Single precision deconvolution of the demo recording stays within the tolerance of double precision."""
+    data_dir = os.path.join(os.path.dirname(__file__), os.pardir, 'data')
+    hrirs = dict()
+    for dtype in ['float64', 'float32']:
+        estimator = ImpulseResponseEstimator.from_wav(
+            os.path.join(data_dir, 'sweep-6.15s-48000Hz-32bit-2.93Hz-24000Hz.wav'))
+        estimator.dtype = dtype
+        hrirs[dtype] = HRIR(estimator)
+        hrirs[dtype].open_recording(os.path.join(data_dir, 'demo', 'FC.wav'), ['FC'])
+    for side in ['left', 'right']:
+        reference = hrirs['float64'].irs['FC'][side]
+        ir = hrirs['float32'].irs['FC'][side]
+        assert ir.data.dtype == np.float32
+        assert ir.peak_index() == reference.peak_index()
+        # Largest sample error relative to the peak and error energy relative to the impulse response energy
+        error = ir.data - reference.data
+        assert np.max(np.abs(error)) / np.max(np.abs(reference.data)) < 1e-6
+        assert 10 * np.log10(np.sum(error ** 2) / np.sum(reference.data ** 2)) < -120
+        # Magnitude responses in the audible band
+        f, reference_magnitude = reference.magnitude_response()
+        _, magnitude = ir.magnitude_response()
+        band = (f >= 20) & (f <= 20000)
+        assert np.max(np.abs(magnitude[band] - reference_magnitude[band])) < 0.01
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from scipy import signal
+import peaks
+from peaks import first_peaks
+
+EPSILON = 1e-20
+
+
+def first_peak(data, start=0, end=None, peak_height=0.12589):
+    """Single channel search for both polarities with find_peaks which the batched search replaced."""
+    if len(data) == 0:
+        return 0
+    if end is None:
+        end = len(data)
+    x = data[start:end].copy()
+    if len(x) == 0:
+        return start
+    max_abs = np.max(np.abs(x))
+    if max_abs < EPSILON:
+        return start
+    x /= max_abs
+    peaks_pos, _ = signal.find_peaks(x, height=peak_height)
+    peaks_neg, _ = signal.find_peaks(x * -1.0, height=peak_height)
+    found = np.concatenate([peaks_pos, peaks_neg])
+    if len(found) == 0:
+        return int(np.argmax(np.abs(x))) + start
+    return int(np.min(found)) + start
+
+
+def impulse_response(rng, n, delay, polarity=1.0):
+    """Band limited direct sound with reflections and noise."""
+    x = rng.standard_normal(n) * 1e-3
+    x[delay] += polarity
+    for _ in range(5):
+        x[int(rng.integers(delay + 10, n))] += rng.uniform(-0.6, 0.6)
+    return signal.sosfilt(signal.butter(4, 0.4, output='sos'), x)
+
+
+def assert_matches(data, start=0, end=None, lengths=None):
+    lengths = [data.shape[1]] * len(data) if lengths is None else lengths
+    expected = [first_peak(row[:length], start=start, end=end) for row, length in zip(data, lengths)]
+    np.testing.assert_array_equal(first_peaks(data, start=start, end=end, lengths=lengths), expected)
+    return expected
+
+
+def test_matches_find_peaks_on_impulse_responses():
+    rng = np.random.default_rng(0)
+    data = np.vstack([
+        impulse_response(rng, 2000, int(rng.integers(1, 1500)), polarity=rng.choice([-1.0, 1.0]))
+        for _ in range(50)])
+    assert_matches(data)
+    assert_matches(data.astype(np.float32))
+
+
+def test_negative_polarity_first_peak():
+    x = np.zeros(100)
+    x[20:23] = [-0.3, -0.5, -0.2]
+    x[40] = 1.0
+    assert assert_matches(x[np.newaxis]) == [21]
+
+
+def test_plateau_peak():
+    x = np.zeros((2, 100))
+    # Odd and even plateau widths resolve to the middle sample like find_peaks
+    x[0, 10:17] = [0.2, 0.6, 0.6, 0.6, 0.4, 0.0, 1.0]
+    x[1, 30:37] = [-0.2, -0.6, -0.6, -0.6, -0.6, -0.1, -1.0]
+    assert assert_matches(x) == [12, 32]
+
+
+def test_search_range():
+    x = np.zeros((2, 200))
+    x[:, 10] = 1.0
+    x[0, 60:63] = [0.2, 0.4, 0.1]
+    x[1, 150] = -0.5
+    # Peaks before the start and after the end are ignored, the threshold is relative to the search range
+    assert assert_matches(x, start=50, end=120) == [61, 50]
+    assert assert_matches(x, start=50) == [61, 150]
+    # Rising values at the end of the range are not a peak
+    assert assert_matches(x, start=0, end=62) == [10, 10]
+    assert assert_matches(x, start=55, end=62) == [61, 55]
+
+
+def test_zero_padded_rows():
+    rng = np.random.default_rng(1)
+    lengths = [300, 120, 61, 0, 5, 200]
+    data = np.zeros((len(lengths), 300))
+    for i, length in enumerate(lengths):
+        data[i, :length] = impulse_response(rng, 300, int(rng.integers(1, 100)))[:length]
+    # Values still rising at the last valid sample would be a peak with the zero padding, without peaks the absolute
+    # maximum is used
+    data[2] = 0.0
+    data[2, 0] = -3.0
+    data[2, 40:61] = np.linspace(0.1, 2.0, 21)
+    expected = assert_matches(data, lengths=lengths)
+    assert first_peak(data[2]) == 60
+    assert expected[2] == 0
+    assert expected[3] == 0
+    assert_matches(data, start=10, end=150, lengths=lengths)
+
+
+def test_fallbacks():
+    x = np.zeros((4, 300))
+    # Crossing at index zero
+    x[0, :3] = [1.0, 0.5, 0.8]
+    # Long rise after the crossing
+    x[1, 10:10 + 2 * peaks.REFINE_LENGTH] = np.linspace(0.2, 1.0, 2 * peaks.REFINE_LENGTH)
+    # No peaks above the threshold, the absolute maximum is used
+    x[2] = np.linspace(0, -1, 300)
+    # Silence
+    assert assert_matches(x) == [2, 10 + 2 * peaks.REFINE_LENGTH - 1, 299, 0]
+    assert assert_matches(x, start=5) == [5, 10 + 2 * peaks.REFINE_LENGTH - 1, 299, 5]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_find_peaks_on_sparse_spikes(seed):
+    rng = np.random.default_rng(seed)
+    data = np.where(rng.random((100, 400)) < 0.02, rng.uniform(-1, 1, (100, 400)), 0.0)
+    # Runs of equal values make plateaus
+    data = np.repeat(data[:, ::2], 2, axis=1)
+    lengths = rng.integers(0, 401, 100)
+    assert_matches(data * (np.arange(400) < lengths[:, np.newaxis]), lengths=lengths)
+    assert_matches(data, start=int(rng.integers(0, 100)), end=int(rng.integers(100, 400)))
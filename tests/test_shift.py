@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import pickle
+import numpy as np
+import pytest
+from shift import shift, shift_channels
+from impulse_response_estimator import ImpulseResponseEstimator
+from impulse_response import ImpulseResponse
+from hrir import HRIR
+
+# Whole, negative, fractional and negative fractional delays
+DELAYS = [[0, 3, -5, 600], [0.3, -0.45, 2.7, -7.25]]
+
+
+@pytest.mark.parametrize('method', ['sinc', 'thiran'])
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+@pytest.mark.parametrize('m', [500, 480, 520])
+def test_shift_channels_matches_shift(method, dtype, m):
+    x = np.random.default_rng(0).standard_normal((2, 4, 500)).astype(dtype)
+    out = np.empty(x.shape[:-1] + (m,), dtype=dtype)
+    shift_channels(x, DELAYS, out=out, method=method)
+    for i in range(2):
+        for j in range(4):
+            expected = shift(x[i, j], DELAYS[i][j], out=np.empty(m, dtype=dtype), method=method)
+            np.testing.assert_array_equal(out[i, j], expected)
+
+
+@pytest.mark.parametrize('method', ['sinc', 'thiran'])
+def test_shift_channels_in_place(method):
+    x = np.random.default_rng(0).standard_normal((2, 4, 500))
+    expected = shift_channels(x, DELAYS, method=method)
+    data = x.copy()
+    assert shift_channels(data, DELAYS, out=data, method=method) is data
+    np.testing.assert_array_equal(data, expected)
+
+
+def test_shift_channels_broadcasts_data():
+    x = np.random.default_rng(0).standard_normal((2, 500))
+    delays = [[1, 2], [-3, 0.5], [10, 20]]
+    out = np.empty((3, 2, 520))
+    shift_channels(x, delays, out=out)
+    for i in range(3):
+        for j in range(2):
+            np.testing.assert_array_equal(out[i, j], shift(x[j], delays[i][j], out=np.empty(520)))
+
+
+def test_hrir_shift_keeps_lengths():
+    fs = 8000
+    hrir = HRIR(ImpulseResponseEstimator(min_duration=1.0, fs=fs))
+    rng = np.random.default_rng(0)
+    lengths = {('FL', 'left'): 300, ('FL', 'right'): 300, ('FR', 'left'): 250, ('FR', 'right'): 250}
+    for (speaker, side), length in lengths.items():
+        hrir.irs.setdefault(speaker, dict())[side] = ImpulseResponse(rng.standard_normal(length), fs)
+    delays = {('FL', 'left'): 2.5, ('FR', 'left'): 7, ('FR', 'right'): -3.3}
+    expected = {key: shift(hrir.irs[key[0]][key[1]].data, delays.get(key, 0)) for key in lengths}
+
+    for _ in range(2):
+        hrir.shift(delays)
+        # Shifted impulse responses are views into the array
+        data = hrir.data
+        assert hrir.is_consolidated()
+        for key, length in lengths.items():
+            np.testing.assert_allclose(hrir.irs[key[0]][key[1]].data, expected[key], atol=1e-12)
+        np.testing.assert_array_equal(hrir.data[hrir.index['FR'], :, 250:], 0.0)
+        expected = {key: shift(expected[key], delays.get(key, 0)) for key in lengths}
+    hrir.shift(delays)
+    assert hrir.data is data
+
+    for other in [hrir.copy(), pickle.loads(pickle.dumps(hrir))]:
+        assert other.is_consolidated()
+        for (speaker, side), length in lengths.items():
+            assert len(other.irs[speaker][side]) == length
+            np.testing.assert_array_equal(other.irs[speaker][side].data, hrir.irs[speaker][side].data)
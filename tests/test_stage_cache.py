@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import os
+from stage_cache import StageCache
+from artifacts import ArtifactManifest, write_artifact
+
+
+def run_stages(stages, calls, dir_path, a, b, c):
+    """Chain of three stages like in `impulcifer.main()`, counts the computed stages and writes a plot in the first."""
+    def first():
+        calls.append('first')
+        write_artifact(os.path.join(dir_path, 'plots', 'first.png'), b'plot')
+        return a
+
+    def second(value):
+        calls.append('second')
+        return value + b
+
+    def third(value):
+        calls.append('third')
+        return value * c
+
+    first_key = stages.key(a=a)
+    value = stages.run('first', first_key, first)
+    second_key = stages.key(first_key, b=b)
+    value = stages.run('second', second_key, lambda: second(value))
+    third_key = stages.key(second_key, c=c)
+    return stages.run('third', third_key, lambda: third(value))
+
+
+def test_changed_parameter_recomputes_downstream_stages(tmp_path):
+    os.makedirs(tmp_path / 'plots')
+    stages = StageCache(str(tmp_path / '.cache' / 'stages'))
+    calls = []
+    assert run_stages(stages, calls, tmp_path, 1, 2, 3) == 9
+    assert calls == ['first', 'second', 'third']
+
+    # Nothing changed
+    calls.clear()
+    assert run_stages(stages, calls, tmp_path, 1, 2, 3) == 9
+    assert calls == []
+
+    # Last stage only
+    calls.clear()
+    assert run_stages(stages, calls, tmp_path, 1, 2, 4) == 12
+    assert calls == ['third']
+
+    # Middle stage and everything after it
+    calls.clear()
+    assert run_stages(stages, calls, tmp_path, 1, 3, 4) == 16
+    assert calls == ['second', 'third']
+
+    # First stage changes all
+    calls.clear()
+    assert run_stages(stages, calls, tmp_path, 2, 3, 4) == 20
+    assert calls == ['first', 'second', 'third']
+
+
+def test_missing_output_recomputes_stage(tmp_path):
+    os.makedirs(tmp_path / 'plots')
+    stages = StageCache(str(tmp_path / '.cache' / 'stages'))
+    calls = []
+    with ArtifactManifest(tmp_path):
+        run_stages(stages, calls, tmp_path, 1, 2, 3)
+    os.remove(tmp_path / 'plots' / 'first.png')
+
+    # Deleted plot is written again, stages after it have the same keys and are not computed
+    calls.clear()
+    with ArtifactManifest(tmp_path):
+        assert run_stages(stages, calls, tmp_path, 1, 2, 3) == 9
+    assert calls == ['first']
+    assert os.path.isfile(tmp_path / 'plots' / 'first.png')
+
+
+def test_disabled_cache_computes_every_stage(tmp_path):
+    os.makedirs(tmp_path / 'plots')
+    stages = StageCache(str(tmp_path / '.cache' / 'stages'), enabled=False)
+    calls = []
+    run_stages(stages, calls, tmp_path, 1, 2, 3)
+    run_stages(stages, calls, tmp_path, 1, 2, 3)
+    assert calls == ['first', 'second', 'third'] * 2
+    assert not os.path.exists(tmp_path / '.cache')
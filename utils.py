@@ -1,19 +1,23 @@
 # -*- coding: utf-8 -*-
 
 import os
+import io
 import numpy as np
 import soundfile as sf
 from scipy.fftpack import fft
+from scipy.fft import rfft, irfft, next_fast_len
 from PIL import Image
 import matplotlib.ticker as ticker
+from artifacts import write_artifact
 
 
-def read_wav(file_path, expand=False):
+def read_wav(file_path, expand=False, dtype='float64'):
     """Reads WAV file
 
     Args:
         file_path: Path to WAV file as string
         expand: Expand dimensions of a single track recording to produce 2-D array?
+        dtype: Data type of the returned samples, "float64" or "float32"
 
     Returns:
         - sampling frequency as integer
@@ -21,7 +25,7 @@ def read_wav(file_path, expand=False):
     """
     if not os.path.isfile(file_path):
         raise FileNotFoundError(f'File in path "{os.path.abspath(file_path)}" does not exist.')
-    data, fs = sf.read(file_path)
+    data, fs = sf.read(file_path, dtype=dtype)
     if len(data.shape) > 1:
         # Soundfile has tracks on columns, we want them on rows
         data = np.transpose(data)
@@ -30,20 +34,151 @@ def read_wav(file_path, expand=False):
     return fs, data
 
 
-def write_wav(file_path, fs, data, bit_depth=32):
-    """Writes WAV file."""
+def read_wav_ranges(file_path, ranges, dtype='float64', mmap=False):
+    """Reads frame ranges of a WAV file without reading the rest of the file.
+
+    Args:
+        file_path: Path to WAV file as string
+        ranges: Sequence of (start, end) frame indices. Ranges past the end of the file are cut short.
+        dtype: Data type of the returned samples, "float64" or "float32"
+        mmap: Read through a memory mapped view of the data chunk when the file is plain 16 or 32 bit PCM or float WAV.
+              Other formats are read by seeking.
+
+    Returns:
+        - sampling frequency as integer
+        - list of 2-D arrays with tracks on rows, one array for each range
+    """
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(f'File in path "{os.path.abspath(file_path)}" does not exist.')
+    mapped = wav_memmap(file_path) if mmap else None
+    if mapped is not None:
+        fs, data, scale = mapped
+        parts = []
+        for start, end in ranges:
+            # Integer samples are scaled to [-1, 1) the same way as soundfile does
+            part = np.transpose(data[start:end]).astype(dtype)
+            if scale != 1:
+                part *= 1 / scale
+            parts.append(part)
+        return fs, parts
+    parts = []
+    with sf.SoundFile(file_path) as f:
+        for start, end in ranges:
+            start = min(start, f.frames)
+            f.seek(start)
+            # Soundfile has tracks on columns, we want them on rows
+            parts.append(np.transpose(f.read(frames=max(min(end, f.frames) - start, 0), dtype=dtype, always_2d=True)))
+        return f.samplerate, parts
+
+
+def wav_memmap(file_path):
+    """Memory maps the sample data of a plain PCM or float WAV file.
+
+    Only 16 and 32 bit integer and 32 and 64 bit float samples can be mapped directly.
+
+    Args:
+        file_path: Path to WAV file as string
+
+    Returns:
+        Tuple of sampling rate, read-only memory mapped array of shape (frames, tracks) and the integer scale of the
+        samples. None if the file can't be mapped.
+    """
+    formats = {(1, 16): ('<i2', 2 ** 15), (1, 32): ('<i4', 2 ** 31), (3, 32): ('<f4', 1), (3, 64): ('<f8', 1)}
+    file_size = os.path.getsize(file_path)
+    fmt = None
+    with open(file_path, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            return None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, chunk_size = chunk[:4], int.from_bytes(chunk[4:8], 'little')
+            if chunk_id == b'fmt ':
+                fmt = f.read(chunk_size)
+                audio_format = int.from_bytes(fmt[0:2], 'little')
+                if audio_format == 0xFFFE and len(fmt) >= 26:
+                    # WAVE_FORMAT_EXTENSIBLE, actual format is in the beginning of the sub-format GUID
+                    audio_format = int.from_bytes(fmt[24:26], 'little')
+                channels = int.from_bytes(fmt[2:4], 'little')
+                fs = int.from_bytes(fmt[4:8], 'little')
+                bits = int.from_bytes(fmt[14:16], 'little')
+                if (audio_format, bits) not in formats:
+                    return None
+                if chunk_size % 2:
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    return None
+                offset = f.tell()
+                # Data chunk size can be wrong in files written by recorders which were interrupted
+                n_bytes = min(chunk_size, file_size - offset)
+                sample_type, scale = formats[(audio_format, bits)]
+                frames = n_bytes // (channels * np.dtype(sample_type).itemsize)
+                if frames == 0:
+                    return None
+                data = np.memmap(file_path, dtype=sample_type, mode='r', offset=offset, shape=(frames, channels))
+                return fs, data, scale
+            else:
+                # Chunks are padded to even size
+                f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+
+def wav_subtype(bit_depth):
+    """Soundfile subtype for the bit depth of a WAV file."""
     if bit_depth == 16:
-        subtype = "PCM_16"
+        return "PCM_16"
     elif bit_depth == 24:
-        subtype = "PCM_24"
+        return "PCM_24"
     elif bit_depth == 32:
-        subtype = "PCM_32"
+        return "PCM_32"
     else:
         raise ValueError('Invalid bit depth. Accepted values are 16, 24 and 32.')
+
+
+def write_wav(file_path, fs, data, bit_depth=32, metadata=None):
+    """Writes WAV file.
+
+    Args:
+        file_path: Path to WAV file as string
+        fs: Sampling rate
+        data: Audio data, tracks can be on rows or columns
+        bit_depth: Number of bits per sample. 16, 24 or 32
+        metadata: Dict of string metadata fields supported by soundfile, such as "comment"
+
+    Returns:
+        None
+    """
+    subtype = wav_subtype(bit_depth)
     if len(data.shape) > 1 and data.shape[1] > data.shape[0]:
         # We have tracks on rows, soundfile want's them on columns
         data = np.transpose(data)
-    sf.write(file_path, data, samplerate=fs, subtype=subtype)
+    channels = data.shape[1] if len(data.shape) > 1 else 1
+    # Encoded in memory and written as a whole, see `artifacts.write_artifact()`
+    buffer = io.BytesIO()
+    with sf.SoundFile(buffer, mode='w', samplerate=fs, channels=channels, subtype=subtype, format='WAV') as f:
+        for key, value in (metadata or dict()).items():
+            setattr(f, key, value)
+        f.write(data)
+    write_artifact(file_path, buffer.getvalue())
+
+
+def read_wav_metadata(file_path):
+    """Reads string metadata fields of a WAV file without reading the audio data.
+
+    Args:
+        file_path: Path to WAV file as string
+
+    Returns:
+        - Dict of metadata fields
+        - Sampling rate
+        - Number of samples per track
+    """
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(f'File in path "{os.path.abspath(file_path)}" does not exist.')
+    with sf.SoundFile(file_path) as f:
+        return f.copy_metadata(), f.samplerate, f.frames
 
 
 def magnitude_response(x, fs):
@@ -171,8 +306,14 @@ def optimize_png_size(file_path, n_colors=60):
 
 def save_fig_as_png(file_path, fig, n_colors=60):
     """Saves figure and optimizes file size."""
-    fig.savefig(file_path, bbox_inches='tight')
-    optimize_png_size(file_path, n_colors=n_colors)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight')
+    buffer.seek(0)
+    im = Image.open(buffer)
+    im = im.convert('P', palette=Image.ADAPTIVE, colors=n_colors)
+    buffer = io.BytesIO()
+    im.save(buffer, format='png', optimize=True)
+    write_artifact(file_path, buffer.getvalue())
 
 
 def config_fr_axis(ax):
@@ -189,3 +330,84 @@ def config_fr_axis(ax):
 def running_mean(x, N):
     cumsum = np.cumsum(np.insert(x, 0, 0))
     return (cumsum[N:] - cumsum[:-N]) / float(N)
+
+
+def align_takes(takes, max_lag=None):
+    """Aligns repeated takes of the same recording with sub-sample accuracy.
+
+    Delay of each take relative to the first take is found from the peak of the cross-correlation of the takes,
+    summed over all tracks, and refined to sub-sample accuracy by fitting a line to the phase of the cross-spectrum.
+    Takes are then shifted by the fractional delay with a linear phase shift in frequency domain. All takes are
+    processed in one pass.
+
+    Args:
+        takes: Takes as Numpy array of shape (..., n_takes, n_tracks, n_samples). Leading axes are processed as
+               independent groups of takes.
+        max_lag: Maximum absolute delay in samples to look for. Half of the take length by default.
+
+    Returns:
+        - Aligned takes with the same shape as the input
+        - Delays of the takes in samples with shape (..., n_takes)
+    """
+    takes = np.asarray(takes)
+    n = takes.shape[-1]
+    if max_lag is None:
+        max_lag = n // 2
+    max_lag = int(min(max_lag, n - 1))
+    # Zero padding so that circular correlation and circular shift don't wrap within the maximum lag
+    n_fft = next_fast_len(n + max_lag + 1)
+    spectra = rfft(takes, n=n_fft, axis=-1)
+    f = np.arange(spectra.shape[-1]) / n_fft
+    # Cross-spectrum with the reference take, summed over tracks
+    cross_spectrum = np.sum(spectra * np.conj(spectra[..., :1, :, :]), axis=-2)
+    xcorr = irfft(cross_spectrum, n=n_fft, axis=-1)
+    # Integer lag from lags -max_lag to max_lag
+    xcorr = np.concatenate([xcorr[..., n_fft - max_lag:], xcorr[..., :max_lag + 1]], axis=-1)
+    lags = (np.argmax(xcorr, axis=-1) - max_lag).astype(float)
+    # Remaining fractional delay from magnitude weighted least squares fit of the phase slope
+    residual = cross_spectrum * np.exp(2j * np.pi * f * lags[..., None])
+    weights = np.abs(residual)
+    numerator = np.sum(weights * f * np.angle(residual), axis=-1)
+    denominator = 2 * np.pi * np.sum(weights * f ** 2, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lags -= np.where(denominator > 0, numerator / denominator, 0.0)
+    # Shift each take back by its delay
+    phase = np.exp(2j * np.pi * f * lags[..., None, None])
+    aligned = irfft(spectra * phase, n=n_fft, axis=-1)[..., :n].astype(takes.dtype, copy=False)
+    return aligned, lags
+
+
+def average_takes(takes, block_size=4096, threshold=4.0):
+    """Averages repeated takes and rejects blocks which contain transients.
+
+    Takes are compared block by block to their sample wise median. Block of a take is left out of the average when
+    its residual energy exceeds `threshold` times the median residual energy of all takes in that block. This drops
+    noise bursts, like a door slam during one take, without discarding the rest of that take. Rejection needs at
+    least three takes to tell which take is the odd one.
+
+    Args:
+        takes: Aligned takes as Numpy array of shape (..., n_takes, n_tracks, n_samples)
+        block_size: Block length in samples for outlier detection
+        threshold: Rejection threshold as ratio of residual energies
+
+    Returns:
+        - Average of the takes with shape (..., n_tracks, n_samples)
+        - Boolean rejection mask of shape (..., n_takes, n_blocks)
+    """
+    takes = np.asarray(takes)
+    n_takes, n = takes.shape[-3], takes.shape[-1]
+    n_blocks = int(np.ceil(n / block_size))
+    pad = [(0, 0)] * (takes.ndim - 1) + [(0, n_blocks * block_size - n)]
+    blocks = np.pad(takes, pad).reshape(takes.shape[:-1] + (n_blocks, block_size))
+    if n_takes < 3:
+        rejected = np.zeros(takes.shape[:-2] + (n_blocks,), dtype=bool)
+        return np.mean(takes, axis=-3, dtype=takes.dtype), rejected
+    # Residual energy of each take in each block, summed over tracks
+    residual = np.sum((blocks - np.median(blocks, axis=-4, keepdims=True)) ** 2, axis=(-3, -1))
+    reference = np.median(residual, axis=-2, keepdims=True)
+    rejected = residual > threshold * reference + np.finfo(float).tiny
+    weights = (~rejected).astype(takes.dtype)
+    # Masked mean over takes, block weights expanded to tracks and samples
+    average = np.sum(blocks * weights[..., None, :, None], axis=-4) / np.sum(weights, axis=-2)[..., None, :, None]
+    average = average.reshape(average.shape[:-2] + (n_blocks * block_size,))[..., :n]
+    return average, rejected
@@ -2,6 +2,7 @@
 import numpy as np
 from scipy import signal
 from typing import Dict
+from shift import shift_channels
 
 
 def _duplicate_sos(sos: np.ndarray, times: int) -> np.ndarray:
@@ -68,37 +69,6 @@ def _rbj_high_shelf(fc: float, fs: int, gain_db: float, Q: float) -> np.ndarray:
     return sos
 
 
-def _shift(sig: np.ndarray, delay: int, length: int) -> np.ndarray:
-    """
-    Circularly shift (delay or advance) 1D array 'sig' to length 'length',
-    padding or truncating so the output is exactly 'length' samples.
-
-    - sig: input array (1D)
-    - delay: integer number of samples to delay (+) or advance (–)
-    - length: desired length of output array
-
-    Returns:
-        1D array of length 'length'.  If delay > 0, the signal is
-        shifted right by 'delay' samples (zero‐padding at front);
-        if delay < 0, the signal is shifted left (zero‐padding at end).
-    """
-    out = np.zeros(length, dtype=sig.dtype)
-    if delay >= 0:
-        # Delay (pad with zeros at front, then truncate if sig is too long)
-        if delay < length:
-            # Copy as much of sig as fits
-            avail = min(length - delay, len(sig))
-            out[delay : delay + avail] = sig[:avail]
-    else:
-        # Advance: shift signal left by |delay|
-        adv = -delay  # positive number of samples to advance
-        if adv < len(sig):
-            avail = min(length, len(sig) - adv)
-            out[:avail] = sig[adv : adv + avail]
-        # else if adv ≥ len(sig), everything is shifted off → remains zeros
-    return out
-
-
 def synthesize_virtual_bass(hrir, *, xo_hz: int = 250, head_ms: float = 1.0,
                             hp_fc: float = 15.0, invert_polarity: bool = False) -> None:
     """Mutate *hrir* in‑place, injecting virtual‑bass split/merge."""
@@ -154,31 +124,35 @@ def synthesize_virtual_bass(hrir, *, xo_hz: int = 250, head_ms: float = 1.0,
     speaker_gain: Dict[str, float] = {}
     head_samples = int(round(head_ms * 1e-3 * fs))
 
-    # 4) Process each speaker
-    for spk, pair in hrir.irs.items():
-        spk_on_left = spk.upper().endswith("L")
-        left_peak, right_peak = pair["left"].peak_index(), pair["right"].peak_index()
-        itd_samples = right_peak - left_peak
+    # Determine polarity based on the invert_polarity flag.
+    # +1.0 for normal polarity, -1.0 for inverted.
+    pol = -1.0 if invert_polarity else 1.0
 
-        gain = g_global
+    # 4a) Create scaled and shaped synth IRs, these are the same for every speaker
+    # First, scale the primary mpbass. This is the direct signal.
+    synth_direct_undelayed = mpbass * g_global * pol
 
-    # Determine polarity based on the invert_polarity flag.
-        # +1.0 for normal polarity, -1.0 for inverted.
-        pol = -1.0 if invert_polarity else 1.0
-
-        # 4c) Create scaled and shaped synth IRs (NEW, CORRECTED LOGIC)
-        # First, scale the primary mpbass. This is the direct signal.
-        synth_direct_undelayed = mpbass * gain * pol
-        
-        # Second, create the cross signal by applying ILD shelves to the *already scaled* direct signal.
-        # This preserves the ILD shape relative to the correctly matched direct signal.
-        synth_cross_undelayed = signal.sosfilt(sos_ild, synth_direct_undelayed)
-
-        # 4d) Apply delays to the synthesized signals
+    # Second, create the cross signal by applying ILD shelves to the *already scaled* direct signal.
+    # This preserves the ILD shape relative to the correctly matched direct signal.
+    synth_cross_undelayed = signal.sosfilt(sos_ild, synth_direct_undelayed)
+
+    # 4b) Delays of the synthesized signals of every speaker, peaks of all the impulse responses are found at once
+    peak_indices = hrir.peak_indices()
+    delays = []
+    for spk in hrir.irs:
+        spk_on_left = spk.upper().endswith("L")
+        itd_samples = peak_indices[(spk, "right")] - peak_indices[(spk, "left")]
         direct_delay = head_samples
         cross_delay = head_samples + (itd_samples if spk_on_left else -itd_samples)
-        synth_direct = _shift(synth_direct_undelayed, direct_delay, n_ir)
-        synth_cross  = _shift(synth_cross_undelayed,  cross_delay,  n_ir)
+        delays.append([direct_delay, cross_delay])
+
+    # 4c) Shift the direct and cross signals into the rows of every speaker with one call
+    synth = np.empty((len(hrir.irs), 2, n_ir), synth_direct_undelayed.dtype)
+    shift_channels(np.stack([synth_direct_undelayed, synth_cross_undelayed]), delays, out=synth)
+
+    # 4d) Process each speaker
+    for (spk, pair), (synth_direct, synth_cross) in zip(hrir.irs.items(), synth):
+        spk_on_left = spk.upper().endswith("L")
 
         # 4e) High-pass the original signals and sum them with the new synthetic signals
         orig_left  = pair["left"].data
@@ -189,8 +163,9 @@ def synthesize_virtual_bass(hrir, *, xo_hz: int = 250, head_ms: float = 1.0,
         new_left  = hi_left  + (synth_direct if spk_on_left else synth_cross)
         new_right = hi_right + (synth_cross  if spk_on_left else synth_direct)
 
-        pair["left"].data  = new_left[:len(orig_left)]
-        pair["right"].data = new_right[:len(orig_right)]
+        # IIR filtering runs in double precision, keep the data type of the impulse responses
+        pair["left"].data  = new_left[:len(orig_left)].astype(orig_left.dtype, copy=False)
+        pair["right"].data = new_right[:len(orig_right)].astype(orig_right.dtype, copy=False)
 
     # Done – *hrir* mutates in‑place
     return None